@@ -0,0 +1,84 @@
+import copy
+import threading
+from chess_model import AIMode
+from move import Move
+from search import SearchResult
+from typing import Callable, Optional
+
+
+class AIWorker:
+    """
+    Works out the move ai() would make on a thread, from a copy of the model, so a GUI's event loop keeps running
+    while the engine thinks. The copy shares the model's engine and book, so the transposition table still carries
+    over from one move to the next; the model itself is never touched, and the caller makes the move.
+
+    Both callbacks are called on the worker thread. on_progress gets the SearchResult of each completed iteration of
+    a search; on_done gets the Zobrist hash of the position that was searched and the chosen move (None if there was
+    none), so a caller can tell whether the move still fits its board. A cancelled job never reaches on_done.
+    """
+
+    def __init__(self, on_done: Callable[[int, Optional[Move]], None],
+                 on_progress: Optional[Callable[[SearchResult], None]] = None):
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.__thread: Optional[threading.Thread] = None
+        self.__cancelled: Optional[threading.Event] = None
+        self.__engine = None
+
+    @property
+    def busy(self) -> bool:
+        """
+        Whether a job is running and has not been cancelled.
+        """
+        return self.__thread is not None and self.__thread.is_alive() and not self.__cancelled.is_set()
+
+    def start(self, model, mode: AIMode = AIMode.Heuristic, depth: Optional[int] = None,
+              movetime: Optional[float] = None, nodes: Optional[int] = None):
+        """
+        Starts working out a move for model's current position, with the same arguments as ai(). A job still
+        winding down after cancel() is waited for first, as it may be using the same engine.
+        :raises RuntimeError: if a job is already running.
+        """
+        if self.busy:
+            raise RuntimeError('the AI is already thinking')
+        self.wait()
+        snapshot = copy.deepcopy(model)
+        snapshot.engine = model.engine
+        snapshot.book = model.book
+        cancelled = threading.Event()
+        self.__cancelled = cancelled
+        self.__engine = model.engine
+        # cleared here rather than on the thread, so a cancel() straight after this still reaches the search
+        self.__engine.clear_stop()
+
+        def progress(result: SearchResult):
+            if self.on_progress is not None and not cancelled.is_set():
+                self.on_progress(result)
+
+        def run():
+            if cancelled.is_set():
+                return
+            move = snapshot.choose_move(mode, depth, movetime, nodes, progress)
+            if not cancelled.is_set():
+                self.on_done(snapshot.zobrist_hash, move)
+
+        self.__thread = threading.Thread(target=run, daemon=True)
+        self.__thread.start()
+
+    def cancel(self):
+        """
+        Drops the running job. A search stops within a few hundred nodes; the heuristic runs to the end, but its
+        move is thrown away.
+        """
+        if self.__cancelled is None:
+            return
+        self.__cancelled.set()
+        self.__engine.stop()
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        Blocks until the running job has finished.
+        """
+        thread = self.__thread
+        if thread is not None:
+            thread.join(timeout)
@@ -1,10 +1,13 @@
-from chess_piece import ChessPiece
+from chess_piece import ChessPiece, BISHOP, DIAGONAL
 from player import Player
 from move import Move
-from typing import List
+from typing import Iterator, List, Tuple
 
 
 class Bishop(ChessPiece):
+    __slots__ = ()
+    kind = BISHOP
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -14,6 +17,9 @@ class Bishop(ChessPiece):
     def type(self):
         return 'Bishop'
 
+    def targets(self, row: int, col: int, board: List[List['ChessPiece']]) -> Iterator[Tuple[int, int]]:
+        return self._slide(row, col, board, DIAGONAL)
+
     def is_valid_move(self, move: Move, board: List[List['ChessPiece']]) -> bool:
         if not super().is_valid_move(move, board):
             return False
@@ -0,0 +1,453 @@
+import functools
+from chess_model import ALL_SQUARES, ChessModel, MoveRecord, MoveValidity, UndoException, CASTLES, CASTLING_MASK, \
+    PROMOTION_PIECES, _Board, _BoardRow, castling_from_board, promotion_fits
+from chess_piece import ChessPiece, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, ORTHOGONAL, DIAGONAL, KNIGHT_OFFSETS, \
+    KING_OFFSETS
+from player import Player
+from move import Move
+from zobrist import BLACK_TO_MOVE, CASTLING_KEYS, PIECE_KEYS
+from evaluation import SQUARE_SCORES
+from typing import Iterator, List, Optional, Tuple
+
+# Squares are numbered row * 8 + col, so bit 0 is the top left corner (row 0, col 0) and bit 63 the bottom right.
+# Each side's bitboards are indexed by piece kind (PAWN to KING, numbered from 1).
+
+
+def _step_table(offsets) -> List[int]:
+    # for every square, the bitboard of squares one offset away
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bits = 0
+        for d_row, d_col in offsets:
+            r, c = row + d_row, col + d_col
+            if 0 <= r < 8 and 0 <= c < 8:
+                bits |= 1 << (r * 8 + c)
+        table.append(bits)
+    return table
+
+
+def _ray_table(d_row: int, d_col: int) -> List[int]:
+    # for every square, the bitboard of squares along one direction up to the edge of the board
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bits = 0
+        r, c = row + d_row, col + d_col
+        while 0 <= r < 8 and 0 <= c < 8:
+            bits |= 1 << (r * 8 + c)
+            r += d_row
+            c += d_col
+        table.append(bits)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _step_table(KING_OFFSETS)
+# squares a pawn of each colour attacks from a given square
+PAWN_ATTACKS = {Player.WHITE: _step_table(((-1, -1), (-1, 1))), Player.BLACK: _step_table(((1, -1), (1, 1)))}
+# (ray table, whether the ray runs towards higher square numbers) for each sliding direction
+ORTHOGONAL_RAYS = [(_ray_table(d_row, d_col), d_row * 8 + d_col > 0) for d_row, d_col in ORTHOGONAL]
+DIAGONAL_RAYS = [(_ray_table(d_row, d_col), d_row * 8 + d_col > 0) for d_row, d_col in DIAGONAL]
+
+
+def slider_attacks(sq: int, occupied: int, rays) -> int:
+    """
+    Returns the squares a sliding piece on sq attacks along the given rays, stopping at (and including) the first
+    occupied square on each ray.
+    :param sq: int the square the slider stands on.
+    :param occupied: int bitboard of every occupied square.
+    :param rays: ORTHOGONAL_RAYS or DIAGONAL_RAYS.
+    :return: int bitboard of attacked squares.
+    """
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            # the nearest blocker is the lowest bit on rays that count up and the highest bit on rays that count down
+            first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+
+def nearest(bits: int, positive: bool) -> int:
+    # the set bit closest to the start of a ray: the lowest on rays that count up, the highest on rays that count down
+    return (bits & -bits).bit_length() - 1 if positive else bits.bit_length() - 1
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    # yields the square numbers of the set bits, lowest first
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitboardChessModel(ChessModel):
+    """
+    A ChessModel that keeps the position in 64-bit bitboards (one per side and piece kind) next to a 64-entry array
+    of pieces, and answers attack and move-generation questions with precomputed tables instead of walking lists.
+    It has the same public API, so it can be dropped in anywhere a ChessModel is used.
+    """
+
+    @property
+    def board(self):
+        # a fresh copy of the squares, but one that can be written to like the list model's board: writing a square
+        # (or a row) goes through to the bitboards
+        squares = self.__squares
+        return _Board(_BoardRow(squares[row * 8:row * 8 + 8], functools.partial(self.__write, row * 8))
+                      for row in range(8))
+
+    def _rows(self) -> List[List[ChessPiece]]:
+        # this model has no rows of its own to hand out, so reading them means copying them, the same as board does
+        return self.board
+
+    @board.setter
+    def board(self, new_board: List[List[ChessPiece]]):
+        self.__squares = [None] * 64
+        self.__pieces = {Player.WHITE: [0] * (KING + 1), Player.BLACK: [0] * (KING + 1)}
+        self.__occupied = {Player.WHITE: 0, Player.BLACK: 0}
+        self._reset_rules(new_board)
+        self._zobrist_hash = BLACK_TO_MOVE if self.current_player == Player.BLACK else 0
+        self._zobrist_hash ^= CASTLING_KEYS[self._castling]
+        self._evaluation = 0
+        for row in range(8):
+            for col in range(8):
+                piece = new_board[row][col]
+                if piece is not None:
+                    self.__add(row * 8 + col, piece)
+
+    def __add(self, sq: int, piece: ChessPiece):
+        bit = 1 << sq
+        self.__squares[sq] = piece
+        self.__pieces[piece.player][piece.kind] |= bit
+        self.__occupied[piece.player] |= bit
+        self._zobrist_hash ^= PIECE_KEYS[piece.code][sq]
+        self._evaluation += SQUARE_SCORES[piece.code][sq]
+
+    def __remove(self, sq: int) -> Optional[ChessPiece]:
+        piece = self.__squares[sq]
+        if piece is not None:
+            mask = ~(1 << sq)
+            self.__squares[sq] = None
+            self.__pieces[piece.player][piece.kind] &= mask
+            self.__occupied[piece.player] &= mask
+            self._zobrist_hash ^= PIECE_KEYS[piece.code][sq]
+            self._evaluation -= SQUARE_SCORES[piece.code][sq]
+        return piece
+
+    def piece_at(self, row: int, col: int):
+        if 0 <= row < 8 and 0 <= col < 8:
+            return self.__squares[row * 8 + col]
+        return None
+
+    def set_piece(self, row: int, col: int, piece: ChessPiece):
+        if row < 0 or row >= 8:
+            raise ValueError
+        elif col < 0 or col >= 8:
+            raise ValueError
+        elif not isinstance(piece, ChessPiece):
+            raise TypeError
+        else:
+            self.__write(row * 8, col, piece)
+
+    def __write(self, row_start: int, col: int, piece: Optional[ChessPiece]):
+        # set_piece() and writes to a board square; None empties the square
+        if piece is not None and not isinstance(piece, ChessPiece):
+            raise TypeError
+        self.__remove(row_start + col)
+        if piece is not None:
+            self.__add(row_start + col, piece)
+        self._set_rules(self._castling & castling_from_board(self.board), None)
+
+    def move(self, move: Move):
+        from_sq = move.from_row * 8 + move.from_col
+        to_sq = move.to_row * 8 + move.to_col
+        player = self.current_player
+        old_hash = self._zobrist_hash
+        old_evaluation = self._evaluation
+        old_castling = self._castling
+        old_en_passant = self._en_passant
+        old_halfmove = self._halfmove_clock
+
+        piece = self.__remove(from_sq)
+        kind = piece.kind
+        if kind == PAWN and to_sq == old_en_passant and self.__squares[to_sq] is None:
+            # en passant: the pawn taken stands beside the one taking it
+            captured = self.__remove(move.from_row * 8 + move.to_col)
+        else:
+            captured = self.__remove(to_sq)
+
+        # pawn promotion
+        en_passant = None
+        if kind == PAWN and move.to_row == (0 if piece.player == Player.WHITE else 7):
+            self.__add(to_sq, PROMOTION_PIECES[move.promotion or QUEEN](piece.player))
+        else:
+            self.__add(to_sq, piece)
+            if kind == PAWN and abs(to_sq - from_sq) == 16:
+                # only kept when an enemy pawn stands where the moving pawn's capture from the skipped square would go
+                skipped = (from_sq + to_sq) // 2
+                enemy = Player.BLACK if player == Player.WHITE else Player.WHITE
+                if PAWN_ATTACKS[player][skipped] & self.__pieces[enemy][PAWN]:
+                    en_passant = skipped
+            elif kind == KING and abs(to_sq - from_sq) == 2:
+                # castling: the rook jumps over the king
+                row = move.to_row * 8
+                rook_from, rook_to = (row + 7, row + 5) if move.to_col == 6 else (row, row + 3)
+                self.__add(rook_to, self.__remove(rook_from))
+
+        self._set_rules(old_castling & CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq], en_passant)
+        self._halfmove_clock = 0 if kind == PAWN or captured is not None else old_halfmove + 1
+        self.set_next_player()
+
+        self.move_history.append(MoveRecord(move, piece, captured, player, old_hash, old_evaluation, old_castling,
+                                            old_en_passant, old_halfmove))
+
+    def undo(self):
+        if len(self.move_history) == 0:
+            raise UndoException
+
+        move, piece, captured, player, old_hash, old_evaluation, castling, en_passant, halfmove = \
+            self.move_history.pop()
+        from_sq = move.from_row * 8 + move.from_col
+        to_sq = move.to_row * 8 + move.to_col
+        self.__remove(to_sq)
+        self.__add(from_sq, piece)
+        if captured is not None:
+            if piece.kind == PAWN and to_sq == en_passant:
+                self.__add(move.from_row * 8 + move.to_col, captured)
+            else:
+                self.__add(to_sq, captured)
+        elif piece.kind == KING and abs(to_sq - from_sq) == 2:
+            row = move.to_row * 8
+            rook_from, rook_to = (row + 7, row + 5) if move.to_col == 6 else (row, row + 3)
+            self.__add(rook_from, self.__remove(rook_to))
+        self.current_player = player
+        self._zobrist_hash = old_hash
+        self._evaluation = old_evaluation
+        self._castling = castling
+        self._en_passant = en_passant
+        self._halfmove_clock = halfmove
+
+    def king_square(self, p: Player) -> Optional[Tuple[int, int]]:
+        kings = self.__pieces[p][KING]
+        if not kings:
+            return None
+        return divmod(kings.bit_length() - 1, 8)
+
+    def in_check(self, p: Player):
+        kings = self.__pieces[p][KING]
+        if not kings:
+            return False
+        occupied = self.__occupied[Player.WHITE] | self.__occupied[Player.BLACK]
+        return self.__attacked(kings.bit_length() - 1, Player.BLACK if p == Player.WHITE else Player.WHITE, occupied)
+
+    def is_attacked(self, row: int, col: int, by: Player) -> bool:
+        occupied = self.__occupied[Player.WHITE] | self.__occupied[Player.BLACK]
+        return self.__attacked(row * 8 + col, by, occupied)
+
+    def __attacked(self, sq: int, by: Player, occupied: int, keep: int = -1) -> bool:
+        # keep masks out an attacker that is about to be captured when testing a move before it is made
+        pieces = self.__pieces[by]
+        if KNIGHT_ATTACKS[sq] & pieces[KNIGHT] & keep or KING_ATTACKS[sq] & pieces[KING] & keep:
+            return True
+        # a square is attacked by a pawn standing where an opposing pawn on that square would attack
+        if PAWN_ATTACKS[Player.BLACK if by == Player.WHITE else Player.WHITE][sq] & pieces[PAWN] & keep:
+            return True
+        diagonal = (pieces[BISHOP] | pieces[QUEEN]) & keep
+        if diagonal and slider_attacks(sq, occupied, DIAGONAL_RAYS) & diagonal:
+            return True
+        orthogonal = (pieces[ROOK] | pieces[QUEEN]) & keep
+        if orthogonal and slider_attacks(sq, occupied, ORTHOGONAL_RAYS) & orthogonal:
+            return True
+        return False
+
+    def __leaves_king_safe(self, from_sq: int, to_sq: int, player: Player, captured_sq: int = -1) -> bool:
+        # apply the move to the occupancy only, then look for attacks on the (possibly moved) king; captured_sq is
+        # the pawn taken en passant, which isn't on to_sq
+        kings = self.__pieces[player][KING]
+        if not kings:
+            return True
+        to_bit = 1 << to_sq
+        occupied = (self.__occupied[Player.WHITE] | self.__occupied[Player.BLACK]) & ~(1 << from_sq) | to_bit
+        keep = ~to_bit
+        if captured_sq >= 0:
+            occupied &= ~(1 << captured_sq)
+            keep &= ~(1 << captured_sq)
+        king_sq = kings.bit_length() - 1
+        if king_sq == from_sq:
+            king_sq = to_sq
+        return not self.__attacked(king_sq, Player.BLACK if player == Player.WHITE else Player.WHITE, occupied, keep)
+
+    def __evasions_and_pins(self, player: Player, king_sq: int, occupied: int):
+        # The squares a piece other than the king may move to without leaving the king in check: the checker and the
+        # squares between it and the king when in check (none in double check), everywhere otherwise. Pinned pieces
+        # are further held to the line between the king and the pinning piece, given by square in pins.
+        theirs = self.__pieces[Player.BLACK if player == Player.WHITE else Player.WHITE]
+        own = self.__occupied[player]
+        # an enemy pawn checks from where one of player's pawns on the king's square would attack
+        checkers = KNIGHT_ATTACKS[king_sq] & theirs[KNIGHT] | PAWN_ATTACKS[player][king_sq] & theirs[PAWN]
+        evasions = checkers
+        pins = {}
+        for rays, sliders in ((ORTHOGONAL_RAYS, theirs[ROOK] | theirs[QUEEN]),
+                              (DIAGONAL_RAYS, theirs[BISHOP] | theirs[QUEEN])):
+            if not sliders:
+                continue
+            for table, positive in rays:
+                ray = table[king_sq]
+                if not ray & sliders:
+                    continue
+                first = nearest(ray & occupied, positive)
+                if sliders >> first & 1:
+                    checkers |= 1 << first
+                    evasions |= ray ^ table[first]
+                elif own >> first & 1:
+                    beyond = table[first] & occupied
+                    if beyond:
+                        second = nearest(beyond, positive)
+                        if sliders >> second & 1:
+                            pins[first] = ray ^ table[second]
+        if not checkers:
+            return ALL_SQUARES, pins
+        if checkers & (checkers - 1):
+            # only the king can get out of a double check
+            return 0, pins
+        return evasions, pins
+
+    def __castling_moves(self, player: Player) -> Iterator[Move]:
+        if not self._castling:
+            return
+        enemy = Player.BLACK if player == Player.WHITE else Player.WHITE
+        occupied = self.__occupied[Player.WHITE] | self.__occupied[Player.BLACK]
+        pieces = self.__pieces[player]
+        for castle in CASTLES[player]:
+            if not self._castling & castle.right:
+                continue
+            row = castle.row * 8
+            if not (pieces[KING] >> (row + 4) & 1 and pieces[ROOK] >> (row + castle.rook_from) & 1):
+                continue
+            if any(occupied >> (row + col) & 1 for col in castle.empty):
+                continue
+            # the king may not castle out of, through or into check
+            if any(self.__attacked(row + col, enemy, occupied) for col in castle.passes):
+                continue
+            yield Move(castle.row, 4, castle.row, castle.king_to)
+
+    def __en_passant_moves(self, player: Player) -> Iterator[Move]:
+        # only the side to move can take en passant, and only straight away
+        to_sq = self._en_passant
+        if to_sq is None or player != self.current_player:
+            return
+        enemy = Player.BLACK if player == Player.WHITE else Player.WHITE
+        captured_sq = to_sq + 8 if player == Player.WHITE else to_sq - 8
+        # the pawns that can take are where an enemy pawn on the square would attack
+        for from_sq in iter_bits(PAWN_ATTACKS[enemy][to_sq] & self.__pieces[player][PAWN]):
+            if self.__leaves_king_safe(from_sq, to_sq, player, captured_sq):
+                yield Move(from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7)
+
+    def __targets(self, sq: int, piece: ChessPiece) -> int:
+        # bitboard of squares the piece on sq can reach by its movement rules
+        own = self.__occupied[piece.player]
+        enemy = self.__occupied[Player.BLACK if piece.player == Player.WHITE else Player.WHITE]
+        occupied = own | enemy
+        kind = piece.kind
+        if kind == PAWN:
+            targets = PAWN_ATTACKS[piece.player][sq] & enemy
+            if piece.player == Player.WHITE:
+                if sq >= 8 and not occupied >> (sq - 8) & 1:
+                    targets |= 1 << (sq - 8)
+                    if sq >> 3 == 6 and not occupied >> (sq - 16) & 1:
+                        targets |= 1 << (sq - 16)
+            else:
+                if sq < 56 and not occupied >> (sq + 8) & 1:
+                    targets |= 1 << (sq + 8)
+                    if sq >> 3 == 1 and not occupied >> (sq + 16) & 1:
+                        targets |= 1 << (sq + 16)
+            return targets
+        if kind == KNIGHT:
+            targets = KNIGHT_ATTACKS[sq]
+        elif kind == KING:
+            targets = KING_ATTACKS[sq]
+        elif kind == BISHOP:
+            targets = slider_attacks(sq, occupied, DIAGONAL_RAYS)
+        elif kind == ROOK:
+            targets = slider_attacks(sq, occupied, ORTHOGONAL_RAYS)
+        else:
+            targets = slider_attacks(sq, occupied, DIAGONAL_RAYS) | slider_attacks(sq, occupied, ORTHOGONAL_RAYS)
+        return targets & ~own
+
+    def is_valid_move(self, move: Move):
+        if not (0 <= move.from_row < 8 and 0 <= move.from_col < 8 and 0 <= move.to_row < 8 and 0 <= move.to_col < 8):
+            self.messageCode = MoveValidity.Invalid
+            return False
+        from_sq = move.from_row * 8 + move.from_col
+        to_sq = move.to_row * 8 + move.to_col
+        piece = self.__squares[from_sq]
+        if piece is None or not promotion_fits(move, piece):
+            self.messageCode = MoveValidity.Invalid
+            return False
+        # castling and en passant go by more than the piece's own rules
+        if piece.kind == KING and move.from_col == 4 and abs(to_sq - from_sq) == 2:
+            special = list(self.__castling_moves(piece.player))
+        elif piece.kind == PAWN and to_sq == self._en_passant and move.to_col != move.from_col:
+            special = list(self.__en_passant_moves(piece.player))
+        else:
+            special = None
+        if special is not None:
+            if move in special:
+                self.messageCode = MoveValidity.Valid
+                return True
+            self.messageCode = MoveValidity.StayingInCheck if self.in_check(piece.player) else MoveValidity.Invalid
+            return False
+        if not self.__targets(from_sq, piece) >> to_sq & 1:
+            self.messageCode = MoveValidity.Invalid
+            return False
+        # check if moving into check
+        if not self.__leaves_king_safe(from_sq, to_sq, piece.player):
+            if self.in_check(piece.player):
+                self.messageCode = MoveValidity.StayingInCheck
+            else:
+                self.messageCode = MoveValidity.MovingIntoCheck
+            return False
+        self.messageCode = MoveValidity.Valid
+        return True
+
+    def iter_legal_moves(self, player: Optional[Player] = None) -> Iterator[Move]:
+        if player is None:
+            player = self.current_player
+        last_row = 0 if player == Player.WHITE else 7
+        kings = self.__pieces[player][KING]
+        if kings:
+            occupied = self.__occupied[Player.WHITE] | self.__occupied[Player.BLACK]
+            evasions, pins = self.__evasions_and_pins(player, kings.bit_length() - 1, occupied)
+        else:
+            evasions, pins = ALL_SQUARES, {}
+        for from_sq in iter_bits(self.__occupied[player]):
+            from_row, from_col = divmod(from_sq, 8)
+            piece = self.__squares[from_sq]
+            if piece.kind == KING:
+                # the king is the one piece whose moves are tested square by square
+                targets = [to_sq for to_sq in iter_bits(self.__targets(from_sq, piece))
+                           if self.__leaves_king_safe(from_sq, to_sq, player)]
+            else:
+                allowed = evasions & pins.get(from_sq, ALL_SQUARES)
+                if not allowed:
+                    continue
+                targets = iter_bits(self.__targets(from_sq, piece) & allowed)
+            for to_sq in targets:
+                if piece.kind == PAWN and to_sq >> 3 == last_row:
+                    for kind in PROMOTION_PIECES:
+                        yield Move(from_row, from_col, to_sq >> 3, to_sq & 7, kind)
+                else:
+                    yield Move(from_row, from_col, to_sq >> 3, to_sq & 7)
+        yield from self.__castling_moves(player)
+        yield from self.__en_passant_moves(player)
+
+    def find_piece(self, comp: ChessPiece) -> List[Tuple[int, int]]:
+        return [divmod(sq, 8) for sq in iter_bits(self.__pieces[comp.player][comp.kind])]
+
+
+# The board representations by the names the command-line tools take them by
+BACKENDS = {'list': ChessModel, 'bitboard': BitboardChessModel}
@@ -0,0 +1,224 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+from collections import Counter
+from chess_model import ChessModel
+from fen import FENError, EPDRecord, read_positions
+from move import Move
+from pgn import PGNError, PGNGame, read_games, san_to_move
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# File layout: the magic bytes, then fixed-size entries sorted by position key, the moves of one position by
+# falling weight. Keys are the models' Zobrist hashes, which are the same in every run (see zobrist.py), so a book
+# stays valid as long as the keys do.
+MAGIC = b'LKRBOOK1'
+# key, move, weight
+ENTRY = struct.Struct('>QHH')
+KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xFFFF
+
+
+class BookError(ValueError):
+    pass
+
+
+class BookEntry(NamedTuple):
+    move: Move
+    weight: int
+
+
+def encode_move(move: Move) -> int:
+    """
+    Packs a move into 15 bits: from square, to square (each row * 8 + col) and promotion kind (0 for none).
+    """
+    return (move.from_row * 8 + move.from_col) << 9 | (move.to_row * 8 + move.to_col) << 3 | (move.promotion or 0)
+
+
+def decode_move(code: int) -> Move:
+    from_sq, to_sq = code >> 9, code >> 3 & 63
+    return Move(from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7, code & 7 or None)
+
+
+class BookBuilder:
+    """
+    Counts how often each move was played from each position, then writes the counts out as a book file.
+    """
+
+    def __init__(self, model_class=ChessModel):
+        self.model_class = model_class
+        self.counts: Counter = Counter()
+
+    def add_game(self, game: PGNGame, max_plies: int = 20) -> int:
+        """
+        Replays the first max_plies moves of a game, counting each. A game with a move that can't be played counts
+        up to that move.
+        :return: int the number of moves counted.
+        """
+        try:
+            model = self.model_class.from_fen(game.headers['FEN']) if 'FEN' in game.headers else self.model_class()
+        except FENError:
+            return 0
+        for ply, san in enumerate(game.moves[:max_plies]):
+            try:
+                move = san_to_move(model, san)
+            except PGNError:
+                return ply
+            self.counts[model.zobrist_hash, encode_move(move)] += 1
+            model.move(move)
+        return min(len(game.moves), max_plies)
+
+    def add_position(self, record: EPDRecord, weight: int = 1) -> int:
+        """
+        Counts the best moves ('bm' operation) of an EPD record, each with the given weight.
+        :return: int the number of moves counted.
+        """
+        if 'bm' not in record.operations:
+            return 0
+        model = self.model_class.from_fen(record.fen)
+        counted = 0
+        for san in record.operations['bm'].split():
+            try:
+                move = san_to_move(model, san)
+            except PGNError:
+                continue
+            self.counts[model.zobrist_hash, encode_move(move)] += weight
+            counted += 1
+        return counted
+
+    def write(self, path: str, min_weight: int = 1) -> int:
+        """
+        Writes the book, leaving out moves counted fewer than min_weight times.
+        :return: int the number of entries written.
+        """
+        entries = sorted(((key, -min(count, MAX_WEIGHT), code) for (key, code), count in self.counts.items()
+                          if count >= min_weight))
+        with open(path, 'wb') as out:
+            out.write(MAGIC)
+            for key, weight, code in entries:
+                out.write(ENTRY.pack(key, code, -weight))
+        return len(entries)
+
+
+class OpeningBook:
+    """
+    A book file opened for lookups. The file is memory-mapped rather than read, so opening it costs nothing however
+    big it is, and every process using the same book shares one copy through the page cache. A lookup is a binary
+    search over the sorted entries.
+
+    Sent to another process, a book reopens its file there.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = open(path, 'rb')
+        size = os.fstat(self.__file.fileno()).st_size
+        if size < len(MAGIC) or (size - len(MAGIC)) % ENTRY.size:
+            self.__file.close()
+            raise BookError(f'{path}: not a book file')
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise BookError(f'{path}: not a book file')
+        self.__size = (size - len(MAGIC)) // ENTRY.size
+
+    def __len__(self):
+        return self.__size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __reduce__(self):
+        return OpeningBook, (self.path,)
+
+    def close(self):
+        self.__map.close()
+        self.__file.close()
+
+    def lookup(self, key: int) -> List[BookEntry]:
+        """
+        Returns the book moves for the position with Zobrist hash key, most played first.
+        """
+        book, size = self.__map, self.__size
+        # find the first entry whose key is not below key
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(book, len(MAGIC) + middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < size:
+            entry_key, code, weight = ENTRY.unpack_from(book, len(MAGIC) + low * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append(BookEntry(decode_move(code), weight))
+            low += 1
+        return entries
+
+    def choose(self, model, rng: Optional[random.Random] = None) -> Optional[Move]:
+        """
+        Picks a book move for model's current position, checked to be legal there in case of a hash collision.
+        :param rng: random.Random to pick with, in proportion to the weights. Without one the most played move is
+         taken.
+        :return: Move, or None if the position is not in the book.
+        """
+        entries = [entry for entry in self.lookup(model.zobrist_hash) if model.is_valid_move(entry.move)]
+        if not entries:
+            return None
+        if rng is None:
+            return entries[0].move
+        return rng.choices([entry.move for entry in entries], [entry.weight for entry in entries])[0]
+
+
+def build(output: str, pgn_paths: Iterable[str] = (), epd_paths: Iterable[str] = (), max_plies: int = 20,
+          min_weight: int = 1, model_class=ChessModel) -> Tuple[int, int]:
+    """
+    Builds a book from PGN files and EPD files with 'bm' operations, streaming the inputs so only the counts are
+    kept in memory.
+    :return: (int games or positions read, int entries written).
+    """
+    builder = BookBuilder(model_class)
+    sources = 0
+    for path in pgn_paths:
+        for game in read_games(path):
+            builder.add_game(game, max_plies)
+            sources += 1
+    for path in epd_paths:
+        for record in read_positions(path):
+            builder.add_position(record)
+            sources += 1
+    return sources, builder.write(output, min_weight)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query an opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build a book from PGN and EPD files')
+    build_parser.add_argument('book', help='book file to write')
+    build_parser.add_argument('pgn', nargs='*', help='PGN files to take the opening moves from')
+    build_parser.add_argument('--epd', action='append', default=[], help="EPD file whose 'bm' moves to add")
+    build_parser.add_argument('--plies', type=int, default=20, help='plies of each game to use (default 20)')
+    build_parser.add_argument('--min-weight', type=int, default=1, help='leave out moves played fewer times')
+    probe_parser = commands.add_parser('probe', help='list the book moves for a position')
+    probe_parser.add_argument('book', help='book file to read')
+    probe_parser.add_argument('--fen', help='position to look up (default the starting position)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sources, entries = build(args.book, args.pgn, args.epd, args.plies, args.min_weight)
+        print(f'{entries} entries from {sources} games and positions written to {args.book}')
+    else:
+        model = ChessModel.from_fen(args.fen) if args.fen is not None else ChessModel()
+        with OpeningBook(args.book) as book:
+            for entry in book.lookup(model.zobrist_hash):
+                print(f'{entry.move.uci()}\t{entry.weight}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,23 @@
-import copy
+import argparse
 from enum import Enum
 import pygame as pg
 import pygame_gui as gui
-from chess_model import ChessModel, MoveValidity, UndoException
+from chess_model import AIMode, ChessModel, GameStatus, MoveValidity, UndoException
+from ai_worker import AIWorker
+from bitboard_model import BitboardChessModel
+from legal_move_cache import LegalMoveCache
 from move import Move
 from player import Player
 from king import King
-from rook import Rook
 
 IMAGE_SIZE = 52  # small format - images 52 X 52
+HIGHLIGHT_COLOR = (0, 160, 0)
+SELECTED_COLOR = (255, 0, 0)
+LIGHT_SQUARE = (255, 255, 255)
+DARK_SQUARE = (127, 127, 127)
+# posted by the AI worker thread: the move it chose, and each finished search iteration
+AI_MOVE_EVENT = pg.event.custom_type()
+AI_PROGRESS_EVENT = pg.event.custom_type()
 
 
 class SpriteType(Enum):
@@ -28,9 +37,11 @@ class SpriteColor(Enum):
 class GUI:
     first = True
 
-    def __init__(self) -> None:
+    def __init__(self, model_class=ChessModel, mode: AIMode = AIMode.Heuristic, depth=None, movetime=None) -> None:
         pg.init()
-        self.__model = ChessModel()
+        self.__model_class = model_class
+        self.__ai_options = (mode, depth, movetime)
+        self.__model = model_class()
         self._screen = pg.display.set_mode((800, 600))
         pg.display.set_caption("Laker Chess")
         self._ui_manager = gui.UIManager((800, 600))
@@ -57,6 +68,20 @@ class GUI:
         self._piece_selected = False
         self._first_selected = (0, 0)
         self._second_selected = (0, 0)
+        # legal moves of the position on the board, worked out off the event loop whenever it changes
+        self._legal_moves = LegalMoveCache(background=True)
+        # the AI thinks on a thread and hands its move back through the event queue
+        self._ai = AIWorker(lambda key, move: pg.event.post(pg.event.Event(AI_MOVE_EVENT, key=key, move=move)),
+                            lambda result: pg.event.post(pg.event.Event(AI_PROGRESS_EVENT, result=result)))
+        # the board is kept on its own surface and only the squares that changed are painted on it again; each
+        # square remembers what was last painted there as (player, piece type, mark)
+        self._empty_board = self.__render_empty_board()
+        self._board_layer = self._empty_board.copy()
+        self._drawn = [[None] * 8 for _ in range(8)]
+        # converted once to the display format, and blitted as they are from then on
+        self._sprites = {(Player.WHITE, name): sprite.convert_alpha() for name, sprite in GUI.white_sprites.items()}
+        self._sprites.update({(Player.BLACK, name): sprite.convert_alpha()
+                              for name, sprite in GUI.black_sprites.items()})
 
     @classmethod
     def load_images(cls):
@@ -96,7 +121,12 @@ class GUI:
                             self._piece_selected = piece
                     elif self._piece_selected:
                         mv = Move(self._first_selected[0], self._first_selected[1], y, x)
-                        if self.__model.is_valid_move(mv):
+                        # the cache answers straight away; the model is only asked while the cache is catching up
+                        legal = self._legal_moves.is_legal(self.__model, mv)
+                        if legal is None:
+                            legal = self.__model.is_valid_move(mv)
+                        if legal:
+                            self.__stop_ai()
                             target = self.__model.piece_at(y, x)
                             self.__model.move(mv)
                             if target is not None:
@@ -106,68 +136,49 @@ class GUI:
                             self._side_box.append_html_text(msg + '<br />')
 
                         else:
+                            # sets messageCode to the reason the move was refused
+                            self.__model.is_valid_move(mv)
                             self._side_box.append_html_text(f'{self.__model.messageCode}<br />')
-                        incheck = self.__model.in_check(self.__model.current_player)
-                        complete = self.__model.is_complete()
-
-                        if incheck:
-                            player_color = self.__model.current_player.name
-                            if complete:
-                                self._side_box.append_html_text(f'{player_color} is in CHECKMATE!<br />GAME OVER!')
-                            else:
-                                self._side_box.append_html_text(f'{player_color} is in CHECK!<br />')
+                        self.__report_status()
 
                         self._piece_selected = False
                     else:
                         self._piece_selected = False
                 if event.type == gui.UI_BUTTON_PRESSED:
                     if event.ui_element == self._restart_button:
-                        self.__model = ChessModel()
+                        self.__stop_ai()
+                        self.__model = self.__model_class()
                         self._side_box.set_text("Restarting game...<br />")
                     if event.ui_element == self._undo_button:
+                        self.__stop_ai()
                         try:
                             self.__model.undo()
                             self._side_box.append_html_text('Undoing move.<br />')
                         except UndoException as e:
                             self._side_box.append_html_text(f'{e}<br />')
                     if event.ui_element == self._ai_button:
-                        if self.__model.ai():
-                            self._side_box.append_html_text('No valid move found.<br />')
+                        if self._ai.busy:
+                            self.__stop_ai()
+                            self._side_box.append_html_text('AI stopped.<br />')
+                        else:
+                            self._ai.start(self.__model, *self.__ai_options)
+                            self._ai_button.set_text('Stop')
+                            self._side_box.append_html_text('Thinking...<br />')
                     if event.ui_element == self._castleL_button:
-                        # if not in check
-                        if not self.__model.in_check(self.__model.current_player):
-                            row = 0 if self.__model.current_player == Player.BLACK else 7
-                            king_col = 4
-                            real_king = self.__model.find_piece(King(self.__model.current_player))[0]
-                            rook_col = 0
-                            real_rook = self.__model.find_piece(Rook(self.__model.current_player))[0]
-                            # if king and rook haven't moved
-                            if real_king[0] == row and real_king[1] == king_col and real_rook[0] == row and real_rook[1] == rook_col:
-                                # if no pieces are in the way
-                                if self.__model.is_valid_move(Move(row, rook_col, row, king_col - 1)):
-                                    self.__model.move(Move(row, rook_col, row, king_col - 1))
-                                    self.__model.move(Move(row, king_col, row, king_col - 2))
-                                    if self.__model.in_check(self.__model.current_player):
-                                        self.__model.undo()
-                                        self.__model.undo()
-                        self._castleL_button.visible = False
-                        self._castleR_button.visible = False
-                        self._side_box.append_html_text(f'{self.__model.current_player.name} castled to the Left!')
+                        self.__stop_ai()
+                        self.__castle(2, 'Left')
                     if event.ui_element == self._castleR_button:
-                        if not self.__model.in_check(self.__model.current_player):
-                            row = 0 if self.__model.current_player == Player.BLACK else 7
-                            king_col = 4
-                            real_king = self.__model.find_piece(King(self.__model.current_player))[0]
-                            rook_col = 7
-                            real_rook = self.__model.find_piece(Rook(self.__model.current_player))[1]
-                            if real_king[0] == row and real_king[1] == king_col and real_rook[0] == row and real_rook[1] == rook_col:
-                                if self.__model.is_valid_move(Move(row, rook_col, row, king_col + 1)):
-                                    self.__model.move(Move(row, rook_col, row, king_col + 1))
-                                    self.__model.move(Move(row, king_col, row, king_col + 2))
-                        self._castleL_button.visible = False
-                        self._castleR_button.visible = False
-                        self._side_box.append_html_text(f'{self.__model.current_player.name} castled to the Right!')
+                        self.__stop_ai()
+                        self.__castle(6, 'Right')
+                if event.type == AI_PROGRESS_EVENT:
+                    result = event.result
+                    self._side_box.append_html_text(f'Depth {result.depth}: {result.move.uci()} '
+                                                    f'({result.nodes} nodes, {result.nps:.0f} nodes/s)<br />')
+                if event.type == AI_MOVE_EVENT:
+                    self.__finish_ai(event.key, event.move)
             self._ui_manager.process_events(event)
+            # only a hash comparison unless the position has changed since the last frame
+            self._legal_moves.update(self.__model)
 
             self._screen.fill((255, 255, 255))
             self.__draw_board__()
@@ -176,48 +187,120 @@ class GUI:
 
             pg.display.flip()
             time_delta = clock.tick(30) / 1000.0
+        self._ai.cancel()
+
+    def __stop_ai(self) -> None:
+        # anything that changes the board makes the move being worked out useless
+        if self._ai.busy:
+            self._ai.cancel()
+            self._ai_button.set_text('AI')
+
+    def __finish_ai(self, key: int, move) -> None:
+        self._ai_button.set_text('AI')
+        if key != self.__model.zobrist_hash:
+            # worked out for a position that has since been left
+            return
+        if move is None:
+            self._side_box.append_html_text('No valid move found.<br />')
+            return
+        piece = self.__model.piece_at(move.from_row, move.from_col)
+        target = self.__model.piece_at(move.to_row, move.to_col)
+        self.__model.move(move)
+        if target is not None:
+            msg = f'AI moved {piece} and captured {target}'
+        else:
+            msg = f'AI moved {piece}'
+        self._side_box.append_html_text(msg + '<br />')
+        self._piece_selected = False
+        self.__report_status()
+
+    def __report_status(self) -> None:
+        incheck = self.__model.in_check(self.__model.current_player)
+        complete = self.__model.is_complete()
+
+        if incheck:
+            player_color = self.__model.current_player.name
+            if complete:
+                self._side_box.append_html_text(f'{player_color} is in CHECKMATE!<br />GAME OVER!')
+            else:
+                self._side_box.append_html_text(f'{player_color} is in CHECK!<br />')
+        elif complete == GameStatus.Stalemate:
+            self._side_box.append_html_text('STALEMATE!<br />GAME OVER!')
+        elif complete:
+            self._side_box.append_html_text(f'DRAW ({complete.name})!<br />GAME OVER!')
+
+    def __castle(self, king_col: int, side: str) -> None:
+        # the model checks the rights, the empty squares and the squares the king crosses, and moves the rook too
+        player = self.__model.current_player
+        row = 0 if player == Player.BLACK else 7
+        self._castleL_button.visible = False
+        self._castleR_button.visible = False
+        piece = self.__model.piece_at(row, 4)
+        if isinstance(piece, King) and self.__model.is_valid_move(Move(row, 4, row, king_col)):
+            self.__model.move(Move(row, 4, row, king_col))
+            self._side_box.append_html_text(f'{player.name} castled to the {side}!<br />')
+        else:
+            self._side_box.append_html_text('Cannot castle.<br />')
+        self._piece_selected = False
 
     def __get_coords__(self, y, x):
         grid_x = x // IMAGE_SIZE
         grid_y = y // IMAGE_SIZE
         return grid_y, grid_x
 
+    @staticmethod
+    def __render_empty_board() -> pg.Surface:
+        board = pg.Surface((8 * IMAGE_SIZE, 8 * IMAGE_SIZE))
+        for row in range(8):
+            for col in range(8):
+                color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
+                pg.draw.rect(board, color, pg.rect.Rect(col * IMAGE_SIZE, row * IMAGE_SIZE, IMAGE_SIZE, IMAGE_SIZE))
+        return board
+
+    def __draw_square(self, row: int, col: int, state) -> None:
+        square = pg.rect.Rect(col * IMAGE_SIZE, row * IMAGE_SIZE, IMAGE_SIZE, IMAGE_SIZE)
+        self._board_layer.blit(self._empty_board, square, square)
+        player, piece_type, mark = state
+        if mark is not None:
+            pg.draw.rect(self._board_layer, mark, square, 2 if mark == SELECTED_COLOR else 3)
+        if piece_type is not None:
+            self._board_layer.blit(self._sprites[player, piece_type], square)
+
     def __draw_board__(self) -> None:
-        count = 0
-        color = (255, 255, 255)
-        for x in range(0, 8):
-            for y in range(0, 8):
-                if count % 2 == 0:
-                    color = (255, 255, 255)
+        selected = self._first_selected if self._piece_selected else None
+        # read from the cache, never generated here
+        targets = set()
+        if selected is not None:
+            targets = self._legal_moves.targets(self.__model, *selected)
+            king = isinstance(self._piece_selected, King)
+            self._castleL_button.visible = king
+            self._castleR_button.visible = king
+        for row in range(8):
+            for col in range(8):
+                piece = self.__model.piece_at(row, col)
+                if (row, col) == selected:
+                    mark = SELECTED_COLOR
+                elif (row, col) in targets:
+                    mark = HIGHLIGHT_COLOR
                 else:
-                    color = (127, 127, 127)
-                count = count + 1
-                pg.draw.rect(self._screen, color, pg.rect.Rect(x * IMAGE_SIZE, y * IMAGE_SIZE, IMAGE_SIZE, IMAGE_SIZE))
-                if self._piece_selected and (y, x) == self._first_selected:
-                    pg.draw.rect(self._screen, (255, 0, 0),
-                                 pg.rect.Rect(x * IMAGE_SIZE, y * IMAGE_SIZE, IMAGE_SIZE, IMAGE_SIZE), 2)
-                    if isinstance(self._piece_selected, King):
-                        self._castleL_button.visible = True
-                        self._castleR_button.visible = True
-                    else:
-                        self._castleL_button.visible = False
-                        self._castleR_button.visible = False
-                draw_piece = self.__model.piece_at(y, x)
-                if draw_piece is not None:
-                    if draw_piece.player == Player.BLACK:
-                        d = GUI.black_sprites
-                    else:
-                        d = GUI.white_sprites
-                    self._screen.blit(copy.deepcopy(d[draw_piece.type()]), (x * IMAGE_SIZE, y * IMAGE_SIZE))
-            count = count + 1
-        pg.draw.line(self._screen, (0, 0, 0), (0, 840), (840, 840))
-        pg.draw.line(self._screen, (0, 0, 0), (840, 840), (840, 0))
+                    mark = None
+                state = (piece.player, piece.type(), mark) if piece is not None else (None, None, mark)
+                if self._drawn[row][col] != state:
+                    self._drawn[row][col] = state
+                    self.__draw_square(row, col, state)
+        self._screen.blit(self._board_layer, (0, 0))
         GUI.first = False
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Laker Chess')
+    parser.add_argument('--bitboard', action='store_true', help='use the bitboard board representation')
+    parser.add_argument('--depth', type=int, help='make the AI search this many plies deep')
+    parser.add_argument('--movetime', type=float, help='make the AI search for this many seconds')
+    args = parser.parse_args()
+    mode = AIMode.Search if args.depth is not None or args.movetime is not None else AIMode.Heuristic
     GUI.load_images()
-    g = GUI()
+    g = GUI(BitboardChessModel if args.bitboard else ChessModel, mode, args.depth, args.movetime)
     g.run_game()
 
 
@@ -1,7 +1,9 @@
+import functools
 from enum import Enum
 from player import Player
 from move import Move
-from chess_piece import ChessPiece
+from chess_piece import ChessPiece, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK_CODE, ORTHOGONAL, DIAGONAL, \
+    KNIGHT_OFFSETS, KING_OFFSETS
 from pawn import Pawn
 from rook import Rook
 from knight import Knight
@@ -9,7 +11,55 @@ from bishop import Bishop
 from queen import Queen
 from king import King
 from move import Move
-from typing import List, Tuple
+from zobrist import BLACK_TO_MOVE, CASTLING_KEYS, EN_PASSANT_KEYS, hash_board, piece_key
+from fen import board_to_fen, parse_fen
+from evaluation import SQUARE_SCORES, evaluate_board
+from search import SearchEngine, SearchResult
+from parallel_search import ParallelSearch
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Every square, as a bitmask with bit row * 8 + col for each square
+ALL_SQUARES = (1 << 64) - 1
+
+# Castling rights, one bit each, so all four fit in an int that is cheap to copy and to hash
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+CASTLING_LETTERS = {WHITE_KINGSIDE: 'K', WHITE_QUEENSIDE: 'Q', BLACK_KINGSIDE: 'k', BLACK_QUEENSIDE: 'q'}
+
+# What a pawn on the last rank may become
+PROMOTION_PIECES = {QUEEN: Queen, ROOK: Rook, BISHOP: Bishop, KNIGHT: Knight}
+
+
+class Castle(NamedTuple):
+    """
+    One of the four castling moves. The king goes from column 4 to king_to and the rook from rook_from to rook_to;
+    the empty columns must be clear and the king must not be attacked on any of the passes columns.
+    """
+    right: int
+    player: Player
+    row: int
+    king_to: int
+    rook_from: int
+    rook_to: int
+    empty: Tuple[int, ...]
+    passes: Tuple[int, ...]
+
+
+CASTLES = {
+    Player.WHITE: (Castle(WHITE_KINGSIDE, Player.WHITE, 7, 6, 7, 5, (5, 6), (4, 5, 6)),
+                   Castle(WHITE_QUEENSIDE, Player.WHITE, 7, 2, 0, 3, (1, 2, 3), (4, 3, 2))),
+    Player.BLACK: (Castle(BLACK_KINGSIDE, Player.BLACK, 0, 6, 7, 5, (5, 6), (4, 5, 6)),
+                   Castle(BLACK_QUEENSIDE, Player.BLACK, 0, 2, 0, 3, (1, 2, 3), (4, 3, 2))),
+}
+
+# The rights kept after a move from or to each square: moving the king or a rook, or having a rook taken on its
+# home square, gives the right up for good
+CASTLING_MASK = [15] * 64
+for _castle in CASTLES[Player.WHITE] + CASTLES[Player.BLACK]:
+    CASTLING_MASK[_castle.row * 8 + 4] &= ~_castle.right
+    CASTLING_MASK[_castle.row * 8 + _castle.rook_from] &= ~_castle.right
 
 
 class MoveTypes(Enum):
@@ -19,6 +69,28 @@ class MoveTypes(Enum):
     Advance = 4
 
 
+class AIMode(Enum):
+    Heuristic = 1
+    Search = 2
+
+
+# The AI modes by the names the command-line tools take them by
+MODES = {'heuristic': AIMode.Heuristic, 'search': AIMode.Search}
+
+
+class GameStatus(Enum):
+    Ongoing = 1
+    Checkmate = 2
+    Stalemate = 3
+    FiftyMoveRule = 4
+    Repetition = 5
+    InsufficientMaterial = 6
+
+    def __bool__(self):
+        # so 'if model.is_complete():' still reads as 'is the game over'
+        return self != GameStatus.Ongoing
+
+
 class MoveValidity(Enum):
     Valid = 1
     Invalid = 2
@@ -40,8 +112,98 @@ class UndoException(Exception):
     pass
 
 
+class AttackInfo(NamedTuple):
+    """
+    What limits one side's moves in a position. Squares are numbered row * 8 + col, and sets of squares are int
+    bitmasks with one bit per square.
+    attacked: every square the opponent attacks, seen through the side's own king so the king can't step back
+     along a checking line.
+    checkers: the squares of the pieces giving check.
+    evasions: the squares a piece other than the king has to move to: the checker or a square between it and the
+     king in single check, none in double check, and all of them when not in check.
+    pins: the square of each piece pinned to its king, mapped to the squares along the pin it can still move to.
+    """
+    attacked: int
+    checkers: List[int]
+    evasions: int
+    pins: Dict[int, int]
+
+
+class _BoardView(list):
+    # the list methods that would change the number or order of rows or squares are refused
+    def _refuse(self, *args, **kwargs):
+        raise TypeError('the board is 8 rows of 8 squares: write single squares, or assign a whole board')
+
+    append = extend = insert = pop = remove = clear = sort = reverse = __delitem__ = __iadd__ = __imul__ = _refuse
+
+    def __reduce__(self):
+        # a copy is detached from the model, so it is made a plain list
+        return list, (list(self),)
+
+
+class _BoardRow(_BoardView):
+    """
+    One row of a model's board. Reading it is reading a list; writing a square puts the piece on the model the same
+    way set_piece() does.
+    """
+
+    def __init__(self, pieces, write):
+        super().__init__(pieces)
+        self.__write = write
+
+    def __setitem__(self, col, piece):
+        if isinstance(col, slice):
+            cols = range(8)[col]
+            pieces = list(piece)
+            if len(pieces) != len(cols):
+                raise ValueError('a row of the board can only have its squares replaced, not added or taken away')
+        else:
+            cols = [range(8)[col]]
+            pieces = [piece]
+        for c, p in zip(cols, pieces):
+            self.__write(c, p)
+            super().__setitem__(c, p)
+
+
+class _Board(_BoardView):
+    # a model's board: assigning a row writes each of its squares
+    def __setitem__(self, row, pieces):
+        if isinstance(row, slice):
+            raise TypeError('the board is 8 rows of 8 squares: write single squares, or assign a whole board')
+        self[row][:] = pieces
+
+
+class MoveRecord(NamedTuple):
+    """
+    The minimal delta needed to take back a move: the move itself, the piece that moved (the pawn, when it was
+    promoted), whatever it captured, whose turn it was, and the position's Zobrist hash, evaluation, castling
+    rights, en passant square and halfmove clock before the move.
+    """
+    move: Move
+    piece: ChessPiece
+    captured: Optional[ChessPiece]
+    player: Player
+    hash: int
+    evaluation: int
+    castling: int
+    en_passant: Optional[int]
+    halfmove: int
+
+
 class ChessModel:
     def __init__(self):
+        self.__player = Player.WHITE
+        self.__nrows = 8
+        self.__ncols = 8
+        self.__message_code = None
+        self.move_history = []
+        self.__engine = None
+        self.__book = None
+        self.__status_cache = None
+        self.__attack_cache = {}
+        # move number of the position the game was set up from, for fen()
+        self.__first_ply = 0
+        # assigned through the property so a subclass can keep the pieces in its own structure
         self.board = [[Rook(Player.BLACK), Knight(Player.BLACK), Bishop(Player.BLACK), Queen(Player.BLACK),
                        King(Player.BLACK), Bishop(Player.BLACK), Knight(Player.BLACK), Rook(Player.BLACK)],
                       [Pawn(Player.BLACK), Pawn(Player.BLACK), Pawn(Player.BLACK), Pawn(Player.BLACK),
@@ -54,11 +216,145 @@ class ChessModel:
                        Pawn(Player.WHITE), Pawn(Player.WHITE), Pawn(Player.WHITE), Pawn(Player.WHITE)],
                       [Rook(Player.WHITE), Knight(Player.WHITE), Bishop(Player.WHITE), Queen(Player.WHITE),
                        King(Player.WHITE), Bishop(Player.WHITE), Knight(Player.WHITE), Rook(Player.WHITE)]]
-        self.__player = Player.WHITE
-        self.__nrows = 8
-        self.__ncols = 8
-        self.__message_code = None
+
+    @property
+    def board(self):
+        # a copy of the squares, but one that can be written to: writing a square (or a row) goes through
+        # set_piece()'s bookkeeping, so the hash, the piece index and the cached attack info all stay in step
+        return _Board(_BoardRow(row, functools.partial(self.__write, i)) for i, row in enumerate(self.__board))
+
+    @board.setter
+    def board(self, new_board: List[List[ChessPiece]]):
+        # copied, so the caller's lists can't change the position behind the model's back
+        self.__board = [list(row) for row in new_board]
+        self.__index_pieces()
+        self.__locate_kings()
+        self._reset_rules(new_board)
+        self._zobrist_hash = hash_board(new_board, self.__player, self._castling)
+        self._evaluation = evaluate_board(new_board)
+
+    def _rows(self) -> List[List[ChessPiece]]:
+        # the squares, for reading only, without the copy reading board makes
+        return self.__board
+
+    def _reset_rules(self, board: List[List[ChessPiece]]):
+        # a new board keeps the castling rights its kings and rooks still could have, and starts with no en passant
+        # square and a fresh halfmove clock
+        self._castling = castling_from_board(board)
+        self._en_passant = None
+        self._halfmove_clock = 0
+
+    @classmethod
+    def from_fen(cls, fen: str) -> 'ChessModel':
+        """
+        Creates a model set up with the position fen (see load_fen()).
+        """
+        model = cls()
+        model.load_fen(fen)
+        return model
+
+    def load_fen(self, fen: str):
+        """
+        Sets up the position fen and clears the move history. Castling rights the kings and rooks are no longer
+        placed for, and an en passant square no pawn can take on, are dropped.
+        :param fen: str a FEN record; the move counters may be left off, as in EPD.
+        :raises FENError: if fen is not a valid FEN record.
+        """
+        position = parse_fen(fen)
         self.move_history = []
+        self.__status_cache = None
+        self.current_player = position.player
+        self.board = position.board
+        castling = 0
+        for right, letter in CASTLING_LETTERS.items():
+            if letter in position.castling:
+                castling |= right
+        self._castling &= castling
+        if position.en_passant != '-':
+            square = (8 - int(position.en_passant[1])) * 8 + 'abcdefgh'.index(position.en_passant[0])
+            self._en_passant = en_passant_target(self._rows(), square, position.player)
+        self._halfmove_clock = position.halfmove
+        self._zobrist_hash = hash_board(self._rows(), position.player, self._castling, self._en_passant)
+        self.__first_ply = 2 * (position.fullmove - 1) + (1 if position.player == Player.BLACK else 0)
+
+    def fen(self) -> str:
+        """
+        Returns the current position as a FEN record.
+        """
+        castling = ''.join(letter for right, letter in CASTLING_LETTERS.items() if self._castling & right) or '-'
+        en_passant = '-'
+        if self._en_passant is not None:
+            row, col = divmod(self._en_passant, 8)
+            en_passant = f'{"abcdefgh"[col]}{8 - row}'
+        fullmove = (self.__first_ply + len(self.move_history)) // 2 + 1
+        return board_to_fen(self._rows(), self.current_player, castling, en_passant, self._halfmove_clock, fullmove)
+
+    @property
+    def zobrist_hash(self) -> int:
+        """
+        A 64-bit hash of the piece placement, side to move, castling rights and en passant square, kept up to date
+        by move(), undo() and set_piece(). Two positions with the same hash can be treated as the same position.
+        """
+        return self._zobrist_hash
+
+    @property
+    def castling_rights(self) -> int:
+        """
+        The castling rights still held, as a bitmask of WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE and
+        BLACK_QUEENSIDE.
+        """
+        return self._castling
+
+    @property
+    def en_passant_square(self) -> Optional[Tuple[int, int]]:
+        """
+        The (row, col) square the side to move can take a pawn en passant on, or None. Only set when a pawn is in
+        place to make the capture.
+        """
+        if self._en_passant is None:
+            return None
+        return divmod(self._en_passant, 8)
+
+    @property
+    def halfmove_clock(self) -> int:
+        """
+        The number of moves (plies) since the last capture or pawn move, for the fifty-move rule.
+        """
+        return self._halfmove_clock
+
+    def repetitions(self) -> int:
+        """
+        Counts how many times the current position has stood on the board, this time included. Only positions
+        since the last capture or pawn move can come round again, so only those hashes are looked at.
+        :return: int 1 if the position is new.
+        """
+        key = self._zobrist_hash
+        history = self.move_history
+        count = 1
+        # positions with the same side to move are an even number of plies apart
+        for i in range(len(history) - 2, max(len(history) - self._halfmove_clock, 0) - 1, -2):
+            if history[i].hash == key:
+                count += 1
+        return count
+
+    def _set_rules(self, castling: int, en_passant: Optional[int]):
+        # replaces the castling rights and en passant square, keeping the hash in step
+        h = self._zobrist_hash ^ CASTLING_KEYS[self._castling] ^ CASTLING_KEYS[castling]
+        if self._en_passant is not None:
+            h ^= EN_PASSANT_KEYS[self._en_passant % 8]
+        if en_passant is not None:
+            h ^= EN_PASSANT_KEYS[en_passant % 8]
+        self._zobrist_hash = h
+        self._castling = castling
+        self._en_passant = en_passant
+
+    @property
+    def evaluation(self) -> int:
+        """
+        Material plus piece-square score of the position in centipawns, from white's point of view, kept up to date
+        by move(), undo() and set_piece(). See evaluation.evaluate() for the score from the side to move's view.
+        """
+        return self._evaluation
 
     @property
     def nrows(self):
@@ -85,6 +381,8 @@ class ChessModel:
     @current_player.setter
     def current_player(self, new_current_player: Player):
         if isinstance(new_current_player, Player):
+            if new_current_player != self.__player:
+                self._zobrist_hash ^= BLACK_TO_MOVE
             self.__player = new_current_player
 
     @property
@@ -96,100 +394,458 @@ class ChessModel:
         if isinstance(new_messageCode, MoveValidity):
             self.__message_code = new_messageCode
 
-    def is_complete(self) -> bool:
+    def is_complete(self) -> GameStatus:
+        """
+        Works out whether the game is over. Draws by the fifty-move rule and by threefold repetition are taken as
+        soon as they can be claimed. What the position itself decides (mate, stalemate, too little material) is
+        cached against the Zobrist hash, so asking again before the board next changes costs next to nothing.
+        :return: GameStatus Ongoing (falsy), or the reason the game is over (truthy).
+        """
+        key = self._zobrist_hash
+        if self.__status_cache is not None and self.__status_cache[0] == key:
+            status = self.__status_cache[1]
+        else:
+            status = self.__game_status()
+            self.__status_cache = (key, status)
+        if status != GameStatus.Ongoing:
+            return status
+        if self._halfmove_clock >= 100:
+            return GameStatus.FiftyMoveRule
+        if self.repetitions() >= 3:
+            return GameStatus.Repetition
+        return status
+
+    def __game_status(self) -> GameStatus:
         white_check = self.in_check(Player.WHITE)
         black_check = self.in_check(Player.BLACK)
 
         if white_check or black_check:
-            # get all of checked players pieces
+            # if the checked player has any legal move, it can stop check
             player_checked = Player.WHITE if white_check else Player.BLACK
-            pieces = []
-            for row in range(8):
-                for col in range(8):
-                    if self.board[row][col] is not None and self.board[row][col].player == player_checked:
-                        pieces.append([row, col])
-            # for each piece, check all possible moves and if it can stop check, return false
-            for piece in pieces:
-                start_row = piece[0]
-                start_col = piece[1]
-                for row in range(8):
-                    for col in range(8):
-                        if [row, col] in pieces:
-                            continue
-                        if self.is_valid_move(Move(start_row, start_col, row, col)):
-                            return False
-            return True
-        return False
+            if next(self.iter_legal_moves(player_checked), None) is None:
+                return GameStatus.Checkmate
+        # stop at the first legal move found, there is no need to list them all
+        elif next(self.iter_legal_moves(self.__player), None) is None:
+            return GameStatus.Stalemate
+        if insufficient_material(self._rows()):
+            return GameStatus.InsufficientMaterial
+        return GameStatus.Ongoing
 
     def is_valid_move(self, move: Move):
         piece = self.piece_at(move.from_row, move.from_col)
+        if not promotion_fits(move, piece):
+            self.messageCode = MoveValidity.Invalid
+            return False
+        # castling and en passant go by more than the piece's own rules
+        special = self.__special_moves(piece, move)
+        if special is not None:
+            if move in special:
+                self.messageCode = MoveValidity.Valid
+                return True
+            self.messageCode = MoveValidity.StayingInCheck if self.in_check(piece.player) else MoveValidity.Invalid
+            return False
         # use individual piece is_valid_move()
-        if not piece.is_valid_move(move, self.board):
+        if not piece.is_valid_move(move, self.__board):
             self.messageCode = MoveValidity.Invalid
             return False
         # check if moving into check
-        in_check_before = self.in_check(piece.player)
-        self.move(move)
-        if self.in_check(piece.player):
-            self.undo()
-            if in_check_before:
+        info = self.attack_info(piece.player)
+        if not self.__is_legal(move, piece, info):
+            if info.checkers:
                 self.messageCode = MoveValidity.StayingInCheck
                 return False
             else:
                 self.messageCode = MoveValidity.MovingIntoCheck
                 return False
-        self.undo()
         self.messageCode = MoveValidity.Valid
         return True
         # set __message_code correctly
 
+    def legal_moves(self, player: Optional[Player] = None) -> List[Move]:
+        """
+        Lists every legal move for a player, built from each piece's own targets() rather than trying all 64 squares.
+        :param player: Player whose moves you want. Defaults to the current player.
+        :return: A list of Moves, ordered by starting square and then by the order the piece generated them.
+        """
+        return list(self.iter_legal_moves(player))
+
+    def iter_legal_moves(self, player: Optional[Player] = None) -> Iterator[Move]:
+        """
+        Lazily yields the same moves as legal_moves(), so callers that only need the first one can stop early.
+        """
+        if player is None:
+            player = self.__player
+        board = self.__board
+        info = self.attack_info(player)
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece is None or piece.player != player:
+                    continue
+                # the squares this piece may land on without leaving its king in check
+                if piece.kind == KING:
+                    allowed = ~info.attacked
+                else:
+                    allowed = info.evasions & info.pins.get(row * 8 + col, ALL_SQUARES)
+                    if not allowed:
+                        continue
+                promotes = piece.kind == PAWN and row == (1 if player == Player.WHITE else 6)
+                for to_row, to_col in list(piece.targets(row, col, board)):
+                    if allowed >> (to_row * 8 + to_col) & 1:
+                        if promotes:
+                            for kind in PROMOTION_PIECES:
+                                yield Move(row, col, to_row, to_col, kind)
+                        else:
+                            yield Move(row, col, to_row, to_col)
+        yield from self.__castling_moves(player, info)
+        yield from self.__en_passant_moves(player)
+
+    def __castling_moves(self, player: Player, info: AttackInfo) -> Iterator[Move]:
+        if info.checkers or not self._castling:
+            return
+        board = self.__board
+        colour = BLACK_CODE if player == Player.BLACK else 0
+        for castle in CASTLES[player]:
+            if not self._castling & castle.right:
+                continue
+            row = castle.row
+            king, rook = board[row][4], board[row][castle.rook_from]
+            if king is None or king.code != KING + colour or rook is None or rook.code != ROOK + colour:
+                continue
+            if any(board[row][col] is not None for col in castle.empty):
+                continue
+            if any(info.attacked >> (row * 8 + col) & 1 for col in castle.passes):
+                continue
+            yield Move(row, 4, row, castle.king_to)
+
+    def __en_passant_moves(self, player: Player) -> Iterator[Move]:
+        # only the side to move can take en passant, and only straight away
+        if self._en_passant is None or player != self.__player:
+            return
+        board = self.__board
+        to_row, to_col = divmod(self._en_passant, 8)
+        row = to_row + 1 if player == Player.WHITE else to_row - 1
+        pawn = PAWN + (BLACK_CODE if player == Player.BLACK else 0)
+        for col in (to_col - 1, to_col + 1):
+            if 0 <= col < 8 and board[row][col] is not None and board[row][col].code == pawn:
+                # the capture takes two pieces off one row at once, which the pins can't account for, so play it
+                move = Move(row, col, to_row, to_col)
+                self.move(move)
+                safe = not self.in_check(player)
+                self.undo()
+                if safe:
+                    yield move
+
+    def __special_moves(self, piece: ChessPiece, move: Move) -> Optional[List[Move]]:
+        # the legal castling or en passant moves, if move is shaped like one, else None
+        if piece.kind == KING and move.from_col == 4 and move.to_row == move.from_row and \
+                abs(move.to_col - move.from_col) == 2:
+            return list(self.__castling_moves(piece.player, self.attack_info(piece.player)))
+        if piece.kind == PAWN and move.to_col != move.from_col and self._en_passant == move.to_row * 8 + move.to_col \
+                and self.__board[move.to_row][move.to_col] is None:
+            return list(self.__en_passant_moves(piece.player))
+        return None
+
+    def perft(self, depth: int) -> int:
+        """
+        Counts the leaf positions reachable in exactly depth moves from the current position. The standard
+        correctness (and speed) test for move generation: the counts for well-known positions are published.
+        :param depth: int number of moves (plies) to look ahead.
+        :return: int the number of leaf positions.
+        """
+        if depth <= 0:
+            return 1
+        moves = self.legal_moves()
+        # no need to play the last ply out, the number of moves is the number of leaves
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.move(move)
+            nodes += self.perft(depth - 1)
+            self.undo()
+        return nodes
+
+    def perft_divide(self, depth: int) -> Dict[str, int]:
+        """
+        Splits perft(depth) by the first move, which is how a wrong total is tracked down to the move that causes it.
+        :param depth: int number of moves (plies) to look ahead, including the first one.
+        :return: A dict of each legal move in UCI notation to the number of leaves below it.
+        """
+        divide = {}
+        for move in self.legal_moves():
+            self.move(move)
+            divide[move.uci()] = self.perft(depth - 1)
+            self.undo()
+        return divide
+
+    def __is_legal(self, move: Move, piece: ChessPiece, info: AttackInfo) -> bool:
+        # whether a move the piece can make by its own rules keeps its king out of check
+        to_sq = move.to_row * 8 + move.to_col
+        if piece.kind == KING:
+            return not info.attacked >> to_sq & 1
+        allowed = info.evasions & info.pins.get(move.from_row * 8 + move.from_col, ALL_SQUARES)
+        return bool(allowed >> to_sq & 1)
+
+    def attack_info(self, player: Optional[Player] = None) -> AttackInfo:
+        """
+        Works out the squares the opponent attacks, the pieces pinned to player's king and the pieces giving check,
+        which together decide whether a move is legal without playing it. Cached against the Zobrist hash, which
+        every way of changing the board keeps up to date.
+        :param player: Player whose king is looked at. Defaults to the current player.
+        :return: AttackInfo for player.
+        """
+        if player is None:
+            player = self.current_player
+        key = self._zobrist_hash
+        cached = self.__attack_cache.get(player)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        info = self.__find_attacks(self._rows(), player)
+        self.__attack_cache[player] = (key, info)
+        return info
+
+    def __find_attacks(self, board: List[List[ChessPiece]], player: Player) -> AttackInfo:
+        enemy = Player.BLACK if player == Player.WHITE else Player.WHITE
+        king = self.king_square(player)
+        king_sq = king[0] * 8 + king[1] if king is not None else -1
+
+        attacked = 0
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece is not None and piece.player == enemy:
+                    attacked |= _attacks_from(board, row, col, piece, king_sq)
+        if king is None:
+            return AttackInfo(attacked, [], ALL_SQUARES, {})
+
+        # walk out from the king: an enemy slider is a checker if nothing is in between, and pins the piece if
+        # exactly one of player's own pieces is
+        colour = BLACK_CODE if enemy == Player.BLACK else 0
+        king_row, king_col = king
+        checkers = []
+        evasions = 0
+        pins = {}
+        for directions, slider in ((ORTHOGONAL, ROOK + colour), (DIAGONAL, BISHOP + colour)):
+            for d_row, d_col in directions:
+                ray = 0
+                own = -1
+                r, c = king_row + d_row, king_col + d_col
+                while 0 <= r < 8 and 0 <= c < 8:
+                    ray |= 1 << (r * 8 + c)
+                    piece = board[r][c]
+                    if piece is not None:
+                        if piece.player == player:
+                            if own >= 0:
+                                break
+                            own = r * 8 + c
+                        else:
+                            if piece.code == slider or piece.code == QUEEN + colour:
+                                if own < 0:
+                                    checkers.append(r * 8 + c)
+                                    evasions |= ray
+                                else:
+                                    pins[own] = ray
+                            break
+                    r += d_row
+                    c += d_col
+        for d_row, d_col in KNIGHT_OFFSETS:
+            r, c = king_row + d_row, king_col + d_col
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] is not None and board[r][c].code == KNIGHT + colour:
+                checkers.append(r * 8 + c)
+                evasions |= 1 << (r * 8 + c)
+        # pawns capture diagonally forward, so look one row behind them
+        r = king_row + 1 if enemy == Player.WHITE else king_row - 1
+        if 0 <= r < 8:
+            for c in (king_col - 1, king_col + 1):
+                if 0 <= c < 8 and board[r][c] is not None and board[r][c].code == PAWN + colour:
+                    checkers.append(r * 8 + c)
+                    evasions |= 1 << (r * 8 + c)
+
+        if not checkers:
+            evasions = ALL_SQUARES
+        elif len(checkers) > 1:
+            # only the king can get out of a double check
+            evasions = 0
+        return AttackInfo(attacked, checkers, evasions, pins)
+
     def move(self, move: Move):
-        # Store the state of the board before the move
-        old_board = [row.copy() for row in self.board]
+        board = self.__board
+        piece = board[move.from_row][move.from_col]
+        captured = board[move.to_row][move.to_col]
+        player = self.__player
+        old_hash = self._zobrist_hash
+        old_evaluation = self._evaluation
+        old_castling = self._castling
+        old_en_passant = self._en_passant
+        from_sq = move.from_row * 8 + move.from_col
+        to_sq = move.to_row * 8 + move.to_col
+        kind = piece.kind
+
+        # a pawn taking en passant captures the pawn beside it, not on the square it moves to
+        capture_row = move.to_row
+        if kind == PAWN and to_sq == old_en_passant and captured is None:
+            capture_row = move.from_row
+            captured = board[capture_row][move.to_col]
+            board[capture_row][move.to_col] = None
 
         # Carry out the move
-        self.board[move.to_row][move.to_col] = self.board[move.from_row][move.from_col]
-        self.board[move.from_row][move.from_col] = None
+        board[move.to_row][move.to_col] = piece
+        board[move.from_row][move.from_col] = None
+        h = old_hash ^ piece_key(piece, move.from_row, move.from_col)
+        score = old_evaluation - SQUARE_SCORES[piece.code][from_sq]
+        squares = self.__piece_squares
+        squares[piece.code].discard((move.from_row, move.from_col))
+        if captured is not None:
+            h ^= piece_key(captured, capture_row, move.to_col)
+            score -= SQUARE_SCORES[captured.code][capture_row * 8 + move.to_col]
+            squares[captured.code].discard((capture_row, move.to_col))
 
         # pawn promotion
-        piece = self.board[move.to_row][move.to_col]
-        if piece.type() == 'Pawn':
+        en_passant = None
+        if kind == PAWN:
             if (piece.player == Player.WHITE and move.to_row == 0) or (piece.player == Player.BLACK and move.to_row == 7):
-                self.set_piece(move.to_row, move.to_col, Queen(piece.player))
+                board[move.to_row][move.to_col] = PROMOTION_PIECES[move.promotion or QUEEN](piece.player)
+            elif abs(move.to_row - move.from_row) == 2:
+                en_passant = en_passant_target(board, (move.from_row + move.to_row) // 2 * 8 + move.to_col,
+                                               Player.BLACK if player == Player.WHITE else Player.WHITE)
+        elif kind == KING:
+            self.__king_squares[piece.player] = (move.to_row, move.to_col)
+            if abs(move.to_col - move.from_col) == 2:
+                # castling: the rook jumps over the king
+                row = move.to_row
+                rook_from, rook_to = (7, 5) if move.to_col == 6 else (0, 3)
+                rook = board[row][rook_from]
+                board[row][rook_to] = rook
+                board[row][rook_from] = None
+                h ^= piece_key(rook, row, rook_from) ^ piece_key(rook, row, rook_to)
+                score += SQUARE_SCORES[rook.code][row * 8 + rook_to] - SQUARE_SCORES[rook.code][row * 8 + rook_from]
+                squares[rook.code].discard((row, rook_from))
+                squares[rook.code].add((row, rook_to))
+        placed = board[move.to_row][move.to_col]
+        squares[placed.code].add((move.to_row, move.to_col))
+        h ^= piece_key(placed, move.to_row, move.to_col)
+
+        # castling rights, en passant square and halfmove clock
+        castling = old_castling & CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        if castling != old_castling:
+            h ^= CASTLING_KEYS[old_castling] ^ CASTLING_KEYS[castling]
+        if old_en_passant is not None:
+            h ^= EN_PASSANT_KEYS[old_en_passant % 8]
+        if en_passant is not None:
+            h ^= EN_PASSANT_KEYS[en_passant % 8]
+        self._castling = castling
+        self._en_passant = en_passant
+        old_halfmove = self._halfmove_clock
+        self._halfmove_clock = 0 if kind == PAWN or captured is not None else old_halfmove + 1
+        self._zobrist_hash = h
+        self._evaluation = score + SQUARE_SCORES[placed.code][to_sq]
         self.set_next_player()
 
-        # Store the move and the old state of the board in move_history
-        self.move_history.append(old_board)
+        # Store only what changed so undo() can put it back without copying the board
+        self.move_history.append(MoveRecord(move, piece, captured, player, old_hash, old_evaluation, old_castling,
+                                            old_en_passant, old_halfmove))
 
     def in_check(self, p: Player):
-        # get the position of player p's king
+        king_pos = self.king_square(p)
+        if king_pos is None:
+            return False
+        return self.is_attacked(king_pos[0], king_pos[1], Player.BLACK if p == Player.WHITE else Player.WHITE)
+
+    def king_square(self, p: Player) -> Optional[Tuple[int, int]]:
+        """
+        Returns where player p's king stands, without scanning the board.
+        :param p: Player whose king you are looking for.
+        :return: A (row, col) tuple, or None if p has no king on the board.
+        """
+        return self.__king_squares.get(p)
+
+    def is_attacked(self, row: int, col: int, by: Player) -> bool:
+        """
+        Checks whether any of player by's pieces could capture on (row, col). Works outward from the square along
+        rook and bishop rays and the knight, pawn and king offsets instead of trying every enemy piece.
+        :param row: int row of the square being attacked.
+        :param col: int column of the square being attacked.
+        :param by: Player the attacking side.
+        :return: True if the square is attacked.
+        """
+        board = self.__board
+        colour = BLACK_CODE if by == Player.BLACK else 0
+        queen = QUEEN + colour
+
+        # sliding pieces: walk each ray until the first piece
+        for d_row, d_col in ORTHOGONAL:
+            r, c = row + d_row, col + d_col
+            while 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece is not None:
+                    if piece.code == ROOK + colour or piece.code == queen:
+                        return True
+                    break
+                r += d_row
+                c += d_col
+        for d_row, d_col in DIAGONAL:
+            r, c = row + d_row, col + d_col
+            while 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece is not None:
+                    if piece.code == BISHOP + colour or piece.code == queen:
+                        return True
+                    break
+                r += d_row
+                c += d_col
+
+        for d_row, d_col in KNIGHT_OFFSETS:
+            r, c = row + d_row, col + d_col
+            if 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece is not None and piece.code == KNIGHT + colour:
+                    return True
+
+        for d_row, d_col in KING_OFFSETS:
+            r, c = row + d_row, col + d_col
+            if 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece is not None and piece.code == KING + colour:
+                    return True
+
+        # pawns capture diagonally forward, so look one row behind them
+        r = row + 1 if by == Player.WHITE else row - 1
+        if 0 <= r < 8:
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece is not None and piece.code == PAWN + colour:
+                        return True
+        return False
+
+    def __index_pieces(self):
+        # the squares each kind of piece stands on, by piece code, so find_piece() doesn't have to scan the board
+        self.__piece_squares = [set() for _ in range(KING + BLACK_CODE + 1)]
         for i in range(8):
             for j in range(8):
-                piece = self.piece_at(i, j)
-                if isinstance(piece, ChessPiece):
-                    if piece.type() == 'King' and piece.player == p:
-                        king_pos = (i, j)
-                        break
+                piece = self.__board[i][j]
+                if piece is not None:
+                    self.__piece_squares[piece.code].add((i, j))
 
-        # for each of the opponents pieces, if said piece could take the king, return True
+    def __locate_kings(self):
+        self.__king_squares = {}
         for i in range(8):
             for j in range(8):
-                piece = self.piece_at(i, j)
-                if isinstance(piece, ChessPiece):
-                    if piece.player != p and piece.player is not None:
-                        if piece.is_valid_move(Move(i, j, king_pos[0], king_pos[1]), self.board):
-                            return True
-        return False
+                piece = self.__board[i][j]
+                if piece is not None and piece.kind == KING:
+                    self.__king_squares[piece.player] = (i, j)
 
     def piece_at(self, row: int, col: int):
         try:
-            return self.board[row][col]
+            return self.__board[row][col]
         except IndexError:
             return None
         # returns piece at row, col
 
     def set_next_player(self):
         self.__player = Player.WHITE if self.__player == Player.BLACK else Player.BLACK
+        self._zobrist_hash ^= BLACK_TO_MOVE
         # sets next player
 
     def set_piece(self, row: int, col: int, piece: ChessPiece):
@@ -200,35 +856,151 @@ class ChessModel:
         elif not isinstance(piece, ChessPiece):
             raise TypeError
         else:
-            self.board[row][col] = piece
+            self.__write(row, col, piece)
         # puts piece at row, col
 
+    def __write(self, row: int, col: int, piece: Optional[ChessPiece]):
+        # set_piece() and writes to a board square; None empties the square
+        if piece is not None and not isinstance(piece, ChessPiece):
+            raise TypeError
+        replaced = self.__board[row][col]
+        self.__board[row][col] = piece
+        if replaced is not None:
+            self._zobrist_hash ^= piece_key(replaced, row, col)
+            self._evaluation -= SQUARE_SCORES[replaced.code][row * 8 + col]
+            self.__piece_squares[replaced.code].discard((row, col))
+        if piece is not None:
+            self._zobrist_hash ^= piece_key(piece, row, col)
+            self._evaluation += SQUARE_SCORES[piece.code][row * 8 + col]
+            self.__piece_squares[piece.code].add((row, col))
+        if piece is not None and piece.kind == KING:
+            self.__king_squares[piece.player] = (row, col)
+        elif replaced is not None and replaced.kind == KING and self.__king_squares.get(replaced.player) == (row, col):
+            self.__locate_kings()
+        # an edited position keeps only the castling rights its kings and rooks still allow, and no en passant
+        self._set_rules(self._castling & castling_from_board(self.__board), None)
+
     def undo(self):
         # Undoes the most recent not undone move
         if len(self.move_history) == 0:
             raise UndoException
 
-        # Pop the last move and the old state of the board from move_history
-        old_board = self.move_history.pop()
+        # Pop the last move and put the moved and captured pieces back where they were
+        move, piece, captured, player, old_hash, old_evaluation, castling, en_passant, halfmove = \
+            self.move_history.pop()
+        board = self.__board
+        squares = self.__piece_squares
+        placed = board[move.to_row][move.to_col]
+        if placed is not None:
+            squares[placed.code].discard((move.to_row, move.to_col))
+        squares[piece.code].add((move.from_row, move.from_col))
+        board[move.from_row][move.from_col] = piece
+        board[move.to_row][move.to_col] = None
+        if captured is not None:
+            # a pawn landing on the en passant square took the pawn beside it
+            capture_row = move.to_row
+            if piece.kind == PAWN and move.to_row * 8 + move.to_col == en_passant:
+                capture_row = move.from_row
+            board[capture_row][move.to_col] = captured
+            squares[captured.code].add((capture_row, move.to_col))
+        if piece.kind == KING:
+            self.__king_squares[piece.player] = (move.from_row, move.from_col)
+            if abs(move.to_col - move.from_col) == 2:
+                row = move.to_row
+                rook_from, rook_to = (7, 5) if move.to_col == 6 else (0, 3)
+                rook = board[row][rook_to]
+                board[row][rook_from] = rook
+                board[row][rook_to] = None
+                squares[rook.code].discard((row, rook_to))
+                squares[rook.code].add((row, rook_from))
+        self.__player = player
+        self._zobrist_hash = old_hash
+        self._evaluation = old_evaluation
+        self._castling = castling
+        self._en_passant = en_passant
+        self._halfmove_clock = halfmove
 
-        # Restore the board to its old state
-        self.board = old_board
-        self.set_next_player()
+    @property
+    def engine(self) -> SearchEngine:
+        # created on first use and kept, so its transposition table carries over from one move to the next
+        if self.__engine is None:
+            self.__engine = SearchEngine()
+        return self.__engine
+
+    @engine.setter
+    def engine(self, new_engine: SearchEngine):
+        if isinstance(new_engine, (SearchEngine, ParallelSearch)):
+            self.__engine = new_engine
+
+    @property
+    def book(self):
+        """
+        The opening book (book.OpeningBook) ai() plays from while the position is in it, or None.
+        """
+        return self.__book
+
+    @book.setter
+    def book(self, new_book):
+        self.__book = new_book
+
+    def __getstate__(self):
+        # copies of the model (for worker processes, or copy.deepcopy) get the position but not the search engine
+        # or the book
+        state = self.__dict__.copy()
+        state['_ChessModel__engine'] = None
+        state['_ChessModel__book'] = None
+        return state
+
+    def search(self, depth: Optional[int] = None, movetime: Optional[float] = None, nodes: Optional[int] = None,
+               on_iteration: Optional[Callable[[SearchResult], None]] = None) -> SearchResult:
+        """
+        Searches for the best move for the current player without making it. Swap in a SearchEngine with a
+        different evaluation, or a ParallelSearch to use several processes, through the engine property.
+        :param depth: int deepest iteration to run.
+        :param movetime: float seconds to spend at most.
+        :param nodes: int positions to visit at most.
+        :param on_iteration: called with the SearchResult of each completed iteration.
+        :return: SearchResult with the chosen move, its score and the search statistics.
+        """
+        return self.engine.search(self, depth, movetime, nodes, on_iteration=on_iteration)
 
-    def ai(self) -> bool:
-        # get out of check
+    def ai(self, mode: AIMode = AIMode.Heuristic, depth: Optional[int] = None, movetime: Optional[float] = None,
+           nodes: Optional[int] = None) -> bool:
+        """
+        Makes a move for the current player, chosen by choose_move().
+        :return: bool True if there was no move to make.
+        """
+        move = self.choose_move(mode, depth, movetime, nodes)
+        if move is None:
+            return True
+        self.move(move)
+        return False
+
+    def choose_move(self, mode: AIMode = AIMode.Heuristic, depth: Optional[int] = None,
+                    movetime: Optional[float] = None, nodes: Optional[int] = None,
+                    on_iteration: Optional[Callable[[SearchResult], None]] = None) -> Optional[Move]:
+        """
+        Picks the move ai() would make, without making it: from the opening book if one is set and has the
+        position, otherwise by the given mode.
+        :param mode: AIMode Heuristic picks from the MoveTypes buckets, Search runs search() with the given limits.
+        :param on_iteration: passed on to search().
+        :return: Move, or None if there is no move to make.
+        """
+        # a book move costs one lookup where a search would have been run on the same position every game
+        move = self.__book.choose(self) if self.__book is not None else None
+        if move is not None:
+            return move
+        if mode == AIMode.Search:
+            return self.search(depth, movetime, nodes, on_iteration).move
         if self.in_check(self.current_player):
             # move out of check
-            self.move(self.possible_moves(MoveTypes.StopCheck, self.current_player))
-        elif self.possible_moves(MoveTypes.MakeCheck, self.current_player):
-            # check king with most expensive piece
-            self.move(self.possible_moves(MoveTypes.MakeCheck, self.current_player))
-        elif self.possible_moves(MoveTypes.StopThreat, self.current_player):
-            # move most expensive piece under threat
-            self.move(self.possible_moves(MoveTypes.StopThreat, self.current_player))
-        else:
-            # move forward
-            self.move(self.possible_moves(MoveTypes.Advance, self.current_player))
+            return self.possible_moves(MoveTypes.StopCheck, self.current_player)
+        # check king with most expensive piece, else move most expensive piece under threat, else move forward
+        for type_move in (MoveTypes.MakeCheck, MoveTypes.StopThreat, MoveTypes.Advance):
+            move = self.possible_moves(type_move, self.current_player)
+            if move is not None:
+                return move
+        return None
 
     def find_piece(self, comp: ChessPiece) -> List[Tuple[int, int]]:
         """
@@ -236,14 +1008,8 @@ class ChessModel:
         :param comp: ChessPiece an example of the specific piece you are looking for with the player set correctly.
         :return: A list of tuples with the row and col of the pieces that have the same color and class as comp.
         """
-        r = []
-        for i in range(8):
-            for j in range(8):
-                temp = self.piece_at(i, j)
-                if isinstance(temp, ChessPiece):
-                    if str(temp) == str(comp):
-                        r.append((i, j))
-        return r
+        # the index is kept by move(), undo(), set_piece() and writes to the board
+        return sorted(self.__piece_squares[comp.code])
 
     # get all poss_moves for type, then order them and return
     def possible_moves(self, type_move: MoveTypes, player: Player):
@@ -255,33 +1021,120 @@ class ChessModel:
         :return: Move The median of all moves that the lowest ranking piece can make.
         """
         piece_order = [King(player), Queen(player), Rook(player), Bishop(player), Knight(player), Pawn(player)]
+        board = self._rows()
         poss_moves = []
         for piece_type in piece_order[::-1]:
             for piece in self.find_piece(piece_type):
-                for row in range(8):
-                    for col in range(8):
-                        temp_move = Move(piece[0], piece[1], row, col)
-                        if not self.is_valid_move(temp_move):
+                for row, col in sorted(piece_type.targets(piece[0], piece[1], board)):
+                    temp_move = Move(piece[0], piece[1], row, col)
+                    if not self.is_valid_move(temp_move):
+                        continue
+                    # Find checks to make
+                    if type_move == MoveTypes.MakeCheck:
+                        self.move(temp_move)
+                        if self.in_check(Player.BLACK if player == Player.WHITE else player):
+                            poss_moves = [temp_move] + poss_moves
+                        self.undo()
+
+                    # Stop pieces from being taken
+                    elif type_move == MoveTypes.StopThreat:
+                        if self.piece_at(row, col) is None:
                             continue
-                        # Find checks to make
-                        if type_move == MoveTypes.MakeCheck:
-                            self.move(temp_move)
-                            if self.in_check(Player.BLACK if player == Player.WHITE else player):
-                                poss_moves = [temp_move] + poss_moves
-                            self.undo()
-
-                        # Stop pieces from being taken
-                        elif type_move == MoveTypes.StopThreat:
-                            if self.piece_at(row, col) is None:
-                                continue
-                            elif self.is_valid_move(Move(row, col, piece[0], piece[1])):
-                                for new_row in range(8):
-                                    for new_col in range(8):
-                                        new_move = Move(piece[0], piece[1], new_row, new_col)
-                                        if self.is_valid_move(new_move):
-                                            poss_moves = [new_move] + poss_moves
-                        # if in check or advancing, append all moves
-                        else:
-                            poss_moves.append(temp_move)
+                        elif self.is_valid_move(Move(row, col, piece[0], piece[1])):
+                            for new_row, new_col in sorted(piece_type.targets(piece[0], piece[1], board)):
+                                new_move = Move(piece[0], piece[1], new_row, new_col)
+                                if self.is_valid_move(new_move):
+                                    poss_moves = [new_move] + poss_moves
+                    # if in check or advancing, append all moves
+                    else:
+                        poss_moves.append(temp_move)
             if len(poss_moves) > 0:
                 return poss_moves[len(poss_moves) // 2]
+
+
+def castling_from_board(board: List[List[ChessPiece]]) -> int:
+    """
+    Returns the castling rights a board could still have: those whose king and rook stand on their home squares.
+    """
+    rights = 0
+    for castle in CASTLES[Player.WHITE] + CASTLES[Player.BLACK]:
+        colour = BLACK_CODE if castle.player == Player.BLACK else 0
+        king, rook = board[castle.row][4], board[castle.row][castle.rook_from]
+        if king is not None and king.code == KING + colour and rook is not None and rook.code == ROOK + colour:
+            rights |= castle.right
+    return rights
+
+
+def en_passant_target(board: List[List[ChessPiece]], square: int, player: Player) -> Optional[int]:
+    """
+    Returns square, the one a pawn just skipped over, if one of player's pawns stands ready to take en passant on
+    it, else None. Keeping the square only when it matters means positions that differ in nothing else hash alike.
+    """
+    row, col = divmod(square, 8)
+    # the pawn that moved two squares is one row past the skipped square, seen from player's side
+    pawn_row = row + 1 if player == Player.WHITE else row - 1
+    pawn = PAWN + (BLACK_CODE if player == Player.BLACK else 0)
+    if not 0 <= pawn_row < 8:
+        return None
+    for c in (col - 1, col + 1):
+        if 0 <= c < 8 and board[pawn_row][c] is not None and board[pawn_row][c].code == pawn:
+            return square
+    return None
+
+
+def insufficient_material(board: List[List[ChessPiece]]) -> bool:
+    """
+    Whether neither side has enough left to mate: bare kings, or a king and a single knight or bishop against a
+    bare king.
+    """
+    minors = 0
+    for row in board:
+        for piece in row:
+            if piece is None or piece.kind == KING:
+                continue
+            if piece.kind != KNIGHT and piece.kind != BISHOP:
+                return False
+            minors += 1
+            if minors > 1:
+                return False
+    return True
+
+
+def promotion_fits(move: Move, piece: ChessPiece) -> bool:
+    """
+    Whether the promotion piece a move names, if any, goes with it: only a pawn reaching the last rank can be
+    promoted, and only to a knight, bishop, rook or queen.
+    """
+    if move.promotion is None:
+        return True
+    return piece.kind == PAWN and move.to_row in (0, 7) and move.promotion in PROMOTION_PIECES
+
+
+def _attacks_from(board: List[List[ChessPiece]], row: int, col: int, piece: ChessPiece, transparent: int) -> int:
+    # bitmask of the squares piece on (row, col) attacks, defended squares included; sliders see through the square
+    # numbered transparent, which is the defending king
+    kind = piece.kind
+    attacks = 0
+    if kind == PAWN:
+        r = row - 1 if piece.player == Player.WHITE else row + 1
+        if 0 <= r < 8:
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8:
+                    attacks |= 1 << (r * 8 + c)
+        return attacks
+    if kind == KNIGHT or kind == KING:
+        for d_row, d_col in KNIGHT_OFFSETS if kind == KNIGHT else KING_OFFSETS:
+            r, c = row + d_row, col + d_col
+            if 0 <= r < 8 and 0 <= c < 8:
+                attacks |= 1 << (r * 8 + c)
+        return attacks
+    directions = ORTHOGONAL if kind == ROOK else DIAGONAL if kind == BISHOP else KING_OFFSETS
+    for d_row, d_col in directions:
+        r, c = row + d_row, col + d_col
+        while 0 <= r < 8 and 0 <= c < 8:
+            attacks |= 1 << (r * 8 + c)
+            if board[r][c] is not None and r * 8 + c != transparent:
+                break
+            r += d_row
+            c += d_col
+    return attacks
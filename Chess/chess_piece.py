@@ -1,16 +1,50 @@
 from abc import ABC, abstractmethod
 from player import Player
 from move import Move
-from typing import List
+from typing import Iterator, List, Tuple
+
+# Directions and offsets (row, col) that pieces move along
+ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ORTHOGONAL + DIAGONAL
+
+# Piece kinds, numbered in order of value so they double as ranks for move ordering
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+# Added to a kind to get a black piece's code; a white piece's code is its kind
+BLACK_CODE = 8
 
 
 class ChessPiece(ABC):
+    """
+    Pieces are immutable and shared: constructing a piece returns the one instance of that class and colour, so
+    Pawn(Player.WHITE) is Pawn(Player.WHITE). Compare pieces by identity or by their integer code, never by str().
+    """
+
+    __slots__ = ('player', 'code')
+    # set by each subclass to one of the kinds above
+    kind = 0
+    __instances = {}
+
+    def __new__(cls, player: Player):
+        piece = ChessPiece.__instances.get((cls, player))
+        if piece is None:
+            piece = super().__new__(cls)
+            object.__setattr__(piece, 'player', player)
+            object.__setattr__(piece, 'code', cls.kind + (BLACK_CODE if player == Player.BLACK else 0))
+            ChessPiece.__instances[(cls, player)] = piece
+        return piece
+
     def __init__(self, player: Player):
-        self.__player = player
+        # everything is set up once, in __new__
+        pass
 
-    @property
-    def player(self):
-        return self.__player
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} pieces are shared and cannot be changed')
+
+    def __reduce__(self):
+        # pickling and copying hand back the shared instance
+        return type(self), (self.player,)
 
     @abstractmethod
     def __str__(self):
@@ -20,6 +54,38 @@ class ChessPiece(ABC):
     def type(self):
         pass
 
+    @abstractmethod
+    def targets(self, row: int, col: int, board: List[List['ChessPiece']]) -> Iterator[Tuple[int, int]]:
+        """
+        Yields every square this piece, standing on (row, col), could move to by its own movement rules. Whether the
+        move would leave its king in check is up to the model.
+        """
+        pass
+
+    def _slide(self, row: int, col: int, board: List[List['ChessPiece']], directions) -> Iterator[Tuple[int, int]]:
+        # walk each direction until the edge of the board or the first piece, which can be captured if it's an enemy
+        for d_row, d_col in directions:
+            r, c = row + d_row, col + d_col
+            while 0 <= r < 8 and 0 <= c < 8:
+                target = board[r][c]
+                if target is None:
+                    yield r, c
+                else:
+                    if target.player != self.player:
+                        yield r, c
+                    break
+                r += d_row
+                c += d_col
+
+    def _step(self, row: int, col: int, board: List[List['ChessPiece']], offsets) -> Iterator[Tuple[int, int]]:
+        # jump to each offset that is on the board and not occupied by a friendly piece
+        for d_row, d_col in offsets:
+            r, c = row + d_row, col + d_col
+            if 0 <= r < 8 and 0 <= c < 8:
+                target = board[r][c]
+                if target is None or target.player != self.player:
+                    yield r, c
+
     def is_valid_move(self, move: Move, board: List[List['ChessPiece']]) -> bool:
         # Verifies indices associated with move are within bounds
         if not (0 <= move.from_row < len(board) and 0 <= move.from_col < len(board[0])
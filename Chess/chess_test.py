@@ -1,5 +1,29 @@
+import io
+import json
+import os
+import pickle
+import tempfile
+import threading
 import unittest
-from chess_model import ChessModel, MoveTypes
+from chess_model import ALL_SQUARES, AIMode, ChessModel, GameStatus, MoveTypes, MoveValidity, UndoException, \
+    BLACK_KINGSIDE, BLACK_QUEENSIDE, WHITE_QUEENSIDE
+from chess_piece import BISHOP, KNIGHT, QUEEN, ROOK
+from bitboard_model import BitboardChessModel
+from perft import REFERENCE_POSITIONS
+from fen import FENError, STARTING_FEN, read_positions
+from pgn import PGNError, analyse_games, read_games, replay, san_to_move
+from zobrist import hash_board
+from transposition import Bound, TranspositionTable
+from search import MATE_SCORE, MATE_THRESHOLD, SearchEngine
+from evaluation import evaluate, evaluate_board, square_score
+from move_ordering import MoveOrderer
+from parallel_search import ParallelSearch, map_in_order
+from book import BookBuilder, BookError, OpeningBook, decode_move, encode_move
+from legal_move_cache import LegalMoveCache
+from ai_worker import AIWorker
+from instrumentation import Instrumentation
+from uci import UCIEngine, UCIError, allot_time, format_score, parse_go, uci_to_move
+from tournament import EngineConfig, Standings, parse_engine, play_game, result_to_json, run_tournament
 from pawn import Pawn
 from rook import Rook
 from knight import Knight
@@ -390,10 +414,74 @@ class TestKing(unittest.TestCase):
                          False, 'King can capture pieces of the same color - FIX IT.')
 
 
+class TestTargets(unittest.TestCase):
+    white_pawn = Pawn(Player.WHITE)
+    black_pawn = Pawn(Player.BLACK)
+    rook = Rook(Player.WHITE)
+    knight = Knight(Player.BLACK)
+    b = [
+        [None, None, None, None, None, None, None, None],
+        [None, None, None, None, None, None, None, None],
+        [None, None, None, None, None, None, None, None],
+        [None, None, None, None, None, None, None, None],
+        [None, None, None, None, None, None, None, None],
+        [None, black_pawn, None, None, None, None, None, None],
+        [white_pawn, None, None, None, None, None, None, None],
+        [rook, knight, None, None, None, None, None, None],
+    ]
+
+    def test_pawn_targets(self):
+        self.assertEqual(sorted(self.white_pawn.targets(6, 0, self.b)), [(4, 0), (5, 0), (5, 1)])
+
+    def test_rook_targets_blocked(self):
+        # own pawn above, enemy knight to the right
+        self.assertEqual(sorted(self.rook.targets(7, 0, self.b)), [(7, 1)])
+
+    def test_knight_targets(self):
+        self.assertEqual(sorted(self.knight.targets(7, 1, self.b)), [(5, 0), (5, 2), (6, 3)])
+
+    def test_targets_match_is_valid_move(self):
+        for piece in [Queen(Player.WHITE), Bishop(Player.WHITE), King(Player.WHITE)]:
+            board = [[None] * 8 for _ in range(8)]
+            board[4][3] = piece
+            board[2][1] = Pawn(Player.BLACK)
+            board[4][5] = Pawn(Player.WHITE)
+            expected = [(r, c) for r in range(8) for c in range(8) if piece.is_valid_move(Move(4, 3, r, c), board)]
+            self.assertEqual(sorted(piece.targets(4, 3, board)), expected, f'{piece} targets not set correctly')
+
+
+class TestSharedPieces(unittest.TestCase):
+    def test_one_instance_per_class_and_colour(self):
+        self.assertIs(Pawn(Player.WHITE), Pawn(Player.WHITE))
+        self.assertIsNot(Pawn(Player.WHITE), Pawn(Player.BLACK))
+        self.assertIsNot(Queen(Player.WHITE), King(Player.WHITE))
+
+    def test_codes_are_distinct(self):
+        pieces = [kind(player) for kind in (Pawn, Knight, Bishop, Rook, Queen, King)
+                  for player in (Player.WHITE, Player.BLACK)]
+        self.assertEqual(len({piece.code for piece in pieces}), 12)
+
+    def test_pieces_cannot_be_changed(self):
+        with self.assertRaises(AttributeError):
+            Rook(Player.WHITE).player = Player.BLACK
+        self.assertEqual(Rook(Player.WHITE).player, Player.WHITE)
+
+    def test_pickle_returns_shared_piece(self):
+        self.assertIs(pickle.loads(pickle.dumps(Knight(Player.BLACK))), Knight(Player.BLACK))
+
+    def test_moves_compare_by_value(self):
+        self.assertEqual(Move(6, 4, 4, 4), Move(6, 4, 4, 4))
+        self.assertNotEqual(Move(6, 4, 4, 4), Move(6, 4, 5, 4))
+        self.assertEqual(len({Move(6, 4, 4, 4), Move(6, 4, 4, 4)}), 1)
+        self.assertFalse(hasattr(Move(6, 4, 4, 4), '__dict__'))
+
+
 class TestUndo(unittest.TestCase):
+    model_class = ChessModel
+
     # Setting up the Game Board
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
 
     def test_undo(self):
         # Create a Pawn at (1, 1)
@@ -411,10 +499,43 @@ class TestUndo(unittest.TestCase):
         self.assertEqual(self.game.piece_at(1, 1), pawn)
         self.assertEqual(self.game.piece_at(2, 1), None)
 
+    def test_undo_capture(self):
+        # White knight takes a black pawn, then takes it back
+        knight = self.game.piece_at(7, 1)
+        pawn = Pawn(Player.BLACK)
+        self.game.set_piece(5, 2, pawn)
+        self.game.move(Move(7, 1, 5, 2))
+        self.game.undo()
+
+        self.assertEqual(self.game.piece_at(7, 1), knight)
+        self.assertEqual(self.game.piece_at(5, 2), pawn)
+        self.assertEqual(self.game.current_player, Player.WHITE)
+
+    def test_undo_promotion(self):
+        pawn = Pawn(Player.WHITE)
+        self.game.board[0][0] = None
+        self.game.set_piece(1, 0, pawn)
+        self.game.move(Move(1, 0, 0, 0))
+        self.assertEqual(self.game.piece_at(0, 0).type(), 'Queen')
+
+        self.game.undo()
+        self.assertEqual(self.game.piece_at(1, 0), pawn)
+        self.assertIsNone(self.game.piece_at(0, 0))
+
+    def test_undo_empty(self):
+        with self.assertRaises(UndoException):
+            self.game.undo()
+
+    def test_undo_does_not_copy_board(self):
+        self.game.move(Move(6, 4, 4, 4))
+        self.assertNotIsInstance(self.game.move_history[-1], list)
+
 
 class TestInCheck(unittest.TestCase):
+    model_class = ChessModel
+
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
         self.queen = Queen(Player.WHITE)
         self.king = King(Player.BLACK)
         self.game.set_piece(4, 4, self.queen)
@@ -424,11 +545,32 @@ class TestInCheck(unittest.TestCase):
         # The black king should be in check from the white queen
         self.assertTrue(self.game.in_check(Player.BLACK))
 
+    def test_king_square_follows_moves(self):
+        self.assertEqual(self.game.king_square(Player.BLACK), (2, 2))
+        self.game.current_player = Player.BLACK
+        self.game.move(Move(2, 2, 3, 2))
+        self.assertEqual(self.game.king_square(Player.BLACK), (3, 2))
+        self.game.undo()
+        self.assertEqual(self.game.king_square(Player.BLACK), (2, 2))
+
+    def test_blocked_ray(self):
+        self.game.set_piece(3, 3, Pawn(Player.BLACK))
+        self.assertFalse(self.game.in_check(Player.BLACK))
+
+    def test_knight_and_pawn_attacks(self):
+        game = self.model_class()
+        self.assertTrue(game.is_attacked(5, 2, Player.WHITE))
+        self.assertTrue(game.is_attacked(5, 3, Player.WHITE))
+        self.assertFalse(game.is_attacked(4, 3, Player.WHITE))
+        self.assertTrue(game.is_attacked(2, 0, Player.BLACK))
+
 
 class TestIsValidMove(unittest.TestCase):
+    model_class = ChessModel
+
     # Setting up the game board
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
 
     def test_is_valid_move(self):
         # Create a Pawn at position (1,1)
@@ -445,8 +587,10 @@ class TestIsValidMove(unittest.TestCase):
 
 
 class TestIsComplete(unittest.TestCase):
+    model_class = ChessModel
+
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
 
     def test_is_complete_fail(self):
         # The game should be incomplete as no moves have been made.
@@ -468,11 +612,73 @@ class TestIsComplete(unittest.TestCase):
         ]
 
         self.assertTrue(self.game.is_complete())
+        self.assertEqual(self.game.is_complete(), GameStatus.Checkmate)
+
+    def test_stalemate(self):
+        # black to move, not in check, and every king move walks into the queen
+        self.game.board = [[None] * 8 for _ in range(8)]
+        self.game.set_piece(0, 0, King(Player.BLACK))
+        self.game.set_piece(2, 1, Queen(Player.WHITE))
+        self.game.set_piece(7, 7, King(Player.WHITE))
+        self.game.current_player = Player.BLACK
+        self.assertEqual(self.game.is_complete(), GameStatus.Stalemate)
+        self.assertTrue(self.game.is_complete())
+
+    def test_ongoing_check(self):
+        self.game.board = [[None] * 8 for _ in range(8)]
+        self.game.set_piece(0, 0, King(Player.BLACK))
+        self.game.set_piece(0, 7, Rook(Player.WHITE))
+        self.game.set_piece(7, 7, King(Player.WHITE))
+        self.game.current_player = Player.BLACK
+        self.assertEqual(self.game.is_complete(), GameStatus.Ongoing)
+        self.assertFalse(self.game.is_complete())
+
+    def test_status_follows_direct_board_edit(self):
+        self.game.board = [[None] * 8 for _ in range(8)]
+        self.game.set_piece(0, 0, King(Player.BLACK))
+        self.game.set_piece(0, 7, Rook(Player.WHITE))
+        self.game.set_piece(7, 7, King(Player.WHITE))
+        self.game.current_player = Player.BLACK
+        self.assertEqual(self.game.is_complete(), GameStatus.Ongoing)
+        # a second rook covering row 1 makes it mate, without the hash knowing
+        self.game.board[1][7] = Rook(Player.WHITE)
+        self.assertEqual(self.game.is_complete(), GameStatus.Checkmate)
+        self.game.board[1][7] = None
+        self.assertEqual(self.game.is_complete(), GameStatus.Ongoing)
+
+    def test_status_cached_until_position_changes(self):
+        calls = []
+        generate = self.game.iter_legal_moves
+
+        def counting(player=None):
+            calls.append(player)
+            return generate(player)
+        self.game.iter_legal_moves = counting
+
+        self.game.is_complete()
+        self.game.is_complete()
+        self.assertEqual(len(calls), 1)
+        self.game.move(Move(6, 5, 5, 5))
+        self.game.is_complete()
+        self.assertEqual(len(calls), 2)
+        self.game.undo()
+        self.game.is_complete()
+        self.assertEqual(len(calls), 3)
+
+    def test_fools_mate(self):
+        for move in [Move(6, 5, 5, 5), Move(1, 4, 3, 4), Move(6, 6, 4, 6), Move(0, 3, 4, 7)]:
+            self.assertFalse(self.game.is_complete())
+            self.game.move(move)
+        self.assertEqual(self.game.is_complete(), GameStatus.Checkmate)
+        self.game.undo()
+        self.assertEqual(self.game.is_complete(), GameStatus.Ongoing)
 
 
 class TestMove(unittest.TestCase):
+    model_class = ChessModel
+
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
 
     def test_move(self):
         # Set a Black Pawn at (1, 1)
@@ -487,13 +693,206 @@ class TestMove(unittest.TestCase):
         self.assertEqual(self.game.piece_at(2, 1), pawn)
         self.assertIsNone(self.game.piece_at(1, 1))
 
+class TestLegalMoves(unittest.TestCase):
+    model_class = ChessModel
+
+    def setUp(self):
+        self.game = self.model_class()
+
+    def test_opening_moves(self):
+        self.assertEqual(len(self.game.legal_moves()), 20)
+        self.assertEqual(len(self.game.legal_moves(Player.BLACK)), 20)
+
+    def test_pinned_piece(self):
+        # a white rook pinned to its king by a black queen can only move along the pin
+        self.game.board = [[None] * 8 for _ in range(8)]
+        self.game.set_piece(7, 4, King(Player.WHITE))
+        self.game.set_piece(5, 4, Rook(Player.WHITE))
+        self.game.set_piece(1, 4, Queen(Player.BLACK))
+        self.game.set_piece(0, 0, King(Player.BLACK))
+        rook_moves = [(m.to_row, m.to_col) for m in self.game.legal_moves() if (m.from_row, m.from_col) == (5, 4)]
+        self.assertEqual(sorted(rook_moves), [(1, 4), (2, 4), (3, 4), (4, 4), (6, 4)])
+
+    def test_no_moves_when_mated(self):
+        self.game.board = [[None] * 8 for _ in range(8)]
+        self.game.set_piece(0, 0, King(Player.WHITE))
+        self.game.set_piece(1, 1, Queen(Player.BLACK))
+        self.game.set_piece(2, 2, King(Player.BLACK))
+        self.assertEqual(self.game.legal_moves(), [])
+
+
+class TestAttackInfo(unittest.TestCase):
+    model_class = ChessModel
+
+    def test_quiet_position(self):
+        info = self.model_class().attack_info()
+        self.assertEqual(info.checkers, [])
+        self.assertEqual(info.evasions, ALL_SQUARES)
+        self.assertEqual(info.pins, {})
+        # black's pawns and knights cover row 2, and nothing of black's reaches row 4
+        self.assertTrue(all(info.attacked >> (2 * 8 + col) & 1 for col in range(8)))
+        self.assertFalse(any(info.attacked >> (4 * 8 + col) & 1 for col in range(8)))
+
+    def test_pin(self):
+        game = self.model_class.from_fen('4k3/8/8/8/4q3/8/4R3/4K3 w - - 0 1')
+        info = game.attack_info()
+        self.assertEqual(list(info.pins), [6 * 8 + 4])
+        self.assertEqual(info.pins[6 * 8 + 4], sum(1 << (row * 8 + 4) for row in range(4, 7)))
+
+    def test_single_check(self):
+        game = self.model_class.from_fen('4k3/8/8/8/4q3/8/8/R3K3 w - - 0 1')
+        info = game.attack_info()
+        self.assertEqual(info.checkers, [4 * 8 + 4])
+        self.assertEqual(info.evasions, sum(1 << (row * 8 + 4) for row in range(4, 7)))
+        # the king can't step back along the queen's line
+        self.assertTrue(info.attacked >> (7 * 8 + 4) & 1)
+        self.assertFalse(game.is_valid_move(Move(7, 0, 4, 0)))
+        self.assertEqual(game.messageCode, MoveValidity.StayingInCheck)
+
+    def test_double_check(self):
+        game = self.model_class.from_fen('4k3/8/8/8/4r3/5n2/8/R3K3 w - - 0 1')
+        info = game.attack_info()
+        self.assertEqual(sorted(info.checkers), [4 * 8 + 4, 5 * 8 + 5])
+        self.assertEqual(info.evasions, 0)
+        self.assertTrue(all(game.piece_at(m.from_row, m.from_col) is King(Player.WHITE)
+                            for m in game.legal_moves()))
+
+    def test_other_side(self):
+        game = self.model_class.from_fen('4k3/8/8/8/8/8/4R3/4K3 w - - 0 1')
+        self.assertEqual(game.attack_info(Player.BLACK).checkers, [6 * 8 + 4])
+        self.assertEqual(game.attack_info(Player.WHITE).checkers, [])
+
+    def test_direct_board_edit(self):
+        game = self.model_class()
+        game.legal_moves()
+        # writing to the board doesn't go through the hash, and must not leave the old pins and checkers behind
+        game.board[6][4] = None
+        game.board[4][4] = Queen(Player.BLACK)
+        self.assertTrue(game.in_check(Player.WHITE))
+        self.assertEqual(game.attack_info().checkers, [4 * 8 + 4])
+        self.assertFalse(game.is_valid_move(Move(6, 0, 5, 0)))
+        self.assertEqual(game.messageCode, MoveValidity.StayingInCheck)
+
+
+class TestRules(unittest.TestCase):
+    model_class = ChessModel
+    castles = 'r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1'
+
+    def test_castling(self):
+        game = self.model_class.from_fen(self.castles)
+        start = game.zobrist_hash
+        self.assertIn(Move(7, 4, 7, 6), game.legal_moves())
+        self.assertTrue(game.is_valid_move(Move(7, 4, 7, 2)))
+        game.move(Move(7, 4, 7, 6))
+        self.assertIs(game.piece_at(7, 6), King(Player.WHITE))
+        self.assertIs(game.piece_at(7, 5), Rook(Player.WHITE))
+        self.assertIsNone(game.piece_at(7, 7))
+        self.assertEqual(game.castling_rights, BLACK_KINGSIDE | BLACK_QUEENSIDE)
+        self.assertEqual(game.fen(), 'r3k2r/8/8/8/8/8/8/R4RK1 b kq - 1 1')
+        game.undo()
+        self.assertEqual(game.fen(), self.castles)
+        self.assertEqual(game.zobrist_hash, start)
+
+    def test_castling_blocked_or_attacked(self):
+        # f1 is covered by the rook on f8, so only the queen's side is open
+        game = self.model_class.from_fen('4kr2/8/8/8/8/8/8/R3K2R w KQ - 0 1')
+        self.assertFalse(game.is_valid_move(Move(7, 4, 7, 6)))
+        self.assertTrue(game.is_valid_move(Move(7, 4, 7, 2)))
+        game = self.model_class.from_fen('r3k2r/8/8/8/8/8/8/RN2K1NR w KQkq - 0 1')
+        self.assertFalse(game.is_valid_move(Move(7, 4, 7, 6)))
+        self.assertFalse(game.is_valid_move(Move(7, 4, 7, 2)))
+        # not out of check
+        game = self.model_class.from_fen('4r1k1/8/8/8/8/8/8/R3K2R w KQ - 0 1')
+        self.assertFalse(game.is_valid_move(Move(7, 4, 7, 2)))
+        self.assertEqual(game.messageCode, MoveValidity.StayingInCheck)
+
+    def test_moving_a_rook_gives_up_its_side(self):
+        game = self.model_class.from_fen(self.castles)
+        game.move(Move(7, 7, 6, 7))
+        game.move(Move(0, 0, 1, 0))
+        game.move(Move(6, 7, 7, 7))
+        self.assertEqual(game.castling_rights, WHITE_QUEENSIDE | BLACK_KINGSIDE)
+        self.assertFalse(game.is_valid_move(Move(7, 4, 7, 6)))
+        game.undo()
+        game.undo()
+        game.undo()
+        self.assertEqual(game.fen(), self.castles)
+
+    def test_en_passant(self):
+        game = self.model_class.from_fen('4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1')
+        game.move(Move(6, 4, 4, 4))
+        self.assertEqual(game.en_passant_square, (5, 4))
+        self.assertEqual(game.fen(), '4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1')
+        self.assertTrue(game.is_valid_move(Move(4, 3, 5, 4)))
+        game.move(Move(4, 3, 5, 4))
+        self.assertIsNone(game.piece_at(4, 4))
+        self.assertIs(game.piece_at(5, 4), Pawn(Player.BLACK))
+        self.assertEqual(game.evaluation, evaluate_board(game.board))
+        game.undo()
+        self.assertIs(game.piece_at(4, 4), Pawn(Player.WHITE))
+        self.assertIs(game.piece_at(4, 3), Pawn(Player.BLACK))
+        # the chance is gone after any other move
+        game.move(Move(0, 4, 0, 3))
+        game.move(Move(7, 4, 7, 3))
+        self.assertIsNone(game.en_passant_square)
+        self.assertFalse(game.is_valid_move(Move(4, 3, 5, 4)))
+
+    def test_en_passant_square_only_when_a_pawn_can_take(self):
+        game = self.model_class()
+        game.move(Move(6, 4, 4, 4))
+        self.assertIsNone(game.en_passant_square)
+        self.assertEqual(game.fen(), 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1')
+
+    def test_under_promotion(self):
+        game = self.model_class.from_fen('4k3/P7/8/8/8/8/8/4K3 w - - 0 1')
+        promotions = [move for move in game.legal_moves() if move.from_row == 1]
+        self.assertEqual(sorted(move.promotion for move in promotions), sorted([KNIGHT, BISHOP, ROOK, QUEEN]))
+        self.assertEqual(Move(1, 0, 0, 0, KNIGHT).uci(), 'a7a8n')
+        game.move(Move(1, 0, 0, 0, KNIGHT))
+        self.assertIs(game.piece_at(0, 0), Knight(Player.WHITE))
+        game.undo()
+        # no promotion piece given means a queen
+        self.assertTrue(game.is_valid_move(Move(1, 0, 0, 0)))
+        game.move(Move(1, 0, 0, 0))
+        self.assertIs(game.piece_at(0, 0), Queen(Player.WHITE))
+        self.assertFalse(game.is_valid_move(Move(7, 4, 7, 3, KNIGHT)))
+
+    def test_fifty_move_rule(self):
+        game = self.model_class.from_fen('4k3/8/8/8/8/8/8/R3K3 w - - 99 80')
+        self.assertEqual(game.halfmove_clock, 99)
+        self.assertEqual(game.is_complete(), GameStatus.Ongoing)
+        game.move(Move(7, 0, 6, 0))
+        self.assertEqual(game.is_complete(), GameStatus.FiftyMoveRule)
+        game.undo()
+        self.assertEqual(game.is_complete(), GameStatus.Ongoing)
+
+    def test_threefold_repetition(self):
+        game = self.model_class()
+        shuffle = [Move(7, 6, 5, 5), Move(0, 6, 2, 5), Move(5, 5, 7, 6), Move(2, 5, 0, 6)]
+        for move in shuffle * 2:
+            self.assertFalse(game.is_complete())
+            game.move(move)
+        self.assertEqual(game.repetitions(), 3)
+        self.assertEqual(game.is_complete(), GameStatus.Repetition)
+        game.undo()
+        self.assertEqual(game.is_complete(), GameStatus.Ongoing)
+
+    def test_insufficient_material(self):
+        self.assertEqual(self.model_class.from_fen('4k3/8/8/8/8/8/8/2B1K3 w - - 0 1').is_complete(),
+                         GameStatus.InsufficientMaterial)
+        self.assertEqual(self.model_class.from_fen('4k3/8/8/8/8/8/8/2BBK3 w - - 0 1').is_complete(),
+                         GameStatus.Ongoing)
+
+
 # ChessModel.find_piece() (Brody)
 
 
 class TestFind(unittest.TestCase):
+    model_class = ChessModel
+
     # set board
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
 
     def test_find_king(self):
         self.assertEqual(self.game.find_piece(King(Player.WHITE)), [(7, 4)], "find_king not set correctly!")
@@ -506,11 +905,51 @@ class TestFind(unittest.TestCase):
         self.game.board[7][4] = None
         self.assertEqual(self.game.find_piece(King(Player.WHITE)), [], "find_nothing not set correctly!")
 
+    def test_find_follows_moves(self):
+        self.game.move(Move(6, 4, 4, 4))
+        self.assertIn((4, 4), self.game.find_piece(Pawn(Player.WHITE)))
+        self.assertNotIn((6, 4), self.game.find_piece(Pawn(Player.WHITE)))
+        self.game.undo()
+        self.assertIn((6, 4), self.game.find_piece(Pawn(Player.WHITE)))
+        self.assertNotIn((4, 4), self.game.find_piece(Pawn(Player.WHITE)))
+
+    def test_board_writes_go_through(self):
+        board = self.game.board
+        board[6][4] = None
+        board[4][4] = Pawn(Player.WHITE)
+        self.assertIsNone(self.game.piece_at(6, 4))
+        self.assertEqual(self.game.find_piece(Pawn(Player.WHITE))[0], (4, 4))
+        self.assertEqual(self.game.zobrist_hash, hash_board(self.game.board, Player.WHITE,
+                                                            self.game.castling_rights))
+        board[7][0:3] = [None, None, None]
+        self.assertEqual(self.game.find_piece(Rook(Player.WHITE)), [(7, 7)])
+        # anything that would change the shape of the board is refused rather than dropped
+        with self.assertRaises(TypeError):
+            board[0].append(None)
+        with self.assertRaises(ValueError):
+            board[0][0:2] = [None]
+
+    def test_find_added_piece(self):
+        self.game.board[4][4] = Queen(Player.WHITE)
+        self.assertEqual(self.game.find_piece(Queen(Player.WHITE)), [(4, 4), (7, 3)])
+
+    def test_find_after_capture_and_promotion(self):
+        self.game.set_piece(1, 0, Pawn(Player.WHITE))
+        self.game.move(Move(1, 0, 0, 1))
+        self.assertEqual(self.game.find_piece(Knight(Player.BLACK)), [(0, 6)])
+        self.assertIn((0, 1), self.game.find_piece(Queen(Player.WHITE)))
+        self.game.undo()
+        self.assertEqual(self.game.find_piece(Knight(Player.BLACK)), [(0, 1), (0, 6)])
+        self.assertEqual(self.game.find_piece(Queen(Player.WHITE)), [(7, 3)])
+        self.assertIn((1, 0), self.game.find_piece(Pawn(Player.WHITE)))
+
 
 # ChessModel.possible_moves() (Brody)
 class TestPossibleMoves(unittest.TestCase):
+    model_class = ChessModel
+
     def setUp(self):
-        self.game = ChessModel()
+        self.game = self.model_class()
 
     def test_possible_moves(self):
         self.assertEqual(str(self.game.possible_moves(MoveTypes.Advance, self.game.current_player)),
@@ -519,3 +958,811 @@ class TestPossibleMoves(unittest.TestCase):
     def test_no_moves(self):
         self.assertIsNone(self.game.possible_moves(MoveTypes.StopThreat, self.game.current_player),
                           'no_moves not set correctly!')
+
+
+class TestPerft(unittest.TestCase):
+    model_class = ChessModel
+
+    def test_start_position(self):
+        game = self.model_class()
+        self.assertEqual([game.perft(depth) for depth in range(4)], [1, 20, 400, 8902])
+
+    def test_perft_restores_position(self):
+        game = self.model_class()
+        game.perft(2)
+        self.assertEqual(game.move_history, [])
+        self.assertEqual(game.current_player, Player.WHITE)
+
+    def test_divide(self):
+        divide = self.model_class().perft_divide(2)
+        self.assertEqual(len(divide), 20)
+        self.assertEqual(divide['e2e4'], 20)
+        self.assertEqual(sum(divide.values()), 400)
+
+    def test_reference_positions(self):
+        for position in REFERENCE_POSITIONS:
+            depth = min(max(position.nodes), 2)
+            game = self.model_class.from_fen(position.fen)
+            self.assertEqual(game.perft(depth), position.nodes[depth], f'{position.name} perft({depth}) is wrong')
+
+
+class TestFEN(unittest.TestCase):
+    model_class = ChessModel
+    kiwipete = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b - - 3 12'
+
+    def test_starting_position(self):
+        self.assertEqual(self.model_class().fen(), STARTING_FEN)
+
+    def test_load_matches_starting_board(self):
+        game = self.model_class.from_fen(STARTING_FEN)
+        self.assertEqual(game.zobrist_hash, self.model_class().zobrist_hash)
+        self.assertEqual(game.perft(2), 400)
+
+    def test_round_trip(self):
+        game = self.model_class.from_fen(self.kiwipete)
+        self.assertEqual(game.fen(), self.kiwipete)
+        self.assertEqual(game.current_player, Player.BLACK)
+        self.assertIs(game.piece_at(3, 3), Pawn(Player.WHITE))
+
+    def test_counters_follow_moves(self):
+        game = self.model_class()
+        game.move(Move(7, 6, 5, 5))
+        game.move(Move(0, 6, 2, 5))
+        self.assertEqual(game.fen(), 'rnbqkb1r/pppppppp/5n2/8/8/5N2/PPPPPPPP/RNBQKB1R w KQkq - 2 2')
+        game.move(Move(6, 4, 4, 4))
+        self.assertTrue(game.fen().endswith(' b KQkq - 0 2'))
+        game.undo()
+        self.assertTrue(game.fen().endswith(' w KQkq - 2 2'))
+
+    def test_load_clears_history(self):
+        game = self.model_class()
+        game.move(Move(6, 4, 4, 4))
+        game.load_fen(self.kiwipete)
+        self.assertEqual(game.move_history, [])
+        self.assertRaises(UndoException, game.undo)
+
+    def test_invalid_fen(self):
+        for fen in ['', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w - - 0 1',
+                    'rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1',
+                    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w - - 0 1',
+                    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x - - 0 1',
+                    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KX - 0 1']:
+            self.assertRaises(FENError, self.model_class.from_fen, fen)
+
+    def test_read_positions(self):
+        lines = ['# a perft suite', '',
+                 STARTING_FEN + ' ;D1 20 ;D2 400',
+                 '4k3/8/8/8/8/8/8/4K2R w - - bm Rh8+; id "rook ending";']
+        records = list(read_positions(lines))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0].fen, STARTING_FEN)
+        self.assertEqual(records[0].operations, {'D1': '20', 'D2': '400'})
+        self.assertEqual(records[1].fen, '4k3/8/8/8/8/8/8/4K2R w - - 0 1')
+        self.assertEqual(records[1].operations, {'bm': 'Rh8+', 'id': 'rook ending'})
+        self.assertEqual(records[1].line, 4)
+
+    def test_read_positions_reports_line(self):
+        with self.assertRaisesRegex(FENError, 'line 2'):
+            list(read_positions([STARTING_FEN, '8/8/8 w - -']))
+
+
+class TestPGN(unittest.TestCase):
+    games = ['[Event "Fool\'s mate"]', '[Result "0-1"]', '',
+             '1. f3 {a comment that', '[runs on] } e5 2. g4?! (2. e4 Nf6 (2... d5)) Qh4# $4 0-1', '',
+             '[Event "Bad"]', '', '1. e4 e5 2. Ke3 ; an illegal move', '*']
+
+    def test_read_games(self):
+        games = list(read_games(self.games))
+        self.assertEqual(len(games), 2)
+        self.assertEqual(games[0].headers, {'Event': "Fool's mate", 'Result': '0-1'})
+        self.assertEqual(games[0].moves, ['f3', 'e5', 'g4?!', 'Qh4#'])
+        self.assertEqual(games[0].result, '0-1')
+        self.assertEqual(games[1].moves, ['e4', 'e5', 'Ke3'])
+        self.assertEqual(games[1].result, '*')
+
+    def test_san_disambiguation(self):
+        game = ChessModel.from_fen('4k3/8/8/8/8/5N2/8/1N2K3 w - - 0 1')
+        self.assertEqual(san_to_move(game, 'Nbd2'), Move(7, 1, 6, 3))
+        self.assertEqual(san_to_move(game, 'Nfd2'), Move(5, 5, 6, 3))
+        self.assertRaises(PGNError, san_to_move, game, 'Nd2')
+        self.assertRaises(PGNError, san_to_move, game, 'Nd3')
+        self.assertRaises(PGNError, san_to_move, game, 'Zz9')
+
+    def test_san_castling_and_promotion(self):
+        game = ChessModel.from_fen('r3k2r/1P6/8/8/8/8/8/R3K2R w KQkq - 0 1')
+        self.assertEqual(san_to_move(game, 'O-O'), Move(7, 4, 7, 6))
+        self.assertEqual(san_to_move(game, 'O-O-O+'), Move(7, 4, 7, 2))
+        self.assertEqual(san_to_move(game, 'bxa8=N'), Move(1, 1, 0, 0, KNIGHT))
+        self.assertEqual(san_to_move(game, 'b8=Q+'), Move(1, 1, 0, 1, QUEEN))
+        game.move(Move(7, 4, 6, 4))
+        game.move(Move(0, 4, 1, 4))
+        game.move(Move(6, 4, 7, 4))
+        self.assertRaises(PGNError, san_to_move, game, 'O-O-O')
+
+    def test_replay_reports_each_ply(self):
+        reports = list(replay(next(read_games(self.games))))
+        self.assertEqual([r.san for r in reports], ['f3', 'e5', 'g4?!', 'Qh4#'])
+        self.assertTrue(all(r.legal for r in reports))
+        self.assertEqual(reports[2].status, GameStatus.Ongoing)
+        self.assertTrue(reports[3].check)
+        self.assertEqual(reports[3].status, GameStatus.Checkmate)
+
+    def test_replay_stops_at_illegal_move(self):
+        reports = list(replay(list(read_games(self.games))[1]))
+        self.assertEqual(len(reports), 3)
+        self.assertFalse(reports[2].legal)
+        self.assertIsNone(reports[2].move)
+        self.assertIn('illegal', reports[2].error)
+
+    def test_analyse_games(self):
+        for workers in (1, 2):
+            mate, bad = analyse_games(read_games(self.games), workers)
+            self.assertTrue(mate.legal)
+            self.assertEqual(mate.plies, 4)
+            self.assertEqual(mate.status, GameStatus.Checkmate)
+            self.assertFalse(bad.legal)
+            self.assertEqual(bad.plies, 2)
+            self.assertTrue(bad.error.startswith('ply 3'))
+
+
+class TestZobristHash(unittest.TestCase):
+    model_class = ChessModel
+
+    def setUp(self):
+        self.game = self.model_class()
+
+    def test_matches_full_hash(self):
+        self.game.move(Move(6, 4, 4, 4))
+        self.game.move(Move(1, 3, 3, 3))
+        self.game.move(Move(4, 4, 3, 3))
+        self.assertEqual(self.game.zobrist_hash, hash_board(self.game.board, self.game.current_player,
+                                                              self.game.castling_rights))
+
+    def test_undo_restores_hash(self):
+        start = self.game.zobrist_hash
+        self.game.move(Move(7, 6, 5, 5))
+        self.assertNotEqual(self.game.zobrist_hash, start)
+        self.game.undo()
+        self.assertEqual(self.game.zobrist_hash, start)
+
+    def test_transposition(self):
+        # the same position reached by two move orders has the same hash
+        self.game.move(Move(7, 6, 5, 5))
+        self.game.move(Move(0, 6, 2, 5))
+        self.game.move(Move(7, 1, 5, 2))
+        first = self.game.zobrist_hash
+        other = self.model_class()
+        other.move(Move(7, 1, 5, 2))
+        other.move(Move(0, 6, 2, 5))
+        other.move(Move(7, 6, 5, 5))
+        self.assertEqual(other.zobrist_hash, first)
+
+    def test_side_to_move(self):
+        start = self.game.zobrist_hash
+        self.game.current_player = Player.BLACK
+        self.assertNotEqual(self.game.zobrist_hash, start)
+
+    def test_set_piece(self):
+        self.game.set_piece(4, 4, Queen(Player.WHITE))
+        self.assertEqual(self.game.zobrist_hash, hash_board(self.game.board, self.game.current_player,
+                                                              self.game.castling_rights))
+
+
+class TestEvaluation(unittest.TestCase):
+    model_class = ChessModel
+
+    def setUp(self):
+        self.game = self.model_class()
+
+    def test_starting_position_is_level(self):
+        self.assertEqual(self.game.evaluation, 0)
+        self.assertEqual(evaluate(self.game), 0)
+
+    def test_tables_are_mirrored_for_black(self):
+        for piece_class in (Pawn, Knight, Bishop, Rook, Queen, King):
+            for row in range(8):
+                for col in range(8):
+                    self.assertEqual(square_score(piece_class(Player.BLACK), 7 - row, col),
+                                     -square_score(piece_class(Player.WHITE), row, col))
+
+    def test_score_is_from_side_to_move(self):
+        self.game.move(Move(6, 4, 4, 4))
+        self.assertGreater(self.game.evaluation, 0)
+        self.assertEqual(evaluate(self.game), -self.game.evaluation)
+
+    def test_capture_and_undo(self):
+        self.game.set_piece(2, 3, Queen(Player.WHITE))
+        before = self.game.evaluation
+        self.game.move(Move(1, 2, 2, 3))
+        self.assertLess(self.game.evaluation, before - 800)
+        self.game.undo()
+        self.assertEqual(self.game.evaluation, before)
+
+    def test_promotion(self):
+        self.game.set_piece(1, 0, Pawn(Player.WHITE))
+        self.game.move(Move(1, 0, 0, 1))
+        self.assertEqual(self.game.evaluation, evaluate_board(self.game.board))
+
+    def test_kept_up_to_date_over_a_game(self):
+        for _ in range(40):
+            moves = self.game.legal_moves()
+            if not moves:
+                break
+            self.game.move(moves[len(moves) // 3])
+            self.assertEqual(self.game.evaluation, evaluate_board(self.game.board))
+        while self.game.move_history:
+            self.game.undo()
+        self.assertEqual(self.game.evaluation, 0)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def setUp(self):
+        self.table = TranspositionTable(size_mb=1)
+
+    def test_store_and_probe(self):
+        move = Move(6, 4, 4, 4)
+        self.table.store(12345, 3, 40, Bound.Exact, move)
+        entry = self.table.probe(12345)
+        self.assertEqual((entry.depth, entry.score, entry.bound, entry.move), (3, 40, Bound.Exact, move))
+        self.assertIsNone(self.table.probe(54321))
+        self.assertEqual((self.table.hits, self.table.misses), (1, 1))
+
+    def test_memory_cap(self):
+        self.assertEqual(self.table.capacity, 2 * (1024 * 1024 // (2 * TranspositionTable.ENTRY_BYTES)))
+        for key in range(3 * self.table.capacity):
+            self.table.store(key, 1, 0, Bound.Exact)
+        self.assertLessEqual(len(self.table), self.table.capacity)
+
+    def test_depth_preferred(self):
+        # two keys that share a bucket: the deep result stays, the shallow one goes to the always-replace slot
+        other = 7 + self.table.buckets
+        self.table.store(7, 5, 10, Bound.Lower)
+        self.table.store(other, 1, 20, Bound.Upper)
+        self.assertEqual(self.table.probe(7).depth, 5)
+        self.assertEqual(self.table.probe(other).depth, 1)
+
+        # a third shallow key replaces the always-replace slot only
+        third = 7 + 2 * self.table.buckets
+        self.table.store(third, 2, 30, Bound.Exact)
+        self.assertIsNotNone(self.table.probe(7))
+        self.assertIsNone(self.table.probe(other))
+        self.assertIsNotNone(self.table.probe(third))
+
+    def test_old_entries_replaced(self):
+        other = 7 + self.table.buckets
+        self.table.store(7, 5, 10, Bound.Exact)
+        self.table.new_search()
+        self.table.store(other, 1, 20, Bound.Exact)
+        self.assertEqual(self.table.probe(other).depth, 1)
+        self.assertEqual(self.table.probe(7).depth, 5)
+
+    def test_clear(self):
+        self.table.store(1, 1, 1, Bound.Exact)
+        self.table.clear()
+        self.assertIsNone(self.table.probe(1))
+        self.assertEqual(self.table.stats()['stores'], 0)
+
+
+class TestSearch(unittest.TestCase):
+    model_class = ChessModel
+
+    def setUp(self):
+        self.game = self.model_class()
+        self.game.board = [[None] * 8 for _ in range(8)]
+
+    def test_mate_in_one(self):
+        self.game.set_piece(0, 7, King(Player.BLACK))
+        self.game.set_piece(1, 6, Pawn(Player.BLACK))
+        self.game.set_piece(1, 7, Pawn(Player.BLACK))
+        self.game.set_piece(7, 0, Rook(Player.WHITE))
+        self.game.set_piece(7, 6, King(Player.WHITE))
+        result = self.game.search(depth=3)
+        self.assertEqual(result.move.uci(), 'a1a8')
+        self.assertGreater(result.score, MATE_THRESHOLD)
+
+    def test_wins_material(self):
+        self.game.set_piece(0, 4, King(Player.BLACK))
+        self.game.set_piece(3, 3, Queen(Player.BLACK))
+        self.game.set_piece(7, 4, King(Player.WHITE))
+        self.game.set_piece(5, 2, Knight(Player.WHITE))
+        self.assertEqual(self.game.search(depth=2).move.uci(), 'c3d5')
+
+    def test_node_limit_leaves_model_unchanged(self):
+        game = self.model_class()
+        result = game.search(nodes=300)
+        self.assertLessEqual(result.nodes, 300)
+        self.assertIsNotNone(result.move)
+        self.assertEqual(game.move_history, [])
+        self.assertEqual(game.zobrist_hash, self.model_class().zobrist_hash)
+
+    def test_stop_before_search(self):
+        # a stop that comes before the search has started is kept for it, until taken back
+        game = self.model_class()
+        game.engine.stop()
+        self.assertLess(game.search(depth=5).depth, 5)
+        game.engine.clear_stop()
+        self.assertEqual(game.search(depth=2).depth, 2)
+
+    def test_pluggable_evaluation(self):
+        # an evaluation that likes the side to move having its king far up the board
+        def king_advance(model):
+            row = model.king_square(model.current_player)[0]
+            return row if model.current_player == Player.BLACK else 7 - row
+        self.game.set_piece(0, 0, King(Player.BLACK))
+        self.game.set_piece(7, 7, King(Player.WHITE))
+        self.game.engine = SearchEngine(evaluate=king_advance)
+        self.assertEqual(self.game.search(depth=2).move.to_row, 6)
+
+    def test_ai_search_mode(self):
+        game = self.model_class()
+        self.assertFalse(game.ai(AIMode.Search, depth=1))
+        self.assertEqual(game.current_player, Player.BLACK)
+
+    def test_ai_no_moves(self):
+        self.game.set_piece(0, 0, King(Player.WHITE))
+        self.game.set_piece(1, 1, Queen(Player.BLACK))
+        self.game.set_piece(2, 2, King(Player.BLACK))
+        self.assertTrue(self.game.ai())
+        self.assertTrue(self.game.ai(AIMode.Search))
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def setUp(self):
+        self.game = ChessModel()
+        self.game.board = [[None] * 8 for _ in range(8)]
+        self.game.set_piece(7, 4, King(Player.WHITE))
+        self.game.set_piece(0, 4, King(Player.BLACK))
+        self.game.set_piece(4, 2, Queen(Player.BLACK))
+        self.game.set_piece(2, 7, Pawn(Player.BLACK))
+        self.game.set_piece(5, 3, Pawn(Player.WHITE))
+        self.game.set_piece(4, 7, Queen(Player.WHITE))
+        self.orderer = MoveOrderer()
+
+    def test_mvv_lva(self):
+        ordered = [m.uci() for m in self.orderer.order(self.game, self.game.legal_moves())]
+        # pawn takes queen, then queen takes queen, then queen takes pawn, then the quiet moves
+        self.assertEqual(ordered[:3], ['d3c4', 'h4c4', 'h4h6'])
+
+    def test_hash_move_first(self):
+        quiet = Move(7, 4, 7, 3)
+        self.assertEqual(self.orderer.order(self.game, self.game.legal_moves(), 0, quiet)[0].uci(), 'e1d1')
+
+    def test_killers_and_history(self):
+        quiet = Move(4, 7, 4, 6)
+        self.orderer.record_cutoff(self.game, quiet, 3, 2)
+        self.assertEqual(self.orderer.killers(2)[0], quiet)
+        self.assertEqual(self.orderer.history(quiet), 9)
+        ordered = self.orderer.order(self.game, self.game.legal_moves(), 2)
+        # captures still go first, the killer right after them
+        self.assertEqual(ordered[3].uci(), 'h4g4')
+        # at other plies it is only helped by its history
+        self.assertGreater(self.orderer.score(self.game, quiet, 5), self.orderer.score(self.game, Move(4, 7, 3, 7), 5))
+
+    def test_captures_are_not_killers(self):
+        self.orderer.record_cutoff(self.game, Move(5, 3, 4, 2), 3, 0)
+        self.assertEqual(self.orderer.killers(0), [None, None])
+
+
+class TestParallelSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ParallelSearch(workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_matches_serial_search(self):
+        game = ChessModel()
+        game.board = [[None] * 8 for _ in range(8)]
+        game.set_piece(0, 4, King(Player.BLACK))
+        game.set_piece(3, 3, Queen(Player.BLACK))
+        game.set_piece(7, 4, King(Player.WHITE))
+        game.set_piece(5, 2, Knight(Player.WHITE))
+        game.set_piece(6, 0, Pawn(Player.WHITE))
+        serial = game.search(depth=2)
+        parallel = self.pool.search(game, depth=2)
+        self.assertEqual(parallel.score, serial.score)
+        self.assertEqual(parallel.move.uci(), 'c3d5')
+        self.assertEqual(parallel.depth, 2)
+
+    def test_as_model_engine(self):
+        game = ChessModel()
+        game.engine = self.pool
+        self.assertFalse(game.ai(AIMode.Search, depth=1))
+        self.assertEqual(len(game.move_history), 1)
+
+    def test_stop(self):
+        game = ChessModel()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.pool.search(game, depth=30)))
+        thread.start()
+        self.pool.stop()
+        thread.join(30)
+        self.pool.clear_stop()
+        self.assertFalse(thread.is_alive())
+        self.assertLess(results[0].depth, 30)
+        self.assertEqual(self.pool.search(game, depth=1).depth, 1)
+
+    def test_map_in_order(self):
+        expected = [2 ** n for n in range(10)]
+        self.assertEqual(list(map_in_order(pow, ((2, n) for n in range(10)), workers=2, backlog=1)), expected)
+        self.assertEqual(list(map_in_order(pow, ((2, n) for n in range(10)))), expected)
+
+    def test_model_copies_leave_engine_behind(self):
+        game = ChessModel()
+        game.search(depth=1)
+        copied = pickle.loads(pickle.dumps(game))
+        self.assertIsNot(copied.engine, game.engine)
+        self.assertEqual(copied.zobrist_hash, game.zobrist_hash)
+
+
+class TestLegalMoveCache(unittest.TestCase):
+    def test_lookups_follow_the_position(self):
+        game = ChessModel()
+        cache = LegalMoveCache()
+        self.assertFalse(cache.ready(game))
+        self.assertIsNone(cache.is_legal(game, Move(6, 4, 4, 4)))
+        cache.update(game)
+        self.assertEqual(cache.targets(game, 6, 4), {(5, 4), (4, 4)})
+        self.assertTrue(cache.is_legal(game, Move(6, 4, 4, 4)))
+        self.assertFalse(cache.is_legal(game, Move(6, 4, 3, 4)))
+        game.move(Move(6, 4, 4, 4))
+        # stale until updated, rather than wrong
+        self.assertEqual(cache.targets(game, 1, 4), set())
+        cache.update(game)
+        self.assertEqual(cache.targets(game, 1, 4), {(2, 4), (3, 4)})
+
+    def test_generates_once_per_position(self):
+        game = ChessModel()
+        calls = []
+        generate = game.legal_moves
+
+        def counting(player=None):
+            calls.append(player)
+            return generate(player)
+        game.legal_moves = counting
+        cache = LegalMoveCache()
+        for _ in range(30):
+            cache.update(game)
+            cache.targets(game, 7, 6)
+        self.assertEqual(len(calls), 1)
+
+    def test_background(self):
+        game = ChessModel.from_fen('4k3/P7/8/8/8/8/8/4K3 w - - 0 1')
+        cache = LegalMoveCache(background=True)
+        cache.update(game)
+        cache.wait()
+        self.assertTrue(cache.ready(game))
+        self.assertEqual(len(cache.moves_from(game, 1, 0)), 4)
+        # a move without a promotion piece is a queen promotion
+        self.assertTrue(cache.is_legal(game, Move(1, 0, 0, 0)))
+
+
+class TestAIWorker(unittest.TestCase):
+    def setUp(self):
+        self.done = []
+        self.progress = []
+        self.worker = AIWorker(lambda key, move: self.done.append((key, move)), self.progress.append)
+
+    def test_finds_move_without_touching_model(self):
+        game = ChessModel()
+        self.worker.start(game, AIMode.Search, depth=2)
+        self.worker.wait()
+        self.assertEqual(game.move_history, [])
+        self.assertEqual(len(self.done), 1)
+        key, move = self.done[0]
+        self.assertEqual(key, game.zobrist_hash)
+        self.assertTrue(game.is_valid_move(move))
+        self.assertEqual([result.depth for result in self.progress], [1, 2])
+
+    def test_heuristic(self):
+        game = ChessModel()
+        self.worker.start(game)
+        self.worker.wait()
+        self.assertEqual(self.done, [(game.zobrist_hash, game.choose_move())])
+
+    def test_cancel(self):
+        game = ChessModel()
+        self.worker.start(game, AIMode.Search, depth=30)
+        with self.assertRaises(RuntimeError):
+            self.worker.start(game, AIMode.Search, depth=1)
+        self.worker.cancel()
+        self.worker.wait(10)
+        self.assertFalse(self.worker.busy)
+        self.assertEqual(self.done, [])
+        # the engine can be used again once the cancelled job is gone
+        self.worker.start(game, AIMode.Search, depth=1)
+        self.worker.wait()
+        self.assertEqual(len(self.done), 1)
+
+
+class TestBook(unittest.TestCase):
+    games = ['[Event "1"]', '1. e4 e5 2. Nf3 Nc6 *', '[Event "2"]', '1. e4 c5 2. Nf3 *', '[Event "3"]', '1. d4 d5 *']
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        self.builder = BookBuilder()
+        for game in read_games(self.games):
+            self.builder.add_game(game, max_plies=3)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_encode_move(self):
+        for move in (Move(6, 4, 4, 4), Move(1, 0, 0, 1, KNIGHT), Move(0, 7, 7, 0)):
+            self.assertEqual(decode_move(encode_move(move)), move)
+
+    def test_lookup(self):
+        self.assertEqual(self.builder.write(self.path), 7)
+        with OpeningBook(self.path) as book:
+            self.assertEqual(len(book), 7)
+            self.assertEqual(book.lookup(ChessModel().zobrist_hash), [(Move(6, 4, 4, 4), 2), (Move(6, 3, 4, 3), 1)])
+            game = ChessModel()
+            game.move(Move(6, 4, 4, 4))
+            self.assertEqual(sorted(entry.move.uci() for entry in book.lookup(game.zobrist_hash)), ['c7c5', 'e7e5'])
+            game.move(Move(1, 4, 3, 4))
+            game.move(Move(7, 6, 5, 5))
+            # past the plies the book was built from
+            self.assertEqual(book.lookup(game.zobrist_hash), [])
+
+    def test_min_weight(self):
+        self.assertEqual(self.builder.write(self.path, min_weight=2), 1)
+
+    def test_ai_plays_from_book(self):
+        self.builder.write(self.path)
+        game = ChessModel()
+        game.book = OpeningBook(self.path)
+        game.ai(AIMode.Search, depth=1)
+        self.assertEqual(game.move_history[-1].move, Move(6, 4, 4, 4))
+        # a copy sent to another process doesn't take the book with it, but the book itself can be sent
+        self.assertIsNone(pickle.loads(pickle.dumps(game)).book)
+        copy = pickle.loads(pickle.dumps(game.book))
+        self.assertEqual(len(copy), 7)
+        copy.close()
+        game.book.close()
+
+    def test_epd_best_moves(self):
+        builder = BookBuilder()
+        self.assertEqual(builder.add_position(next(read_positions(['4k3/8/8/8/8/8/8/R3K3 w Q - bm Ra8+;']))), 1)
+        builder.write(self.path)
+        with OpeningBook(self.path) as book:
+            game = ChessModel.from_fen('4k3/8/8/8/8/8/8/R3K3 w Q - 0 1')
+            self.assertEqual(book.choose(game), Move(7, 0, 0, 0))
+
+    def test_not_a_book(self):
+        with open(self.path, 'wb') as out:
+            out.write(b'not a book at all')
+        self.assertRaises(BookError, OpeningBook, self.path)
+
+
+class TestTournament(unittest.TestCase):
+    def test_parse_engine(self):
+        self.assertEqual(parse_engine('heuristic'), EngineConfig('heuristic', AIMode.Heuristic))
+        self.assertEqual(parse_engine('search:depth=2,movetime=0.5'),
+                         EngineConfig('search:depth=2,movetime=0.5', AIMode.Search, depth=2, movetime=0.5))
+        self.assertRaises(ValueError, parse_engine, 'random')
+        self.assertRaises(ValueError, parse_engine, 'search:width=3')
+
+    def test_play_game(self):
+        result = play_game(0, parse_engine('search:depth=1'), parse_engine('heuristic'), max_plies=12)
+        self.assertEqual(result.plies, 12)
+        self.assertEqual(len(result.moves), 12)
+        self.assertEqual((result.white_calls, result.black_calls), (6, 6))
+        self.assertEqual(result.result, '*')
+        self.assertEqual(json.loads(result_to_json(result))['status'], 'Ongoing')
+
+    def test_mate_is_scored(self):
+        # white mates at once from here
+        result = play_game(0, parse_engine('search:depth=2'), parse_engine('heuristic'),
+                           fen='6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1')
+        self.assertEqual(result.result, '1-0')
+        self.assertEqual(result.status, GameStatus.Checkmate)
+        self.assertEqual(result.moves, ['a1a8'])
+
+    def test_colours_alternate(self):
+        first, second = parse_engine('heuristic'), parse_engine('search:depth=1')
+        results = list(run_tournament(first, second, 2, max_plies=4, random_plies=2, seed=1))
+        self.assertEqual([(r.white, r.black) for r in results], [(first.name, second.name), (second.name, first.name)])
+        standings = Standings()
+        for result in results:
+            standings.add(result)
+        self.assertEqual(standings.points, {first.name: 1.0, second.name: 1.0})
+        self.assertEqual(standings.calls, {first.name: 2, second.name: 2})
+
+
+class TestUCI(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.engine = UCIEngine(output=self.output)
+
+    def lines(self):
+        return self.output.getvalue().splitlines()
+
+    def test_handshake(self):
+        self.engine.run(['uci', 'isready', 'quit'])
+        self.assertEqual(self.lines()[-2:], ['uciok', 'readyok'])
+
+    def test_position(self):
+        self.engine.handle('position startpos moves e2e4 c7c5 g1f3')
+        self.assertEqual(self.engine.model.fen(),
+                         'rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2')
+        self.engine.handle('position fen 4k3/P7/8/8/8/8/8/4K3 w - - 0 1 moves a7a8n')
+        self.assertEqual(self.engine.model.fen(), 'N3k3/8/8/8/8/8/8/4K3 b - - 0 1')
+        # an illegal move leaves the old position in place
+        self.engine.handle('position startpos moves e2e5')
+        self.assertEqual(self.engine.model.fen(), 'N3k3/8/8/8/8/8/8/4K3 b - - 0 1')
+        self.assertEqual(self.lines(), ['info string e2e5: illegal move'])
+
+    def test_uci_to_move(self):
+        game = ChessModel()
+        self.assertEqual(uci_to_move(game, 'g1f3'), Move(7, 6, 5, 5))
+        with self.assertRaises(UCIError):
+            uci_to_move(game, 'g1g3')
+        with self.assertRaises(UCIError):
+            uci_to_move(game, 'O-O')
+
+    def test_go_depth(self):
+        self.engine.run(['position fen 6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1', 'go depth 3'])
+        lines = self.lines()
+        self.assertEqual(lines[-1], 'bestmove a1a8')
+        self.assertTrue(lines[0].startswith('info depth 1 '))
+        self.assertIn('score mate 1', lines[-2])
+        self.assertIn(' nps ', lines[-2])
+
+    def test_go_mate(self):
+        # one ply deep a1a8 is only a rook check; the mate shows at the ply after it
+        self.engine.run(['position fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1', 'go mate 1'])
+        lines = self.lines()
+        self.assertEqual(lines[-1], 'bestmove a1a8')
+        self.assertIn('score mate 1', lines[-2])
+
+    def test_stop_infinite(self):
+        self.engine.handle('go infinite')
+        self.engine.handle('isready')
+        self.engine.handle('stop')
+        self.assertIn('readyok', self.lines())
+        self.assertTrue(self.lines()[-1].startswith('bestmove '))
+
+    def test_limits(self):
+        limits = parse_go(['wtime', '60000', 'btime', '30000', 'binc', '1000', 'infinite'])
+        self.assertEqual(limits, {'wtime': 60000, 'btime': 30000, 'binc': 1000, 'infinite': 1})
+        self.assertAlmostEqual(allot_time(limits, True), 1.95)
+        self.assertAlmostEqual(allot_time(limits, False), 1.75)
+        self.assertIsNone(allot_time({'depth': 3}, True))
+        self.assertEqual(format_score(-MATE_SCORE + 4), 'mate -2')
+        self.assertEqual(format_score(35), 'cp 35')
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_counts_calls(self):
+        game = ChessModel()
+        with Instrumentation() as instrumentation:
+            game.move(Move(6, 4, 4, 4))
+            game.undo()
+            game.is_valid_move(Move(6, 4, 4, 4))
+            game.is_complete()
+        self.assertEqual(instrumentation.counts['move'], 1)
+        self.assertEqual(instrumentation.counts['undo'], 1)
+        self.assertGreaterEqual(instrumentation.counts['is_valid_move'], 1)
+        self.assertEqual(instrumentation.counts['is_complete'], 1)
+        self.assertGreater(instrumentation.seconds['is_complete'], 0)
+        self.assertTrue(any(line.startswith('is_complete: 1 calls') for line in instrumentation.report()))
+        # nothing is counted once it is over
+        game.move(Move(6, 4, 4, 4))
+        self.assertEqual(instrumentation.counts['move'], 1)
+
+    def test_puts_methods_back(self):
+        originals = {name: ChessModel.__dict__[name] for name in ('move', 'ai', 'board')}
+        bitboard_move = BitboardChessModel.__dict__['move']
+        with Instrumentation():
+            self.assertIsNot(ChessModel.__dict__['move'], originals['move'])
+            with self.assertRaises(RuntimeError):
+                Instrumentation().start()
+        for name, original in originals.items():
+            self.assertIs(ChessModel.__dict__[name], original)
+        self.assertIs(BitboardChessModel.__dict__['move'], bitboard_move)
+
+    def test_counts_copies(self):
+        for model_class in (ChessModel, BitboardChessModel):
+            game = model_class()
+            with Instrumentation() as instrumentation:
+                game.board
+                game.board[6][4]
+                pickle.dumps(game)
+            self.assertEqual(instrumentation.counts['board'], 2, model_class.__name__)
+            self.assertEqual(instrumentation.counts['__getstate__'], 1, model_class.__name__)
+            self.assertIn('board copies: 2 calls', instrumentation.report())
+
+    def test_profile(self):
+        game = BitboardChessModel()
+        with Instrumentation(profile=True) as instrumentation:
+            game.ai()
+        self.assertEqual(instrumentation.counts['ai'], 1)
+        output = io.StringIO()
+        instrumentation.print_profile(output, limit=5)
+        self.assertIn('ai', output.getvalue())
+
+
+# The model-level tests again, against the bitboard backend
+class TestBitboardUndo(TestUndo):
+    model_class = BitboardChessModel
+
+
+class TestBitboardInCheck(TestInCheck):
+    model_class = BitboardChessModel
+
+
+class TestBitboardIsValidMove(TestIsValidMove):
+    model_class = BitboardChessModel
+
+
+class TestBitboardIsComplete(TestIsComplete):
+    model_class = BitboardChessModel
+
+
+class TestBitboardMove(TestMove):
+    model_class = BitboardChessModel
+
+
+class TestBitboardLegalMoves(TestLegalMoves):
+    model_class = BitboardChessModel
+
+
+class TestBitboardPossibleMoves(TestPossibleMoves):
+    model_class = BitboardChessModel
+
+
+class TestBitboardFind(TestFind):
+    model_class = BitboardChessModel
+
+
+class TestBitboardPerft(TestPerft):
+    model_class = BitboardChessModel
+
+
+class TestBitboardFEN(TestFEN):
+    model_class = BitboardChessModel
+
+
+class TestBitboardEvaluation(TestEvaluation):
+    model_class = BitboardChessModel
+
+
+class TestBitboardAttackInfo(TestAttackInfo):
+    model_class = BitboardChessModel
+
+
+class TestBitboardRules(TestRules):
+    model_class = BitboardChessModel
+
+
+class TestBitboardZobristHash(TestZobristHash):
+    model_class = BitboardChessModel
+
+
+class TestBitboardSearch(TestSearch):
+    model_class = BitboardChessModel
+
+
+class TestBitboardMatchesChessModel(unittest.TestCase):
+    def test_same_moves_over_a_game(self):
+        # play both backends through the same game and compare every position along the way
+        game = ChessModel()
+        bitboard = BitboardChessModel()
+        for _ in range(60):
+            moves = sorted((m.from_row, m.from_col, m.to_row, m.to_col) for m in game.legal_moves())
+            self.assertEqual(sorted((m.from_row, m.from_col, m.to_row, m.to_col) for m in bitboard.legal_moves()),
+                             moves)
+            self.assertEqual(bitboard.in_check(bitboard.current_player), game.in_check(game.current_player))
+            if not moves:
+                break
+            # always take the middle move so the game is the same every run
+            move = Move(*moves[len(moves) // 2])
+            game.move(move)
+            bitboard.move(move)
+        self.assertEqual([[str(p) for p in row] for row in bitboard.board], [[str(p) for p in row] for row in game.board])
+
+    def test_find_piece(self):
+        self.assertEqual(BitboardChessModel().find_piece(Rook(Player.BLACK)), [(0, 0), (0, 7)])
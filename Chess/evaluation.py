@@ -0,0 +1,107 @@
+from chess_piece import ChessPiece, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK_CODE
+from player import Player
+from typing import List, Optional
+
+PIECE_VALUES = {PAWN: 100, KNIGHT: 320, BISHOP: 330, ROOK: 500, QUEEN: 900, KING: 0}
+
+# Piece-square bonuses in centipawns, from white's side of the board: the first row is rank 8, the way the model
+# numbers rows. Black uses the same tables with the rows mirrored.
+PIECE_SQUARE_TABLES = {
+    PAWN: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ),
+    KNIGHT: (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ),
+    BISHOP: (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ),
+    ROOK: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ),
+    QUEEN: (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ),
+    KING: (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ),
+}
+
+# Value plus piece-square bonus for each piece code and square, signed from white's point of view (black pieces
+# count negative), so a model can keep its score by adding and subtracting entries as pieces come and go.
+SQUARE_SCORES: List[Optional[List[int]]] = [None] * (KING + BLACK_CODE + 1)
+for _kind, _table in PIECE_SQUARE_TABLES.items():
+    SQUARE_SCORES[_kind] = [PIECE_VALUES[_kind] + _table[sq] for sq in range(64)]
+    SQUARE_SCORES[_kind + BLACK_CODE] = [-PIECE_VALUES[_kind] - _table[(7 - sq // 8) * 8 + sq % 8]
+                                         for sq in range(64)]
+
+
+def square_score(piece: ChessPiece, row: int, col: int) -> int:
+    """
+    Returns what piece standing on (row, col) adds to the evaluation, from white's point of view.
+    """
+    return SQUARE_SCORES[piece.code][row * 8 + col]
+
+
+def evaluate_board(board: List[List[Optional[ChessPiece]]]) -> int:
+    """
+    Scores a whole board from scratch, in centipawns from white's point of view. Models keep this score up to date
+    as moves are made; this is for setting it up and for checking it.
+    """
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece is not None:
+                score += SQUARE_SCORES[piece.code][row * 8 + col]
+    return score
+
+
+def evaluate(model) -> int:
+    """
+    The default evaluation for search: material and piece-square tables, from the point of view of the side to
+    move. Reads the score the model keeps up to date, so it costs the same however many pieces are on the board.
+    """
+    return model.evaluation if model.current_player == Player.WHITE else -model.evaluation
@@ -0,0 +1,162 @@
+import re
+from chess_piece import ChessPiece
+from pawn import Pawn
+from rook import Rook
+from knight import Knight
+from bishop import Bishop
+from queen import Queen
+from king import King
+from player import Player
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+PIECE_LETTERS = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+# piece kind to its lower case letter
+LETTERS = {piece_class.kind: letter for letter, piece_class in PIECE_LETTERS.items()}
+
+# The four position fields, then the two move counters that FEN has and EPD leaves out, then any EPD operations
+_RECORD = re.compile(r'\s*(\S+)\s+(\S+)\s+(\S+)\s+(\S+)(?:\s+(\d+)\s+(\d+)(?=\s|;|$))?(.*)$')
+_SQUARE = re.compile(r'[a-h][36]')
+_CASTLING = re.compile(r'-|K?Q?k?q?')
+
+
+class FENError(ValueError):
+    pass
+
+
+class FENPosition(NamedTuple):
+    """
+    A parsed FEN record. board is an 8x8 nested list with row 0 being rank 8, as the models use.
+    """
+    board: List[List[Optional[ChessPiece]]]
+    player: Player
+    castling: str
+    en_passant: str
+    halfmove: int
+    fullmove: int
+
+
+class EPDRecord(NamedTuple):
+    """
+    One line of an EPD or FEN file: the position as a full six-field FEN string, the EPD operations that followed
+    it (e.g. {'bm': 'e4', 'D1': '20'}) and the line number it came from.
+    """
+    fen: str
+    operations: Dict[str, str]
+    line: int
+
+
+def parse_fen(fen: str) -> FENPosition:
+    """
+    Parses a position in Forsyth-Edwards Notation. The move counters may be left off, as in EPD.
+    :param fen: str e.g. STARTING_FEN.
+    :return: FENPosition with the board and the other fields.
+    :raises FENError: if fen is not a valid FEN record.
+    """
+    fields = fen.split()
+    if len(fields) not in (4, 6):
+        raise FENError(f'expected 4 or 6 fields, got {len(fields)}: {fen!r}')
+    placement, side, castling, en_passant = fields[:4]
+
+    ranks = placement.split('/')
+    if len(ranks) != 8:
+        raise FENError(f'expected 8 ranks, got {len(ranks)}: {placement!r}')
+    board = []
+    for rank in ranks:
+        row = []
+        for letter in rank:
+            if letter.isdigit():
+                row.extend([None] * int(letter))
+            elif letter.lower() in PIECE_LETTERS:
+                row.append(PIECE_LETTERS[letter.lower()](Player.WHITE if letter.isupper() else Player.BLACK))
+            else:
+                raise FENError(f'unknown piece {letter!r} in {rank!r}')
+        if len(row) != 8:
+            raise FENError(f'rank {rank!r} does not have 8 squares')
+        board.append(row)
+
+    if side not in ('w', 'b'):
+        raise FENError(f'side to move must be w or b, not {side!r}')
+    if not _CASTLING.fullmatch(castling) or castling == '':
+        raise FENError(f'bad castling field {castling!r}')
+    if en_passant != '-' and not _SQUARE.fullmatch(en_passant):
+        raise FENError(f'bad en passant square {en_passant!r}')
+    halfmove, fullmove = 0, 1
+    if len(fields) == 6:
+        if not (fields[4].isdigit() and fields[5].isdigit()):
+            raise FENError(f'move counters must be numbers, not {fields[4]!r} {fields[5]!r}')
+        halfmove, fullmove = int(fields[4]), int(fields[5])
+
+    return FENPosition(board, Player.WHITE if side == 'w' else Player.BLACK, castling, en_passant, halfmove,
+                       fullmove)
+
+
+def board_to_fen(board: List[List[Optional[ChessPiece]]], player: Player, castling: str = '-',
+                 en_passant: str = '-', halfmove: int = 0, fullmove: int = 1) -> str:
+    """
+    Writes a position as a FEN string.
+    :param board: the 8x8 nested list of pieces, row 0 being rank 8.
+    :param player: Player the side to move.
+    :return: str the six-field FEN record.
+    """
+    ranks = []
+    for row in board:
+        rank = ''
+        empty = 0
+        for piece in row:
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            letter = LETTERS[piece.kind]
+            rank += letter.upper() if piece.player == Player.WHITE else letter
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    side = 'w' if player == Player.WHITE else 'b'
+    return f'{"/".join(ranks)} {side} {castling} {en_passant} {halfmove} {fullmove}'
+
+
+def parse_epd(line: str, line_number: int = 0) -> EPDRecord:
+    """
+    Parses one EPD line (four position fields followed by operations such as 'bm e4; id "test 1";') or one FEN
+    line, which may also be followed by operations, as in perft suites (';D1 20 ;D2 400').
+    :raises FENError: if the position part is not valid.
+    """
+    match = _RECORD.match(line)
+    if match is None:
+        raise FENError(f'line {line_number}: not a FEN or EPD record: {line.strip()!r}')
+    placement, side, castling, en_passant, halfmove, fullmove, rest = match.groups()
+    fen = f'{placement} {side} {castling} {en_passant} {halfmove or 0} {fullmove or 1}'
+    try:
+        parse_fen(fen)
+    except FENError as e:
+        raise FENError(f'line {line_number}: {e}') from None
+
+    operations = {}
+    for operation in rest.split(';'):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operand = operation.partition(' ')
+            operations[opcode] = operand.strip().strip('"')
+    return EPDRecord(fen, operations, line_number)
+
+
+def read_positions(source: Union[str, Iterable[str]]) -> Iterator[EPDRecord]:
+    """
+    Reads EPD or FEN records one line at a time, so files of any size can be streamed through without loading
+    them. Blank lines and lines starting with # are skipped.
+    :param source: str path of the file, or any iterable of lines (an open file, a list of strings).
+    :return: generator of EPDRecord.
+    """
+    if isinstance(source, str):
+        with open(source) as lines:
+            yield from read_positions(lines)
+        return
+    for line_number, line in enumerate(source, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield parse_epd(line, line_number)
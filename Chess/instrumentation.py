@@ -0,0 +1,181 @@
+import argparse
+import cProfile
+import functools
+import pstats
+import sys
+import time
+from collections import Counter
+from chess_model import MODES, ChessModel
+from bitboard_model import BACKENDS, BitboardChessModel
+from fen import STARTING_FEN
+from typing import Dict, Iterable, List, Optional, TextIO
+
+# model methods whose calls are counted
+COUNTED = ('is_valid_move', 'in_check', 'move', 'undo', 'set_piece', '__getstate__')
+# model methods whose calls are counted and timed; a phase's time includes the phases it calls
+TIMED = ('ai', 'choose_move', 'search', 'possible_moves', 'is_complete', 'legal_moves')
+# model properties whose reads are counted. Both backends build a new board on every read of board (the models
+# themselves read their squares through _rows(), which only the bitboard backend answers with a copy of board)
+PROPERTIES = ('board',)
+LABELS = {'__getstate__': 'model copies', 'board': 'board copies'}
+
+# the Instrumentation whose wrappers are in the model classes, if any
+_active: Optional['Instrumentation'] = None
+
+
+class Instrumentation:
+    """
+    Counts calls to the models' methods and times the expensive ones while it is active, in a with block or
+    between start() and stop(). It works by putting wrapped methods into the model classes and the originals back
+    afterwards, so while none is active the models run exactly the code they always do: the hooks cost nothing
+    until they are used.
+
+    With profile set, cProfile runs for the same stretch, for print_profile() and dump_profile().
+    """
+
+    def __init__(self, model_classes: Iterable[type] = (ChessModel, BitboardChessModel), counted=COUNTED,
+                 timed=TIMED, properties=PROPERTIES, profile: bool = False):
+        self.model_classes = tuple(model_classes)
+        self.counted = counted
+        self.timed = timed
+        self.properties = properties
+        self.counts: Counter = Counter()
+        self.seconds: Dict[str, float] = {name: 0.0 for name in timed}
+        self.profiler = cProfile.Profile() if profile else None
+        self.__originals = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        :raises RuntimeError: if an Instrumentation is already active.
+        """
+        global _active
+        if _active is not None:
+            raise RuntimeError('instrumentation is already active')
+        _active = self
+        for cls in self.model_classes:
+            # only what the class defines itself; an inherited method is wrapped once, in the class it comes from
+            for name, wrap in ([(name, self.__count) for name in self.counted] +
+                               [(name, self.__time) for name in self.timed] +
+                               [(name, self.__count_reads) for name in self.properties]):
+                if name in cls.__dict__:
+                    original = cls.__dict__[name]
+                    self.__originals.append((cls, name, original))
+                    setattr(cls, name, wrap(name, original))
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        global _active
+        if _active is not self:
+            return
+        if self.profiler is not None:
+            self.profiler.disable()
+        for cls, name, original in reversed(self.__originals):
+            setattr(cls, name, original)
+        self.__originals = []
+        _active = None
+
+    def reset(self):
+        self.counts.clear()
+        self.seconds = {name: 0.0 for name in self.timed}
+
+    def __count(self, name: str, method):
+        counts = self.counts
+
+        @functools.wraps(method)
+        def counting(*args, **kwargs):
+            counts[name] += 1
+            return method(*args, **kwargs)
+        return counting
+
+    def __time(self, name: str, method):
+        counts, seconds = self.counts, self.seconds
+
+        @functools.wraps(method)
+        def timing(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[name] += time.perf_counter() - start
+                counts[name] += 1
+        return timing
+
+    def __count_reads(self, name: str, prop: property):
+        return property(self.__count(name, prop.fget), prop.fset, prop.fdel, prop.__doc__)
+
+    def report(self) -> List[str]:
+        """
+        Returns the counts and times as printable lines, the timed phases first.
+        """
+        lines = []
+        for name in self.timed:
+            calls = self.counts[name]
+            if calls:
+                lines.append(f'{name}: {calls} calls, {self.seconds[name] * 1000:.1f} ms, '
+                             f'{self.seconds[name] / calls * 1000:.3f} ms per call')
+        for name in self.counted + self.properties:
+            if self.counts[name]:
+                lines.append(f'{LABELS.get(name, name)}: {self.counts[name]} calls')
+        return lines
+
+    def print_profile(self, stream: TextIO = sys.stdout, sort: str = 'cumulative', limit: int = 25):
+        """
+        Prints the cProfile statistics, the limit functions that rank highest by sort.
+        :raises RuntimeError: if profile was not set.
+        """
+        if self.profiler is None:
+            raise RuntimeError('profiling was not turned on')
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+
+    def dump_profile(self, path: str):
+        """
+        Writes the cProfile statistics to a file pstats (or snakeviz and the like) can read.
+        """
+        if self.profiler is None:
+            raise RuntimeError('profiling was not turned on')
+        self.profiler.dump_stats(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play ai() moves with the models instrumented, and report where '
+                                                 'the time went')
+    parser.add_argument('--fen', default=STARTING_FEN, help='position to start from')
+    parser.add_argument('--plies', type=int, default=10, help='ai() moves to play (default 10)')
+    parser.add_argument('--mode', choices=MODES, default='heuristic', help='how ai() picks its moves')
+    parser.add_argument('--depth', type=int, help='search depth, for --mode search')
+    parser.add_argument('--movetime', type=float, help='seconds per search, for --mode search')
+    parser.add_argument('--backend', choices=BACKENDS, default='list', help='board representation to use')
+    parser.add_argument('--profile', help='also run cProfile, writing its statistics to this file')
+    args = parser.parse_args()
+
+    model = BACKENDS[args.backend].from_fen(args.fen)
+    totals = Counter()
+    with Instrumentation(profile=args.profile is not None) as instrumentation:
+        for ply in range(args.plies):
+            start = time.perf_counter()
+            stuck = model.ai(MODES[args.mode], args.depth, args.movetime)
+            seconds = time.perf_counter() - start
+            # one line per ai() call, with what it cost on its own
+            calls = instrumentation.counts - totals
+            totals = instrumentation.counts.copy()
+            print(f'{ply + 1}\t{seconds * 1000:.1f} ms\t' + ', '.join(
+                f'{LABELS.get(name, name)} {calls[name]}' for name in COUNTED + PROPERTIES + TIMED if calls[name]))
+            if stuck or model.is_complete():
+                break
+    for line in instrumentation.report():
+        print(line)
+    if args.profile is not None:
+        instrumentation.dump_profile(args.profile)
+        instrumentation.print_profile(limit=15)
+
+
+if __name__ == '__main__':
+    main()
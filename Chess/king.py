@@ -1,10 +1,13 @@
-from chess_piece import ChessPiece
+from chess_piece import ChessPiece, KING, KING_OFFSETS
 from player import Player
 from move import Move
-from typing import List
+from typing import Iterator, List, Tuple
 
 
 class King(ChessPiece):
+    __slots__ = ()
+    kind = KING
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -14,6 +17,9 @@ class King(ChessPiece):
     def type(self):
         return 'King'
 
+    def targets(self, row: int, col: int, board: List[List['ChessPiece']]) -> Iterator[Tuple[int, int]]:
+        return self._step(row, col, board, KING_OFFSETS)
+
     def is_valid_move(self, move: Move, board: List[List['ChessPiece']]) -> bool:
         if not super().is_valid_move(move, board):
             return False
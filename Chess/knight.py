@@ -1,10 +1,13 @@
-from chess_piece import ChessPiece
+from chess_piece import ChessPiece, KNIGHT, KNIGHT_OFFSETS
 from player import Player
 from move import Move
-from typing import List
+from typing import Iterator, List, Tuple
 
 
 class Knight(ChessPiece):
+    __slots__ = ()
+    kind = KNIGHT
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -14,6 +17,9 @@ class Knight(ChessPiece):
     def type(self):
         return 'Knight'
 
+    def targets(self, row: int, col: int, board: List[List['ChessPiece']]) -> Iterator[Tuple[int, int]]:
+        return self._step(row, col, board, KNIGHT_OFFSETS)
+
     def is_valid_move(self, move: Move, board: List[List['ChessPiece']]) -> bool:
         if not super().is_valid_move(move, board):
             return False
@@ -0,0 +1,104 @@
+import threading
+from chess_piece import QUEEN
+from move import Move
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class LegalMoveCache:
+    """
+    The legal moves of one position, grouped by the square they start from, for a GUI to highlight and check clicks
+    against. update() works them out when the position has changed, which it tells by the Zobrist hash; every other
+    method only reads what is already there, so a redraw loop can ask as often as it likes without generating a
+    single move.
+
+    With background set, the moves are generated on a worker thread from a copy of the position, so the caller
+    never waits. Until they are ready the lookups answer as if nothing were known.
+    """
+
+    def __init__(self, background: bool = False):
+        self.background = background
+        self.__lock = threading.Lock()
+        self.__key: Optional[int] = None
+        self.__moves: Dict[Tuple[int, int], List[Move]] = {}
+        # hash of the position being worked out on the thread
+        self.__pending: Optional[int] = None
+        self.__thread: Optional[threading.Thread] = None
+
+    def update(self, model):
+        """
+        Makes the cache follow model's current position. Costs a hash comparison when the position is the one
+        already cached (or being worked out).
+        """
+        key = model.zobrist_hash
+        with self.__lock:
+            if key == self.__key:
+                # back to the cached position, so whatever the thread is working on is no longer wanted
+                self.__pending = None
+                return
+            if key == self.__pending:
+                return
+            self.__pending = key
+        if not self.background:
+            self.__store(key, model.legal_moves())
+            return
+        # the thread works on its own copy, so the caller can keep moving pieces on the real board
+        snapshot = type(model).from_fen(model.fen())
+        self.__thread = threading.Thread(target=lambda: self.__store(key, snapshot.legal_moves()), daemon=True)
+        self.__thread.start()
+
+    def __store(self, key: int, moves: List[Move]):
+        by_square = {}
+        for move in moves:
+            by_square.setdefault((move.from_row, move.from_col), []).append(move)
+        with self.__lock:
+            # a newer position may have been asked for while these were worked out
+            if key == self.__pending:
+                self.__key = key
+                self.__moves = by_square
+                self.__pending = None
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        Blocks until a background update has finished.
+        """
+        thread = self.__thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def ready(self, model) -> bool:
+        """
+        Whether the cached moves are those of model's current position.
+        """
+        return self.__key == model.zobrist_hash
+
+    def moves_from(self, model, row: int, col: int) -> List[Move]:
+        """
+        Returns the legal moves of the piece on (row, col), or an empty list if there are none or they are not
+        known yet.
+        """
+        with self.__lock:
+            if self.__key != model.zobrist_hash:
+                return []
+            return list(self.__moves.get((row, col), ()))
+
+    def targets(self, model, row: int, col: int) -> Set[Tuple[int, int]]:
+        """
+        Returns the squares the piece on (row, col) can legally move to, for highlighting.
+        """
+        return {(move.to_row, move.to_col) for move in self.moves_from(model, row, col)}
+
+    def is_legal(self, model, move: Move) -> Optional[bool]:
+        """
+        Looks a move up without generating anything. A move that names no promotion piece matches a promotion to a
+        queen.
+        :return: bool, or None if the moves for this position are not known yet.
+        """
+        promotion = move.promotion or QUEEN
+        with self.__lock:
+            if self.__key != model.zobrist_hash:
+                return None
+            for legal in self.__moves.get((move.from_row, move.from_col), ()):
+                if legal.to_row == move.to_row and legal.to_col == move.to_col and \
+                        (legal.promotion is None or legal.promotion == promotion):
+                    return True
+            return False
@@ -1,11 +1,44 @@
+# promotion piece kinds (see chess_piece) to their UCI letters
+PROMOTION_LETTERS = {2: 'n', 3: 'b', 4: 'r', 5: 'q'}
+
+
 class Move:
-    def __init__(self, from_row, from_col, to_row, to_col):
+    # moves are made by the thousand during a search, so keep them small
+    __slots__ = ('from_row', 'from_col', 'to_row', 'to_col', 'promotion')
+
+    def __init__(self, from_row, from_col, to_row, to_col, promotion=None):
+        """
+        :param promotion: piece kind a pawn reaching the last rank becomes. None promotes to a queen.
+        """
         self.from_row = from_row
         self.from_col = from_col
         self.to_row = to_row
         self.to_col = to_col
+        self.promotion = promotion
 
     def __str__(self):
         output = f'Move [from_row={self.from_row}, from_col={self.from_col}'
-        output += f', to_row={self.to_row}, to_col={self.to_col}]'
-        return output	
+        output += f', to_row={self.to_row}, to_col={self.to_col}'
+        if self.promotion is not None:
+            output += f', promotion={self.promotion}'
+        return output + ']'
+
+    def __eq__(self, other):
+        if not isinstance(other, Move):
+            return NotImplemented
+        return (self.from_row == other.from_row and self.from_col == other.from_col
+                and self.to_row == other.to_row and self.to_col == other.to_col
+                and self.promotion == other.promotion)
+
+    def __hash__(self):
+        return hash((self.from_row, self.from_col, self.to_row, self.to_col, self.promotion))
+
+    def uci(self):
+        """
+        Returns the move in long algebraic (UCI) notation, e.g. 'e2e4' or 'e7e8n'. Row 0 is rank 8 and column 0 is
+        file a.
+        """
+        text = f'{"abcdefgh"[self.from_col]}{8 - self.from_row}{"abcdefgh"[self.to_col]}{8 - self.to_row}'
+        if self.promotion is not None:
+            text += PROMOTION_LETTERS[self.promotion]
+        return text
@@ -0,0 +1,97 @@
+from chess_piece import PAWN, QUEEN
+from move import Move
+from typing import List, Optional
+
+# Most-valuable-victim / least-valuable-attacker ranks a piece by its kind, which runs from PAWN lowest to KING
+
+# Score bands, so every capture sorts ahead of every killer, and every killer ahead of plain history moves
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 20
+KILLER_SCORE = 1 << 19
+PROMOTION_SCORE = CAPTURE_SCORE + 50
+
+KILLERS_PER_PLY = 2
+# History scores are halved once any of them passes this, so old results fade
+HISTORY_LIMIT = 1 << 16
+
+
+class MoveOrderer:
+    """
+    Sorts moves so the ones most likely to cause an alpha-beta cutoff are searched first: the transposition table
+    move, then captures by most valuable victim / least valuable attacker, then killer moves (quiet moves that
+    caused a cutoff at the same ply elsewhere in the tree), then the rest by their history score.
+
+    Keep one MoveOrderer per search and tell it about cutoffs through record_cutoff().
+    """
+
+    def __init__(self, max_ply: int = 128):
+        self.__killers: List[List[Optional[Move]]] = [[None] * KILLERS_PER_PLY for _ in range(max_ply)]
+        # history[from square][to square], squares numbered row * 8 + col
+        self.__history = [[0] * 64 for _ in range(64)]
+
+    def clear(self):
+        for killers in self.__killers:
+            for i in range(KILLERS_PER_PLY):
+                killers[i] = None
+        for row in self.__history:
+            for i in range(64):
+                row[i] = 0
+
+    def killers(self, ply: int) -> List[Optional[Move]]:
+        return list(self.__killers[ply]) if ply < len(self.__killers) else []
+
+    def history(self, move: Move) -> int:
+        return self.__history[move.from_row * 8 + move.from_col][move.to_row * 8 + move.to_col]
+
+    def score(self, model, move: Move, ply: int = 0, hash_move: Optional[Move] = None) -> int:
+        """
+        Returns how promising a move looks; higher is searched earlier.
+        :param model: the position the move is played from.
+        :param move: Move to score.
+        :param ply: int distance from the root, for the killer moves.
+        :param hash_move: Move the transposition table's best move for this position, if any.
+        """
+        if hash_move is not None and move == hash_move:
+            return HASH_MOVE_SCORE
+        victim = model.piece_at(move.to_row, move.to_col)
+        if victim is not None:
+            attacker = model.piece_at(move.from_row, move.from_col)
+            return CAPTURE_SCORE + 10 * victim.kind - attacker.kind
+        attacker = model.piece_at(move.from_row, move.from_col)
+        # under-promotions are rarely better than a queen, so they take their chances with the quiet moves
+        if attacker.kind == PAWN and move.to_row in (0, 7) and move.promotion in (None, QUEEN):
+            return PROMOTION_SCORE
+        if ply < len(self.__killers):
+            killers = self.__killers[ply]
+            for i in range(KILLERS_PER_PLY):
+                if killers[i] is not None and move == killers[i]:
+                    return KILLER_SCORE - i
+        return self.__history[move.from_row * 8 + move.from_col][move.to_row * 8 + move.to_col]
+
+    def order(self, model, moves: List[Move], ply: int = 0, hash_move: Optional[Move] = None) -> List[Move]:
+        """
+        Returns moves sorted best first. The sort is stable, so moves with equal scores keep their generated order.
+        """
+        return sorted(moves, key=lambda move: self.score(model, move, ply, hash_move), reverse=True)
+
+    def record_cutoff(self, model, move: Move, depth: int, ply: int):
+        """
+        Tells the orderer that move caused a beta cutoff at ply with depth plies left to search. Quiet moves become
+        killers for that ply and gain history; captures are already ordered well and are left alone.
+        """
+        if model.piece_at(move.to_row, move.to_col) is not None:
+            return
+        if ply < len(self.__killers):
+            killers = self.__killers[ply]
+            if killers[0] is None or move != killers[0]:
+                killers[1:] = killers[:-1]
+                killers[0] = move
+        from_sq = move.from_row * 8 + move.from_col
+        to_sq = move.to_row * 8 + move.to_col
+        # deeper cutoffs say more about a move, so they count for more
+        self.__history[from_sq][to_sq] += depth * depth
+        if self.__history[from_sq][to_sq] > HISTORY_LIMIT:
+            for row in self.__history:
+                for i in range(64):
+                    row[i] //= 2
+
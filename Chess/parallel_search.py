@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from move import Move
+from move_ordering import MoveOrderer
+from evaluation import evaluate
+from search import SearchEngine, SearchResult, MATE_SCORE, MATE_THRESHOLD
+from transposition import TranspositionTable
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# The engine each worker process searches with. Built once per process, so its transposition table is kept
+# between searches.
+_worker_engine = None
+
+
+def _init_worker(evaluate: Callable, table_mb: float, stopped):
+    global _worker_engine
+    _worker_engine = SearchEngine(evaluate, TranspositionTable(table_mb), stopped=stopped)
+
+
+def _search_moves(model, moves: List[Move], depth: Optional[int], movetime: Optional[float],
+                  nodes: Optional[int]) -> Tuple[Dict[int, SearchResult], int]:
+    # runs in a worker: search only this worker's share of the root moves, keeping every completed iteration
+    iterations = {}
+    result = _worker_engine.search(model, depth, movetime, nodes,
+                                   on_iteration=lambda r: iterations.__setitem__(r.depth, r), root_moves=moves)
+    return iterations, result.nodes
+
+
+class ParallelSearch:
+    """
+    Splits the moves at the root between worker processes, each searching its share on its own copy of the model
+    with its own transposition table, and merges the results. Has the same search() call as SearchEngine, so it can
+    be set as a model's engine.
+
+    The workers are started on first use and kept until close() (or the end of a with block).
+    """
+
+    def __init__(self, workers: Optional[int] = None, evaluate: Callable = evaluate, table_mb: float = 16):
+        """
+        :param workers: int number of worker processes. Defaults to the number of CPUs.
+        :param evaluate: the evaluation each worker uses. Must be a module-level function so it can be sent to them.
+        :param table_mb: float size of each worker's transposition table.
+        """
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        if self.workers < 1:
+            raise ValueError('workers must be at least 1')
+        self.evaluate = evaluate
+        self.table_mb = table_mb
+        self.__pool = None
+        self.__futures = []
+        # shared with every worker's engine, so one stop() reaches them all
+        self.__stopped = multiprocessing.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def stop(self):
+        """
+        Asks a search running on another thread to finish, as SearchEngine.stop() does: each worker returns within
+        CHECK_EVERY nodes, and shares no worker has taken up yet are dropped. The request holds until clear_stop().
+        """
+        self.__stopped.set()
+        for future in self.__futures:
+            future.cancel()
+
+    def clear_stop(self):
+        """
+        Takes back stop(), as SearchEngine.clear_stop() does.
+        """
+        self.__stopped.clear()
+
+    def search(self, model, depth: Optional[int] = None, movetime: Optional[float] = None,
+               nodes: Optional[int] = None, on_iteration: Optional[Callable[[SearchResult], None]] = None) \
+            -> SearchResult:
+        """
+        Searches like SearchEngine.search(), with the node budget shared out between the workers. The result is
+        the best move at the deepest iteration every worker completed, and nodes is the total over all workers.
+        :param on_iteration: called once, with the merged result; the workers' own iterations are not seen here.
+        """
+        start = time.perf_counter()
+        moves = model.legal_moves()
+        if not moves:
+            score = -MATE_SCORE if model.in_check(model.current_player) else 0
+            return SearchResult(None, score, 0, 0, 0.0)
+
+        # deal the moves out best first, so every worker gets some of the likely good ones
+        moves = MoveOrderer().order(model, moves)
+        shares = [moves[i::self.workers] for i in range(min(self.workers, len(moves)))]
+        worker_nodes = nodes // len(shares) if nodes is not None else None
+
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                              initargs=(self.evaluate, self.table_mb, self.__stopped))
+        futures = [self.__pool.submit(_search_moves, model, share, depth, movetime, worker_nodes)
+                   for share in shares]
+        self.__futures = futures
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except CancelledError:
+                # stopped before a worker took this share up
+                results.append(({}, 0))
+
+        total_nodes = sum(searched for _, searched in results)
+        elapsed = time.perf_counter() - start
+        best = _merge([iterations for iterations, _ in results])
+        if best is None:
+            return SearchResult(moves[0], 0, 0, total_nodes, elapsed)
+        best = best._replace(nodes=total_nodes, seconds=elapsed)
+        if on_iteration is not None:
+            on_iteration(best)
+        return best
+
+
+def _merge(worker_iterations: List[Dict[int, SearchResult]]) -> Optional[SearchResult]:
+    # Scores are only comparable at the same depth, so compare at the deepest iteration all workers finished. A
+    # worker that found a mate stops early, but its mate holds at any depth, so its last result counts regardless.
+    finished = [iterations[max(iterations)] for iterations in worker_iterations if iterations]
+    if len(finished) < len(worker_iterations):
+        return None
+    unmated = [result.depth for result in finished if abs(result.score) <= MATE_THRESHOLD]
+    depth = min(unmated) if unmated else max(result.depth for result in finished)
+    candidates = [iterations.get(depth, iterations[max(iterations)]) for iterations in worker_iterations]
+    best = max(candidates, key=lambda r: r.score)
+    return best._replace(depth=depth)
+
+
+def map_in_order(function: Callable, arguments: Iterable[tuple], workers: int = 1, backlog: int = 4,
+                 **options) -> Iterator:
+    """
+    Yields function(*args, **options) for each args in arguments, in the order they come, spread over worker
+    processes. function must be module-level, so it can be sent to them.
+    :param workers: int processes to use. 1 runs everything in this process.
+    :param backlog: int calls queued per worker. Only this many are read ahead of the results, so memory stays
+     bounded however long arguments runs.
+    """
+    if workers <= 1:
+        for args in arguments:
+            yield function(*args, **options)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for args in arguments:
+            pending.append(pool.submit(function, *args, **options))
+            if len(pending) >= workers * backlog:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -2,11 +2,14 @@ from player import Player
 from abc import ABC, abstractmethod
 from enum import Enum
 from move import Move
-from typing import List
-from chess_piece import ChessPiece
+from typing import Iterator, List, Tuple
+from chess_piece import ChessPiece, PAWN
 
 
 class Pawn(ChessPiece):
+    __slots__ = ()
+    kind = PAWN
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -16,6 +19,22 @@ class Pawn(ChessPiece):
     def type(self):
         return f"Pawn"
 
+    def targets(self, row: int, col: int, board: List[List['ChessPiece']]) -> Iterator[Tuple[int, int]]:
+        direction = -1 if self.player == Player.WHITE else 1
+        r = row + direction
+        if not 0 <= r < 8:
+            return
+        # forward one square, or two from the starting row, onto empty squares only
+        if board[r][col] is None:
+            yield r, col
+            start_row = 6 if self.player == Player.WHITE else 1
+            if row == start_row and board[r + direction][col] is None:
+                yield r + direction, col
+        # diagonal captures
+        for c in (col - 1, col + 1):
+            if 0 <= c < 8 and board[r][c] is not None and board[r][c].player != self.player:
+                yield r, c
+
     def is_valid_move(self, move: Move, board: List[List['ChessPiece']]) -> bool:
         if not super().is_valid_move(move, board):
             return False
@@ -0,0 +1,95 @@
+import argparse
+import sys
+import time
+from chess_model import ChessModel
+from bitboard_model import BACKENDS
+from fen import STARTING_FEN, read_positions
+from typing import Dict, Iterable, Iterator, NamedTuple
+
+
+class PerftPosition(NamedTuple):
+    """
+    A position, given as a FEN record, with its published perft counts by depth.
+    """
+    name: str
+    fen: str
+    nodes: Dict[int, int]
+
+
+# Counts are the standard published ones. Kiwipete and cpw positions 3 to 5 are there for castling, en passant and
+# under-promotion, which the start position doesn't reach at these depths.
+REFERENCE_POSITIONS = [
+    PerftPosition('start', STARTING_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    PerftPosition('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                  {1: 48, 2: 2039, 3: 97862}),
+    PerftPosition('rook ending', '4k3/8/8/8/8/8/8/4K2R w K - 0 1', {1: 15, 2: 66, 3: 1197, 4: 7059}),
+    PerftPosition('bishop ending', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', {1: 13, 2: 102, 3: 1266}),
+    PerftPosition('cpw position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', {1: 14, 2: 191, 3: 2812, 4: 43238}),
+    PerftPosition('cpw position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                  {1: 6, 2: 264, 3: 9467}),
+    PerftPosition('cpw position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+                  {1: 44, 2: 1486, 3: 62379}),
+    PerftPosition('cpw position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                  {1: 46, 2: 2079, 3: 89890}),
+]
+
+
+def positions_from_epd(path: str) -> Iterator[PerftPosition]:
+    """
+    Streams perft positions from an EPD file in the usual perft suite format, where each position is followed by
+    its counts as operations: '<fen> ;D1 20 ;D2 400'. Lines without counts are skipped.
+    """
+    for record in read_positions(path):
+        nodes = {int(opcode[1:]): int(operand) for opcode, operand in record.operations.items()
+                 if opcode[:1] == 'D' and opcode[1:].isdigit()}
+        if nodes:
+            yield PerftPosition(record.operations.get('id', f'line {record.line}'), record.fen, nodes)
+
+
+def run(positions: Iterable[PerftPosition], max_depth: int, model_class=ChessModel, divide: bool = False) -> bool:
+    """
+    Runs perft on each position up to max_depth (or its deepest published count), printing the node count, time
+    and nodes per second for each depth.
+    :return: bool True if every count matched the published one.
+    """
+    all_correct = True
+    for position in positions:
+        print(f'{position.name} ({model_class.__name__})')
+        for depth in sorted(position.nodes):
+            if depth > max_depth:
+                break
+            model = model_class.from_fen(position.fen)
+            start = time.perf_counter()
+            nodes = model.perft(depth)
+            elapsed = time.perf_counter() - start
+            expected = position.nodes[depth]
+            status = 'ok' if nodes == expected else f'WRONG (expected {expected})'
+            all_correct = all_correct and nodes == expected
+            print(f'  depth {depth}: {nodes} nodes in {elapsed:.3f}s, {nodes / max(elapsed, 1e-9):,.0f} nodes/s {status}')
+            if divide and nodes != expected:
+                for move, count in sorted(model.perft_divide(depth).items()):
+                    print(f'    {move}: {count}')
+    return all_correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft correctness and speed check for the chess model')
+    parser.add_argument('--depth', type=int, default=3, help='deepest depth to run (default 3)')
+    parser.add_argument('--backend', choices=BACKENDS, default='list', help='board representation to test')
+    parser.add_argument('--position', help='only run the reference position with this name')
+    parser.add_argument('--epd', help='run the positions in this EPD file instead of the reference ones')
+    parser.add_argument('--divide', action='store_true', help='print per-move counts when a total is wrong')
+    args = parser.parse_args()
+
+    if args.epd is not None:
+        positions = positions_from_epd(args.epd)
+    else:
+        positions = [p for p in REFERENCE_POSITIONS if args.position is None or p.name == args.position]
+        if not positions:
+            parser.error(f'unknown position {args.position!r}')
+    if not run(positions, args.depth, BACKENDS[args.backend], args.divide):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
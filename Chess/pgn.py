@@ -0,0 +1,257 @@
+import argparse
+import re
+from chess_model import ChessModel, GameStatus
+from bitboard_model import BACKENDS
+from chess_piece import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from fen import FENError
+from move import Move
+from parallel_search import map_in_order
+from player import Player
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SAN_KINDS = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|[()]|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};$]+')
+_SAN = re.compile(r'([NBRQK])?([a-h])?([1-8])?(x)?([a-h])([1-8])(?:=?([NBRQ]))?')
+
+
+class PGNError(ValueError):
+    pass
+
+
+class PGNGame(NamedTuple):
+    """
+    One game from a PGN file: its tag pairs, its main line as SAN strings (comments, variations, move numbers and
+    annotation glyphs removed) and its result token.
+    """
+    headers: Dict[str, str]
+    moves: List[str]
+    result: str
+
+
+class PlyReport(NamedTuple):
+    """
+    What happened when one move of a game was replayed. move is None and legal False when the SAN could not be
+    played, and then error says why.
+    """
+    ply: int
+    san: str
+    move: Optional[Move]
+    legal: bool
+    check: bool
+    status: GameStatus
+    error: Optional[str] = None
+
+
+class GameReport(NamedTuple):
+    """
+    The summary of replaying one game: how many plies were played, whether all of them were legal, how the game
+    stood at the end and, for a game that could not be replayed to the end, the first error.
+    """
+    headers: Dict[str, str]
+    plies: int
+    legal: bool
+    status: GameStatus
+    result: str
+    fen: str
+    error: Optional[str] = None
+
+
+def read_games(source: Union[str, Iterable[str]]) -> Iterator[PGNGame]:
+    """
+    Reads PGN games one at a time, so a file of any size can be processed while only one game is held in memory.
+    :param source: str path of the file, or any iterable of lines (an open file, a list of strings).
+    :return: generator of PGNGame.
+    """
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', errors='replace') as lines:
+            yield from read_games(lines)
+        return
+
+    headers = {}
+    movetext = []
+    open_comment = False
+    for line in source:
+        stripped = line.strip()
+        # a tag pair after some movetext starts the next game
+        if not open_comment and stripped.startswith('['):
+            if movetext:
+                yield parse_movetext(headers, '\n'.join(movetext))
+                headers, movetext = {}, []
+            match = _TAG.match(stripped)
+            if match is not None:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+            continue
+        if line.startswith('%'):
+            # escaped line
+            continue
+        if stripped:
+            movetext.append(stripped)
+            open_comment = _ends_in_comment(stripped, open_comment)
+    if movetext or headers:
+        yield parse_movetext(headers, '\n'.join(movetext))
+
+
+def _ends_in_comment(line: str, open_comment: bool) -> bool:
+    # whether a brace comment is still open at the end of line; a ; comment always ends with its line
+    for ch in line:
+        if open_comment:
+            open_comment = ch != '}'
+        elif ch == '{':
+            open_comment = True
+        elif ch == ';':
+            break
+    return open_comment
+
+
+def parse_movetext(headers: Dict[str, str], movetext: str) -> PGNGame:
+    """
+    Splits the movetext of one game into its main-line SAN moves and its result.
+    """
+    moves = []
+    result = headers.get('Result', '*')
+    depth = 0
+    for token in _TOKEN.findall(movetext):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(0, depth - 1)
+        elif depth or token[0] in '{;$' or token[0].isdigit() and token.rstrip('.') != token:
+            # variations, comments, annotation glyphs and move numbers
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return PGNGame(headers, moves, result)
+
+
+def san_to_move(model: ChessModel, san: str) -> Move:
+    """
+    Finds the legal move that SAN (standard algebraic notation, e.g. 'Nbd7', 'exd5', 'e8=Q+') stands for in
+    model's current position.
+    :raises PGNError: if san cannot be parsed, is not legal or is ambiguous.
+    """
+    text = san.rstrip('+#!?')
+    if text in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        row = 7 if model.current_player == Player.WHITE else 0
+        move = Move(row, 4, row, 6 if len(text) == 3 else 2)
+        if model.piece_at(row, 4) is None or model.piece_at(row, 4).kind != KING or not model.is_valid_move(move):
+            raise PGNError(f'{san}: illegal move')
+        return move
+    match = _SAN.fullmatch(text)
+    if match is None:
+        raise PGNError(f'{san}: not a SAN move')
+    letter, from_file, from_rank, capture, to_file, to_rank, promotion = match.groups()
+    kind = SAN_KINDS[letter] if letter is not None else PAWN
+    to_row, to_col = 8 - int(to_rank), 'abcdefgh'.index(to_file)
+    # a promotion written without its piece is taken to be a queen
+    promotion = SAN_KINDS[promotion] if promotion is not None else QUEEN
+
+    candidates = []
+    for move in model.iter_legal_moves():
+        if move.to_row != to_row or move.to_col != to_col:
+            continue
+        if move.promotion is not None and move.promotion != promotion:
+            continue
+        piece = model.piece_at(move.from_row, move.from_col)
+        if piece.kind != kind:
+            continue
+        if from_file is not None and move.from_col != 'abcdefgh'.index(from_file):
+            continue
+        if from_rank is not None and move.from_row != 8 - int(from_rank):
+            continue
+        candidates.append(move)
+    if not candidates:
+        raise PGNError(f'{san}: illegal move')
+    if len(candidates) > 1:
+        raise PGNError(f'{san}: ambiguous move')
+    return candidates[0]
+
+
+def _setup(game: PGNGame, model_class) -> ChessModel:
+    # a game can start from a set-up position given in its FEN tag
+    if 'FEN' in game.headers:
+        try:
+            return model_class.from_fen(game.headers['FEN'])
+        except FENError as e:
+            raise PGNError(f'bad FEN tag: {e}') from None
+    return model_class()
+
+
+def replay(game: PGNGame, model_class=ChessModel) -> Iterator[PlyReport]:
+    """
+    Plays a game through a model one move at a time, yielding a PlyReport after each. Replay stops at the first
+    move that can't be played, after yielding its report.
+    """
+    try:
+        model = _setup(game, model_class)
+    except PGNError as e:
+        yield PlyReport(0, '', None, False, False, GameStatus.Ongoing, str(e))
+        return
+    for ply, san in enumerate(game.moves, 1):
+        try:
+            move = san_to_move(model, san)
+        except PGNError as e:
+            yield PlyReport(ply, san, None, False, model.in_check(model.current_player), model.is_complete(), str(e))
+            return
+        model.move(move)
+        yield PlyReport(ply, san, move, True, model.in_check(model.current_player), model.is_complete())
+
+
+def analyse_game(game: PGNGame, model_class=ChessModel) -> GameReport:
+    """
+    Replays a whole game and sums it up. The per-ply reports are not kept, so this is cheap to send back from a
+    worker process.
+    """
+    try:
+        model = _setup(game, model_class)
+    except PGNError as e:
+        return GameReport(game.headers, 0, False, GameStatus.Ongoing, game.result, '', str(e))
+    plies = 0
+    error = None
+    for san in game.moves:
+        try:
+            model.move(san_to_move(model, san))
+        except PGNError as e:
+            error = f'ply {plies + 1}: {e}'
+            break
+        plies += 1
+    return GameReport(game.headers, plies, error is None, model.is_complete(), game.result, model.fen(), error)
+
+
+def analyse_games(games: Iterable[PGNGame], workers: int = 1, model_class=ChessModel,
+                  backlog: int = 4) -> Iterator[GameReport]:
+    """
+    Runs analyse_game() over a stream of games, in the order they come.
+    :param games: iterable of PGNGame, e.g. read_games(path).
+    :param workers: int processes to spread the games over. 1 runs everything in this process.
+    :param model_class: ChessModel or BitboardChessModel.
+    :param backlog: int games queued per worker. Only this many are read ahead of the results, so memory stays
+     bounded however long the input is.
+    :return: generator of GameReport.
+    """
+    return map_in_order(analyse_game, ((game, model_class) for game in games), workers, backlog)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the games in a PGN file through the chess model')
+    parser.add_argument('pgn', help='PGN file to read')
+    parser.add_argument('--workers', type=int, default=1, help='processes to spread the games over (default 1)')
+    parser.add_argument('--backend', choices=BACKENDS, default='list', help='board representation to use')
+    args = parser.parse_args()
+
+    games = legal = 0
+    for report in analyse_games(read_games(args.pgn), args.workers, BACKENDS[args.backend]):
+        games += 1
+        legal += report.legal
+        players = f'{report.headers.get("White", "?")} - {report.headers.get("Black", "?")}'
+        outcome = report.error if report.error is not None else report.status.name
+        print(f'{games}\t{players}\t{report.result}\t{report.plies} plies\t{outcome}')
+    print(f'{legal} of {games} games replayed without errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
-from chess_piece import ChessPiece
+from chess_piece import ChessPiece, QUEEN, ORTHOGONAL, DIAGONAL
 from player import Player
 from move import Move
-from typing import List
+from typing import Iterator, List, Tuple
 
 
 class Queen(ChessPiece):
+    __slots__ = ()
+    kind = QUEEN
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -14,6 +17,9 @@ class Queen(ChessPiece):
     def type(self):
         return 'Queen'
 
+    def targets(self, row: int, col: int, board: List[List['ChessPiece']]) -> Iterator[Tuple[int, int]]:
+        return self._slide(row, col, board, ORTHOGONAL + DIAGONAL)
+
     def is_valid_move(self, move: Move, board: List[List['ChessPiece']]) -> bool:
         if not super().is_valid_move(move, board):
             return False
@@ -1,10 +1,13 @@
-from chess_piece import ChessPiece
+from chess_piece import ChessPiece, ROOK, ORTHOGONAL
 from player import Player
 from move import Move
-from typing import List
+from typing import Iterator, List, Tuple
 
 
 class Rook(ChessPiece):
+    __slots__ = ()
+    kind = ROOK
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -14,6 +17,9 @@ class Rook(ChessPiece):
     def type(self):
         return "Rook"
   
+    def targets(self, row: int, col: int, board: List[List[ChessPiece]]) -> Iterator[Tuple[int, int]]:
+        return self._slide(row, col, board, ORTHOGONAL)
+
     def is_valid_move(self, move: Move, board: List[List[ChessPiece]]) -> bool:
         if not super().is_valid_move(move, board):
             return False
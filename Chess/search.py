@@ -0,0 +1,231 @@
+import threading
+import time
+from evaluation import evaluate
+from move import Move
+from transposition import Bound, TranspositionTable
+from move_ordering import MoveOrderer
+from typing import Callable, List, NamedTuple, Optional
+
+# Larger than any material score; a mate found n plies from the root scores MATE_SCORE - n
+MATE_SCORE = 100000
+# Scores beyond this are mates, and need adjusting by ply when they go in and out of the transposition table
+MATE_THRESHOLD = MATE_SCORE - 1000
+INFINITY = MATE_SCORE + 1
+# Deepest iteration when only a time or node budget is given
+MAX_DEPTH = 64
+# How many nodes to search between looks at the clock
+CHECK_EVERY = 256
+
+
+class SearchResult(NamedTuple):
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    seconds: float
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+
+class SearchAborted(Exception):
+    # raised inside the search when the time or node budget runs out, or stop() is called
+    pass
+
+
+class SearchEngine:
+    """
+    Negamax search with alpha-beta pruning, iterative deepening, a transposition table, move ordering and a
+    capture-only quiescence search at the leaves. Works on anything with the ChessModel API.
+    """
+
+    def __init__(self, evaluate: Callable = evaluate, table: Optional[TranspositionTable] = None,
+                 orderer: Optional[MoveOrderer] = None, stopped=None):
+        self.evaluate = evaluate
+        self.table = table if table is not None else TranspositionTable()
+        self.orderer = orderer if orderer is not None else MoveOrderer()
+        self.nodes = 0
+        self.__deadline = None
+        self.__node_limit = None
+        # an Event another process can set (a multiprocessing.Event) may be passed in, to stop this engine from there
+        self.__stopped = stopped if stopped is not None else threading.Event()
+
+    def stop(self):
+        """
+        Asks a search running on another thread to finish. It returns within CHECK_EVERY nodes, with the result of
+        the deepest iteration it completed. A search that has not got going yet stops as soon as it does: the
+        request holds until clear_stop().
+        """
+        self.__stopped.set()
+
+    def clear_stop(self):
+        """
+        Takes back stop(), so searches run to their limits again. Call it before handing the search to another
+        thread, not from that thread, or a stop() made in between would be lost.
+        """
+        self.__stopped.clear()
+
+    def search(self, model, depth: Optional[int] = None, movetime: Optional[float] = None,
+               nodes: Optional[int] = None, on_iteration: Optional[Callable[[SearchResult], None]] = None,
+               root_moves: Optional[List[Move]] = None) -> SearchResult:
+        """
+        Finds the best move for the side to move, searching one ply deeper each iteration until a limit is hit.
+        With no limits at all it searches to depth 3.
+        :param model: the position to search. It is left as it was found.
+        :param depth: int deepest iteration to run.
+        :param movetime: float seconds to spend at most.
+        :param nodes: int positions to visit at most.
+        :param on_iteration: called with the SearchResult of each completed iteration.
+        :param root_moves: only consider these (legal) moves at the root, for splitting a search between workers.
+        :return: SearchResult of the deepest completed iteration. If even depth 1 did not finish, the move is the
+         best one found so far (or the first legal move) and depth is 0.
+        """
+        if depth is None:
+            depth = 3 if movetime is None and nodes is None else MAX_DEPTH
+        start = time.perf_counter()
+        self.nodes = 0
+        self.__deadline = start + movetime if movetime is not None else None
+        self.__node_limit = nodes
+        self.table.new_search()
+        self.orderer.clear()
+
+        moves = model.legal_moves() if root_moves is None else list(root_moves)
+        if not moves:
+            score = -MATE_SCORE if model.in_check(model.current_player) else 0
+            return SearchResult(None, score, 0, 0, 0.0)
+        moves = self.orderer.order(model, moves)
+        result = SearchResult(moves[0], 0, 0, 0, 0.0)
+
+        history_length = len(model.move_history)
+        for iteration in range(1, depth + 1):
+            try:
+                score, move = self.__root(model, moves, iteration, root_moves is None)
+            except SearchAborted:
+                # put the model back the way it was found
+                while len(model.move_history) > history_length:
+                    model.undo()
+                break
+            result = SearchResult(move, score, iteration, self.nodes, time.perf_counter() - start)
+            if on_iteration is not None:
+                on_iteration(result)
+            # a forced mate will not get any better by searching deeper
+            if abs(score) > MATE_THRESHOLD:
+                break
+            # search the best move first next time
+            moves.remove(move)
+            moves.insert(0, move)
+        return result._replace(nodes=self.nodes, seconds=time.perf_counter() - start)
+
+    def __root(self, model, moves: List[Move], depth: int, all_moves: bool):
+        alpha = -INFINITY
+        best_move = moves[0]
+        for move in moves:
+            model.move(move)
+            score = -self.__negamax(model, depth - 1, -INFINITY, -alpha, 1)
+            model.undo()
+            if score > alpha:
+                alpha = score
+                best_move = move
+        # the best of a subset of the moves is not the position's value, so only a full root is stored
+        if all_moves:
+            self.table.store(model.zobrist_hash, depth, alpha, Bound.Exact, best_move)
+        return alpha, best_move
+
+    def __count_node(self):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            if self.__stopped.is_set():
+                raise SearchAborted
+            if self.__deadline is not None and time.perf_counter() >= self.__deadline:
+                raise SearchAborted
+        if self.__node_limit is not None and self.nodes >= self.__node_limit:
+            raise SearchAborted
+
+    def __negamax(self, model, depth: int, alpha: int, beta: int, ply: int) -> int:
+        if depth <= 0:
+            return self.__quiescence(model, alpha, beta)
+        self.__count_node()
+        # a position seen before on the way here can be repeated for ever, so it is scored as the draw it leads to
+        if model.halfmove_clock >= 100 or model.repetitions() > 1:
+            return 0
+
+        key = model.zobrist_hash
+        entry = self.table.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry.move
+            if entry.depth >= depth:
+                score = _score_from_table(entry.score, ply)
+                if entry.bound == Bound.Exact:
+                    return score
+                if entry.bound == Bound.Lower and score >= beta:
+                    return score
+                if entry.bound == Bound.Upper and score <= alpha:
+                    return score
+
+        moves = model.legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply if model.in_check(model.current_player) else 0
+        moves = self.orderer.order(model, moves, ply, tt_move)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            model.move(move)
+            score = -self.__negamax(model, depth - 1, -beta, -alpha, ply + 1)
+            model.undo()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.orderer.record_cutoff(model, move, depth, ply)
+                        break
+
+        if best_score >= beta:
+            bound = Bound.Lower
+        elif best_score > original_alpha:
+            bound = Bound.Exact
+        else:
+            bound = Bound.Upper
+        self.table.store(key, depth, _score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def __quiescence(self, model, alpha: int, beta: int) -> int:
+        # only captures are searched past the horizon, so a leaf is never scored in the middle of an exchange
+        self.__count_node()
+        stand_pat = self.evaluate(model)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        captures = [move for move in model.legal_moves() if model.piece_at(move.to_row, move.to_col) is not None]
+        for move in self.orderer.order(model, captures):
+            model.move(move)
+            score = -self.__quiescence(model, -beta, -alpha)
+            model.undo()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+
+def _score_to_table(score: int, ply: int) -> int:
+    # mate scores are stored relative to the node, not the root
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score > MATE_THRESHOLD:
+        return score - ply
+    if score < -MATE_THRESHOLD:
+        return score + ply
+    return score
@@ -0,0 +1,228 @@
+import argparse
+import json
+import random
+import sys
+import time
+from chess_model import MODES, AIMode, ChessModel, GameStatus
+from bitboard_model import BACKENDS
+from book import OpeningBook
+from fen import STARTING_FEN
+from parallel_search import map_in_order
+from player import Player
+from search import SearchEngine
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO
+
+
+class EngineConfig(NamedTuple):
+    """
+    One side of a match: the ai() mode it plays with and, for search, its limits. name is what it is reported as.
+    """
+    name: str
+    mode: AIMode
+    depth: Optional[int] = None
+    movetime: Optional[float] = None
+    nodes: Optional[int] = None
+
+
+class GameResult(NamedTuple):
+    """
+    How one game went: the result token ('1-0', '0-1', '1/2-1/2', or '*' when it hit the ply limit or a side
+    found no move), the final status, the moves in UCI notation, and for each colour how many ai() calls it made
+    and the seconds they took.
+    """
+    game: int
+    white: str
+    black: str
+    result: str
+    status: GameStatus
+    plies: int
+    moves: List[str]
+    seconds: float
+    white_calls: int
+    white_seconds: float
+    black_calls: int
+    black_seconds: float
+    fen: str
+
+
+def parse_engine(spec: str) -> EngineConfig:
+    """
+    Reads an engine from the command line form 'heuristic' or 'search:depth=3,movetime=0.5,nodes=20000' (any of
+    the limits may be left out).
+    :raises ValueError: if spec is not in that form.
+    """
+    mode, _, options = spec.partition(':')
+    if mode not in MODES:
+        raise ValueError(f'unknown engine mode {mode!r}')
+    limits = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key in ('depth', 'nodes'):
+            limits[key] = int(value)
+        elif key == 'movetime':
+            limits[key] = float(value)
+        else:
+            raise ValueError(f'unknown engine option {key!r}')
+    return EngineConfig(spec, MODES[mode], **limits)
+
+
+def play_game(game: int, white: EngineConfig, black: EngineConfig, max_plies: int = 200, random_plies: int = 0,
+              seed: int = 0, fen: str = STARTING_FEN, model_class=ChessModel, book: Optional[str] = None) -> GameResult:
+    """
+    Plays one game between two engines, without a GUI.
+    :param game: int number of the game, reported back and mixed into the seed.
+    :param max_plies: int plies after which the game is stopped unfinished.
+    :param random_plies: int random legal moves to open with, so games between deterministic engines differ.
+    :param seed: int seed for those random moves.
+    :param fen: str the position to start from.
+    :param model_class: ChessModel or BitboardChessModel.
+    :param book: str path of an opening book both sides play from while they can.
+    :return: GameResult.
+    """
+    model = model_class.from_fen(fen)
+    if book is not None:
+        model.book = OpeningBook(book)
+    rng = random.Random(seed * 1000003 + game)
+    configs = {Player.WHITE: white, Player.BLACK: black}
+    # each side keeps its own transposition table from move to move
+    engines = {Player.WHITE: SearchEngine(), Player.BLACK: SearchEngine()}
+    calls = {Player.WHITE: 0, Player.BLACK: 0}
+    spent = {Player.WHITE: 0.0, Player.BLACK: 0.0}
+    stuck = False
+
+    start = time.perf_counter()
+    for _ in range(random_plies):
+        moves = model.legal_moves()
+        if not moves or model.is_complete():
+            break
+        model.move(rng.choice(moves))
+    while len(model.move_history) < max_plies and not model.is_complete():
+        player = model.current_player
+        config = configs[player]
+        model.engine = engines[player]
+        before = time.perf_counter()
+        stuck = model.ai(config.mode, config.depth, config.movetime, config.nodes)
+        spent[player] += time.perf_counter() - before
+        calls[player] += 1
+        if stuck:
+            break
+    seconds = time.perf_counter() - start
+    if model.book is not None:
+        model.book.close()
+
+    status = model.is_complete()
+    if status == GameStatus.Checkmate:
+        # the side to move is the one mated
+        result = '0-1' if model.current_player == Player.WHITE else '1-0'
+    elif status:
+        result = '1/2-1/2'
+    else:
+        result = '*'
+    return GameResult(game, white.name, black.name, result, status, len(model.move_history),
+                      [record.move.uci() for record in model.move_history], seconds,
+                      calls[Player.WHITE], spent[Player.WHITE], calls[Player.BLACK], spent[Player.BLACK], model.fen())
+
+
+def run_tournament(first: EngineConfig, second: EngineConfig, games: int, workers: int = 1, backlog: int = 4,
+                   **options) -> Iterator[GameResult]:
+    """
+    Plays a match of games between two engines, swapping colours every game, and yields the results in game order.
+    :param workers: int processes to spread the games over. 1 plays everything in this process.
+    :param backlog: int games queued per worker ahead of the results.
+    :param options: passed on to play_game() (max_plies, random_plies, seed, fen, model_class, book).
+    :return: generator of GameResult.
+    """
+    pairings = ((game, first, second) if game % 2 == 0 else (game, second, first) for game in range(games))
+    return map_in_order(play_game, pairings, workers, backlog, **options)
+
+
+def result_to_json(result: GameResult) -> str:
+    """
+    Writes a GameResult as one line of JSON.
+    """
+    record = result._asdict()
+    record['status'] = result.status.name
+    return json.dumps(record)
+
+
+class Standings:
+    """
+    Running totals for a match, by engine name: points (unfinished games count as half a point each), ai() calls
+    and the time spent in them, and the length of the games played.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.plies = 0
+        self.points: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, result: GameResult):
+        self.games += 1
+        self.plies += result.plies
+        white_points = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}.get(result.result, 0.5)
+        for name, points, calls, seconds in ((result.white, white_points, result.white_calls, result.white_seconds),
+                                             (result.black, 1 - white_points, result.black_calls,
+                                              result.black_seconds)):
+            self.points[name] = self.points.get(name, 0.0) + points
+            self.calls[name] = self.calls.get(name, 0) + calls
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def report(self) -> List[str]:
+        """
+        Returns the summary as printable lines.
+        """
+        lines = [f'{self.games} games, {self.plies / max(self.games, 1):.1f} plies on average']
+        for name in self.points:
+            calls, seconds = self.calls[name], self.seconds[name]
+            lines.append(f'{name}: {self.points[name]:g}/{self.games} points, {calls} moves, '
+                         f'{seconds / max(calls, 1) * 1000:.1f} ms per ai() call, '
+                         f'{calls / seconds if seconds > 0 else 0.0:.1f} moves/s')
+        return lines
+
+
+def write_results(results: Iterable[GameResult], output: TextIO) -> Standings:
+    """
+    Writes each result to output as a JSON line as soon as it comes in, and returns the totals.
+    """
+    standings = Standings()
+    for result in results:
+        output.write(result_to_json(result) + '\n')
+        output.flush()
+        standings.add(result)
+    return standings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play games between two engine configurations without the GUI')
+    parser.add_argument('first', type=parse_engine, help="engine, e.g. 'heuristic' or 'search:depth=2'")
+    parser.add_argument('second', type=parse_engine, help='engine it plays against')
+    parser.add_argument('--games', type=int, default=10, help='games to play, colours alternating (default 10)')
+    parser.add_argument('--workers', type=int, default=1, help='processes to spread the games over (default 1)')
+    parser.add_argument('--max-plies', type=int, default=200, help='plies before a game is stopped (default 200)')
+    parser.add_argument('--random-plies', type=int, default=0, help='random moves each game opens with (default 0)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random opening moves')
+    parser.add_argument('--fen', default=STARTING_FEN, help='position every game starts from')
+    parser.add_argument('--backend', choices=BACKENDS, default='list', help='board representation to use')
+    parser.add_argument('--book', help='opening book file (see book.py) for both sides')
+    parser.add_argument('--output', help='JSONL file for the results (default standard output)')
+    args = parser.parse_args()
+
+    results = run_tournament(args.first, args.second, args.games, args.workers, max_plies=args.max_plies,
+                             random_plies=args.random_plies, seed=args.seed, fen=args.fen,
+                             model_class=BACKENDS[args.backend], book=args.book)
+    start = time.perf_counter()
+    if args.output is None:
+        standings = write_results(results, sys.stdout)
+    else:
+        with open(args.output, 'w') as output:
+            standings = write_results(results, output)
+    # the summary goes to stderr so the JSON lines can be piped on their own
+    for line in standings.report():
+        print(line, file=sys.stderr)
+    print(f'{standings.games / (time.perf_counter() - start):.2f} games/s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+from enum import Enum
+from move import Move
+from typing import Dict, List, NamedTuple, Optional
+
+
+class Bound(Enum):
+    Exact = 1  # the score is the true value of the position at this depth
+    Lower = 2  # the search failed high, the true value is at least the score
+    Upper = 3  # the search failed low, the true value is at most the score
+
+
+class TTEntry(NamedTuple):
+    key: int
+    depth: int
+    score: int
+    bound: Bound
+    move: Optional[Move]
+    generation: int
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results keyed by a position's Zobrist hash.
+
+    Each bucket has two slots. The first is depth-preferred: it keeps the deepest result, unless that result is left
+    over from an earlier search. The second is always-replace, so recent shallow results still get cached when the
+    first slot is taken. The table never grows past the number of buckets chosen when it is created.
+    """
+
+    # Rough size in bytes of one stored entry (the tuple, its ints and the slot pointing to it). Python does not let
+    # us pack entries tightly, so the memory cap is an estimate based on this.
+    ENTRY_BYTES = 200
+
+    def __init__(self, size_mb: float = 16):
+        if size_mb <= 0:
+            raise ValueError('size_mb must be positive')
+        self.__buckets = max(1, int(size_mb * 1024 * 1024) // (2 * self.ENTRY_BYTES))
+        self.__depth_slots: List[Optional[TTEntry]] = [None] * self.__buckets
+        self.__recent_slots: List[Optional[TTEntry]] = [None] * self.__buckets
+        self.__generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def buckets(self) -> int:
+        return self.__buckets
+
+    @property
+    def capacity(self) -> int:
+        return 2 * self.__buckets
+
+    def __len__(self):
+        return (sum(1 for e in self.__depth_slots if e is not None) +
+                sum(1 for e in self.__recent_slots if e is not None))
+
+    def new_search(self):
+        """
+        Marks the start of a new search. Entries from earlier searches stay usable, but can be replaced by shallower
+        new ones in the depth-preferred slot.
+        """
+        self.__generation += 1
+
+    def probe(self, key: int) -> Optional[TTEntry]:
+        """
+        Looks up a position.
+        :param key: int the position's Zobrist hash.
+        :return: The stored TTEntry, or None if the position is not in the table.
+        """
+        index = key % self.__buckets
+        entry = self.__depth_slots[index]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        entry = self.__recent_slots[index]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, score: int, bound: Bound, move: Optional[Move] = None):
+        """
+        Saves a search result, choosing the slot by the replacement scheme described on the class.
+        :param key: int the position's Zobrist hash.
+        :param depth: int how many plies deep the position was searched.
+        :param score: int the score found, from the point of view of the side to move.
+        :param bound: Bound whether score is exact or only a bound.
+        :param move: Move the best move found, if any.
+        """
+        index = key % self.__buckets
+        entry = TTEntry(key, depth, score, bound, move, self.__generation)
+        self.stores += 1
+        current = self.__depth_slots[index]
+        if current is None or current.key == key or depth >= current.depth or current.generation != self.__generation:
+            if current is not None and current.key != key:
+                self.overwrites += 1
+                # the displaced result is still worth keeping until something newer needs the slot
+                self.__recent_slots[index] = current
+            self.__depth_slots[index] = entry
+        else:
+            recent = self.__recent_slots[index]
+            if recent is not None and recent.key != key:
+                self.overwrites += 1
+            self.__recent_slots[index] = entry
+
+    def clear(self):
+        self.__depth_slots = [None] * self.__buckets
+        self.__recent_slots = [None] * self.__buckets
+        self.__generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the counters as a dict, for logging or for picking a size: a low hit rate with many overwrites
+        means the table is too small for the searches it is used with.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate, 'stores': self.stores,
+                'overwrites': self.overwrites, 'filled': len(self), 'capacity': self.capacity}
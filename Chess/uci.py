@@ -0,0 +1,255 @@
+import argparse
+import re
+import sys
+import threading
+from chess_model import AIMode, ChessModel
+from bitboard_model import BACKENDS
+from book import OpeningBook
+from fen import FENError, STARTING_FEN
+from move import PROMOTION_LETTERS, Move
+from player import Player
+from search import MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH, SearchEngine, SearchResult
+from transposition import TranspositionTable
+from typing import Dict, Iterable, List, Optional, TextIO
+
+ENGINE_NAME = 'Laker Chess'
+ENGINE_AUTHOR = 'Rogelio Vazquez'
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+# with only the clock to go on, plan for this many more moves
+MOVES_TO_GO = 30
+# seconds kept back from every move for the time it takes to read and answer commands
+MOVE_OVERHEAD = 0.05
+
+_MOVE = re.compile(r'([a-h])([1-8])([a-h])([1-8])([nbrq])?')
+_PROMOTIONS = {letter: kind for kind, letter in PROMOTION_LETTERS.items()}
+
+
+class UCIError(ValueError):
+    pass
+
+
+def uci_to_move(model: ChessModel, text: str) -> Move:
+    """
+    Reads a move in UCI notation ('e2e4', 'e7e8q') and checks it is legal in model's current position.
+    :raises UCIError: if text is not a UCI move or not legal.
+    """
+    match = _MOVE.fullmatch(text)
+    if match is None:
+        raise UCIError(f'{text}: not a UCI move')
+    from_file, from_rank, to_file, to_rank, promotion = match.groups()
+    move = Move(8 - int(from_rank), 'abcdefgh'.index(from_file), 8 - int(to_rank), 'abcdefgh'.index(to_file),
+                _PROMOTIONS[promotion] if promotion is not None else None)
+    if not model.is_valid_move(move):
+        raise UCIError(f'{text}: illegal move')
+    return move
+
+
+def format_score(score: int) -> str:
+    """
+    Writes a search score the UCI way: 'cp <centipawns>', or 'mate <moves>' (negative when getting mated).
+    """
+    if score > MATE_THRESHOLD:
+        return f'mate {(MATE_SCORE - score + 1) // 2}'
+    if score < -MATE_THRESHOLD:
+        return f'mate {-((MATE_SCORE + score + 1) // 2)}'
+    return f'cp {score}'
+
+
+def format_info(result: SearchResult) -> str:
+    return (f'info depth {result.depth} score {format_score(result.score)} nodes {result.nodes} '
+            f'nps {result.nps:.0f} time {result.seconds * 1000:.0f} pv {result.move.uci()}')
+
+
+def parse_go(words: List[str]) -> Dict[str, int]:
+    """
+    Reads the limits of a 'go' command into a dict of name to int. 'infinite' (and 'ponder') are given as 1.
+    """
+    limits = {}
+    words = iter(words)
+    for word in words:
+        if word in ('infinite', 'ponder'):
+            limits[word] = 1
+        elif word in ('depth', 'nodes', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'mate'):
+            value = next(words, None)
+            if value is None or not value.lstrip('-').isdigit():
+                raise UCIError(f'go {word}: expected a number')
+            limits[word] = int(value)
+    return limits
+
+
+def allot_time(limits: Dict[str, int], white: bool) -> Optional[float]:
+    """
+    Seconds to spend on this move: movetime when given, otherwise a share of the clock.
+    :return: float, or None if the limits say nothing about time.
+    """
+    if 'movetime' in limits:
+        return max(limits['movetime'] / 1000 - MOVE_OVERHEAD, 0.001)
+    remaining = limits.get('wtime' if white else 'btime')
+    if remaining is None:
+        return None
+    increment = limits.get('winc' if white else 'binc', 0)
+    share = remaining / limits.get('movestogo', MOVES_TO_GO) + increment * 0.8
+    # never bet more than half the clock on one move
+    return max(min(share, remaining / 2) / 1000 - MOVE_OVERHEAD, 0.001)
+
+
+class UCIEngine:
+    """
+    The Universal Chess Interface over a ChessModel: reads commands a line at a time and writes the answers to
+    output. go searches on a thread, so stop and isready are answered while it runs.
+    """
+
+    def __init__(self, model_class=ChessModel, output: TextIO = sys.stdout, book: Optional[str] = None):
+        self.model_class = model_class
+        self.output = output
+        self.book = OpeningBook(book) if book is not None else None
+        self.hash_mb = DEFAULT_HASH_MB
+        self.engine = SearchEngine(table=TranspositionTable(self.hash_mb))
+        self.model = model_class()
+        self.__lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__infinite = False
+        # set by stop; an infinite search holds its bestmove back until then
+        self.__stopped = threading.Event()
+
+    def send(self, line: str):
+        with self.__lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def run(self, lines: Iterable[str]):
+        """
+        Answers commands until quit or the end of the input.
+        """
+        for line in lines:
+            if not self.handle(line):
+                self.stop()
+                break
+        else:
+            # at the end of piped input a search with limits is left to finish
+            if self.__infinite:
+                self.stop()
+            self.wait()
+        if self.book is not None:
+            self.book.close()
+
+    def handle(self, line: str) -> bool:
+        """
+        Answers one command. Unknown commands are ignored, as the protocol asks.
+        :return: bool False once the command was quit.
+        """
+        words = line.split()
+        if not words:
+            return True
+        command, arguments = words[0], words[1:]
+        try:
+            if command == 'uci':
+                self.send(f'id name {ENGINE_NAME}')
+                self.send(f'id author {ENGINE_AUTHOR}')
+                self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}')
+                self.send('uciok')
+            elif command == 'isready':
+                self.send('readyok')
+            elif command == 'setoption':
+                self.stop()
+                self.__set_option(arguments)
+            elif command == 'ucinewgame':
+                self.stop()
+                self.engine.table.clear()
+            elif command == 'position':
+                self.stop()
+                self.__set_position(arguments)
+            elif command == 'go':
+                self.stop()
+                self.__go(parse_go(arguments))
+            elif command == 'stop':
+                self.stop()
+            elif command == 'quit':
+                return False
+        except (UCIError, FENError) as e:
+            self.send(f'info string {e}')
+        return True
+
+    def stop(self):
+        """
+        Ends a running search, which still answers with its bestmove, and waits for it.
+        """
+        self.__stopped.set()
+        self.engine.stop()
+        self.wait()
+
+    def wait(self, timeout: Optional[float] = None):
+        thread = self.__thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def __set_option(self, words: List[str]):
+        text = ' '.join(words)
+        match = re.fullmatch(r'name\s+(.+?)(?:\s+value\s+(.*))?', text)
+        if match is None:
+            raise UCIError(f'setoption {text}: expected name and value')
+        name, value = match.groups()
+        if name.lower() == 'hash':
+            if value is None or not value.isdigit():
+                raise UCIError('setoption Hash: expected a number')
+            self.hash_mb = min(max(int(value), 1), MAX_HASH_MB)
+            self.engine.table = TranspositionTable(self.hash_mb)
+
+    def __set_position(self, words: List[str]):
+        if 'moves' in words:
+            index = words.index('moves')
+            setup, moves = words[:index], words[index + 1:]
+        else:
+            setup, moves = words, []
+        if setup[:1] == ['startpos']:
+            fen = STARTING_FEN
+        elif setup[:1] == ['fen']:
+            fen = ' '.join(setup[1:])
+        else:
+            raise UCIError('position: expected startpos or fen')
+        # the position is only taken once all of it has been read, so a bad command leaves the old one in place
+        model = self.model_class.from_fen(fen)
+        for text in moves:
+            model.move(uci_to_move(model, text))
+        self.model = model
+
+    def __go(self, limits: Dict[str, int]):
+        model = self.model
+        model.engine = self.engine
+        model.book = self.book
+        # a bare go, like go infinite, runs until stopped
+        self.__infinite = infinite = 'infinite' in limits or 'ponder' in limits or not limits
+        depth = limits.get('depth')
+        if 'mate' in limits:
+            # the mating move is N * 2 - 1 plies away, but only seen to be mate one ply later, as the quiescence
+            # search at the leaves does not look for checkmate
+            depth = limits['mate'] * 2
+        movetime = allot_time(limits, model.current_player == Player.WHITE)
+        if depth is None and movetime is None and 'nodes' not in limits:
+            depth = MAX_DEPTH
+        self.__stopped.clear()
+        self.engine.clear_stop()
+
+        def search():
+            move = model.choose_move(AIMode.Search, depth, movetime, limits.get('nodes'),
+                                     lambda result: self.send(format_info(result)))
+            if infinite:
+                self.__stopped.wait()
+            self.send(f'bestmove {move.uci() if move is not None else "0000"}')
+
+        self.__thread = threading.Thread(target=search, daemon=True)
+        self.__thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play through the Universal Chess Interface on standard input and '
+                                                 'output')
+    parser.add_argument('--backend', choices=BACKENDS, default='list', help='board representation to use')
+    parser.add_argument('--book', help='opening book file (see book.py) to play from')
+    args = parser.parse_args()
+    UCIEngine(BACKENDS[args.backend], sys.stdout, args.book).run(sys.stdin)
+
+
+if __name__ == '__main__':
+    main()
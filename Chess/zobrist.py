@@ -0,0 +1,55 @@
+import random
+from chess_piece import ChessPiece, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, BLACK_CODE
+from player import Player
+from typing import List, Optional
+
+# A fixed seed keeps hashes identical between runs and between worker processes, so they can be stored and shared.
+_random = random.Random(0x5A0B1257)
+
+# One random 64-bit key per (piece code, square), squares numbered row * 8 + col. Codes no piece has are None.
+PIECE_KEYS: List[Optional[List[int]]] = [None] * (KING + BLACK_CODE + 1)
+for _kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+    for _colour in (0, BLACK_CODE):
+        PIECE_KEYS[_kind + _colour] = [_random.getrandbits(64) for _ in range(64)]
+# Mixed in whenever black is to move
+BLACK_TO_MOVE = _random.getrandbits(64)
+# One key per castling right (bits as in chess_model), combined for each of the 16 sets of rights. No rights hashes
+# to 0.
+_CASTLING_RIGHT_KEYS = [_random.getrandbits(64) for _ in range(4)]
+CASTLING_KEYS = [0] * 16
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights >> _bit & 1:
+            CASTLING_KEYS[_rights] ^= _CASTLING_RIGHT_KEYS[_bit]
+# One key per file of the en passant square
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+
+
+def piece_key(piece: ChessPiece, row: int, col: int) -> int:
+    """
+    Returns the key for piece standing on (row, col). XOR it into a hash to add the piece and again to remove it.
+    """
+    return PIECE_KEYS[piece.code][row * 8 + col]
+
+
+def hash_board(board: List[List[ChessPiece]], player: Player, castling: int = 0,
+               en_passant: Optional[int] = None) -> int:
+    """
+    Computes the Zobrist hash of a whole position from scratch. Models keep their hash up to date incrementally;
+    this is for setting it up and for checking it.
+    :param board: the 8x8 nested list of pieces.
+    :param player: Player the side to move.
+    :param castling: int castling rights bitmask.
+    :param en_passant: int square (row * 8 + col) a pawn can be taken en passant on, or None.
+    :return: int a 64-bit hash.
+    """
+    h = BLACK_TO_MOVE if player == Player.BLACK else 0
+    h ^= CASTLING_KEYS[castling]
+    if en_passant is not None:
+        h ^= EN_PASSANT_KEYS[en_passant % 8]
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece is not None:
+                h ^= piece_key(piece, row, col)
+    return h